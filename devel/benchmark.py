@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# This module measures the performance of a scan of the whole manifest,
+# without touching the network.  Every site is emulated by a local server
+# (from the test suite), which answers each probe the way the site would,
+# going by its entry in the manifest, after a latency drawn from a seeded
+# random generator, so that runs can be repeated exactly and compared.
+#
+#   python devel/benchmark.py --usernames 20 --latency 0.05 --jitter 0.02 --json bench.json
+#   python devel/benchmark.py --usernames 20 --latency 0.05 --jitter 0.02 --compare bench.json
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+
+from sherlock_project.latency import percentile  # noqa: E402
+from sherlock_project.notify import QueryNotify  # noqa: E402
+from sherlock_project.sherlock import positive_int_check, sherlock_batch  # noqa: E402
+from sherlock_project.sites import SitesInformation  # noqa: E402
+from sherlock_project.timing import PHASES  # noqa: E402
+
+# Version of the layout of the JSON report.
+REPORT_VERSION = 1
+
+# Measures compared by --compare, and whether more of them is better.
+COMPARED = {
+    "probes_per_second": True,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "cpu_ms_per_probe": False,
+    "peak_rss_mib": False,
+}
+
+
+def run_emulator(site_data, profile, urls, stop):
+    from sherlock_site_emulator import SiteEmulator
+
+    emulator = SiteEmulator(site_data, **profile).start()
+    urls.put(emulator.base_url)
+    stop.wait()
+    emulator.stop()
+
+
+def percentiles(samples, *percents):
+    """Nearest-rank percentiles of the samples, or None for each if there are none"""
+    return [percentile(samples, percent) if samples else None for percent in percents]
+
+
+def peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kibibytes, macOS bytes.
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def measure(emulator, usernames, site_data, args):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_started = usage.ru_utime + usage.ru_stime
+    started = time.perf_counter()
+
+    latencies = []
+    phases = {phase: [] for phase in PHASES}
+    statuses = Counter()
+    mismatches = Counter()
+    for username, results in sherlock_batch(
+        usernames,
+        site_data,
+        QueryNotify(),
+        timeout=args.timeout,
+        engine=args.engine,
+        max_in_flight=args.max_in_flight,
+        max_per_host=args.max_per_host,
+    ):
+        for site_name, results_site in results.items():
+            result = results_site["status"]
+            statuses[str(result.status)] += 1
+            if result.query_time is not None:
+                latencies.append(result.query_time)
+            for phase, seconds in (result.timings or {}).items():
+                if seconds is not None:
+                    phases[phase].append(seconds)
+            if result.status is not emulator.expected(site_name, username):
+                mismatches[site_name] += 1
+
+    seconds = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = usage.ru_utime + usage.ru_stime - cpu_started
+    probes = sum(statuses.values()) - statuses["Illegal"]
+    p50, p95, p99 = percentiles(latencies, 50, 95, 99)
+    return {
+        "probes": probes,
+        "seconds": seconds,
+        "probes_per_second": probes / seconds,
+        "latency_p50": p50,
+        "latency_p95": p95,
+        "latency_p99": p99,
+        "cpu_seconds": cpu,
+        "cpu_ms_per_probe": 1000 * cpu / max(probes, 1),
+        # Where the time of the probes went, as query_time counts the wait
+        # for a worker too.
+        "phases": {
+            phase: dict(zip(("p50", "p95"), percentiles(samples, 50, 95)))
+            for phase, samples in phases.items()
+        },
+        "statuses": dict(statuses),
+        "mismatches": dict(mismatches),
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, summary):
+    print(f"\n{'measure':<18}  {'before':>10}  {'after':>10}  {'change':>8}")
+    for measure, higher_is_better in COMPARED.items():
+        before = previous["summary"].get(measure)
+        after = summary.get(measure)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        flag = "  worse" if worse and abs(change) >= 5 else ""
+        print(f"{measure:<18}  {before:>10.4g}  {after:>10.4g}  {change:>+7.1f}%{flag}")
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark a scan of the whole manifest against emulated sites.")
+    parser.add_argument("--json-manifest", dest="manifest", default=None,
+                        help="Manifest to emulate (Default: the one shipped with Sherlock).")
+    parser.add_argument("--sites", type=int, default=None, help="Only emulate the first SITES sites.")
+    parser.add_argument("--usernames", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Typical response time of a site, in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.02,
+                        help="Most that a response time strays from that of its site, in seconds.")
+    parser.add_argument("--body-size", type=int, default=16 * 1024, help="Typical size of a page.")
+    parser.add_argument("--error-rate", type=float, default=0.01,
+                        help="Share of probes whose connection is dropped.")
+    parser.add_argument("--waf-rate", type=float, default=0.01,
+                        help="Share of probes answered by a WAF.")
+    parser.add_argument("--claimed-rate", type=float, default=0.2,
+                        help="Share of usernames which exist on a site.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--max-per-host", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--repeat", type=positive_int_check, default=3, help="Number of measured runs.")
+    parser.add_argument("--json", dest="json_file", help="Write the results to this file.")
+    parser.add_argument("--compare", metavar="JSON_FILE", help="Compare with results written earlier.")
+    args = parser.parse_args()
+
+    sites = SitesInformation(
+        args.manifest or os.path.join(os.path.dirname(__file__), "..", "sherlock_project", "resources", "data.json"),
+        honor_exclusions=False,
+    )
+    site_data = {site.name: dict(site.information) for site in sites}
+    if args.sites is not None:
+        site_data = dict(list(site_data.items())[:args.sites])
+    profile = {
+        "latency": args.latency, "jitter": args.jitter, "body_size": args.body_size,
+        "error_rate": args.error_rate, "waf_rate": args.waf_rate,
+        "claimed_rate": args.claimed_rate, "seed": args.seed,
+    }
+    usernames = [f"benchuser{index}" for index in range(args.usernames)]
+
+    # The emulator runs in a process of its own, so that its work is not
+    # counted against the scan.
+    from sherlock_site_emulator import SiteEmulator
+
+    context = multiprocessing.get_context("spawn")
+    urls = context.Queue()
+    stop = context.Event()
+    server = context.Process(target=run_emulator, args=(site_data, profile, urls, stop), daemon=True)
+    server.start()
+    emulator = SiteEmulator(site_data, **profile)
+    emulator.base_url = urls.get(timeout=60)
+    emulated = emulator.manifest()
+
+    runs = []
+    try:
+        # Warm up the emulator and the connection pools.
+        measure(emulator, usernames[:1], emulated, args)
+        print(f"{len(site_data)} sites, {len(usernames)} usernames, engine {args.engine}")
+        print(f"{'run':>3}  {'seconds':>8}  {'probes/s':>9}  {'p50':>7}  {'p95':>7}  {'p99':>7}  "
+              f"{'cpu ms/probe':>12}  {'wrong':>5}")
+        for run in range(args.repeat):
+            result = measure(emulator, usernames, emulated, args)
+            runs.append(result)
+            print(f"{run + 1:>3}  {result['seconds']:>8.2f}  {result['probes_per_second']:>9.1f}  "
+                  f"{result['latency_p50']:>7.3f}  {result['latency_p95']:>7.3f}  {result['latency_p99']:>7.3f}  "
+                  f"{result['cpu_ms_per_probe']:>12.2f}  "
+                  f"{sum(result['mismatches'].values()):>5}")
+    finally:
+        stop.set()
+        server.join()
+
+    print(f"\n{'phase':<10}  {'p50':>7}  {'p95':>7}  (last run)")
+    for phase, measures in runs[-1]["phases"].items():
+        if measures["p50"] is not None:
+            print(f"{phase:<10}  {measures['p50']:>7.4f}  {measures['p95']:>7.4f}")
+
+    # The median run of each measure, so that one unlucky run does not skew it.
+    summary = {
+        measure: sorted(run[measure] for run in runs)[len(runs) // 2]
+        for measure in ["seconds", "probes_per_second", "latency_p50", "latency_p95", "latency_p99",
+                        "cpu_ms_per_probe"]
+    }
+    # The peak of the whole process, over the warm up and every run.
+    summary["peak_rss_mib"] = peak_rss_mib()
+    print(f"\nPeak RSS:  {summary['peak_rss_mib']:.1f} MiB")
+    report = {
+        "version": REPORT_VERSION,
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sites": len(site_data),
+        "arguments": vars(args),
+        "runs": runs,
+        "summary": summary,
+    }
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(json.load(file), summary)
+    if args.json_file:
+        with open(args.json_file, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
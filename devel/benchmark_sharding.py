@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# This module measures how the throughput of a scan scales with the number of
+# processes it is split between.  The targets are stub servers on this
+# machine (from the test suite), which serve pages that have to be read and
+# searched up to their size limit, so that the scan is bound by the CPU
+# rather than by the network.
+#
+#   python devel/benchmark_sharding.py --sites 400 --usernames 4 --processes 1 2 4 8
+import json
+import multiprocessing
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+
+from sherlock_project.notify import QueryNotify  # noqa: E402
+from sherlock_project.sharding import sherlock_sharded  # noqa: E402
+from sherlock_project.sherlock import sherlock_batch  # noqa: E402
+
+
+def run_stub(urls, stop):
+    from sherlock_stub_server import StubServer
+
+    server = StubServer().start()
+    urls.put(server.base_url)
+    stop.wait()
+    server.stop()
+
+
+def manifest(base_urls, sites, body_size):
+    """Site data spread over the stub servers, whose pages are read up to body_size"""
+    return {
+        f"Bench{index}": {
+            "url": f"{base_urls[index % len(base_urls)]}/heavy/{{}}",
+            "urlMain": base_urls[index % len(base_urls)],
+            "errorType": "message",
+            "errorMsg": "User Not Found",
+            "maxBodySize": body_size,
+            "username_claimed": "claimed",
+        }
+        for index in range(sites)
+    }
+
+
+def measure(usernames, site_data, processes, shard_by, max_in_flight):
+    started = time.perf_counter()
+    if processes == 1:
+        batch = sherlock_batch(usernames, site_data, QueryNotify(), max_in_flight=max_in_flight)
+    else:
+        batch = sherlock_sharded(usernames, site_data, QueryNotify(), processes=processes,
+                                 shard_by=shard_by, max_in_flight=max_in_flight)
+    probes = sum(len(results) for _, results in batch)
+    return probes, time.perf_counter() - started
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = ArgumentParser(description="Measure the scaling of sharded scans with the number of processes.")
+    parser.add_argument("--sites", type=int, default=400)
+    parser.add_argument("--usernames", type=int, default=4)
+    parser.add_argument("--body-size", type=int, default=256 * 1024,
+                        help="Bytes of each page which are read and searched.")
+    parser.add_argument("--stubs", type=int, default=max(1, cpus // 2),
+                        help="Number of stub server processes.")
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=sorted({1, 2, 4, 8, 16, 32, cpus} & set(range(1, cpus + 1))))
+    parser.add_argument("--shard-by", choices=["site", "username"], default="site")
+    parser.add_argument("--max-in-flight", type=int, default=20)
+    parser.add_argument("--json", dest="json_file", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    urls = context.Queue()
+    stop = context.Event()
+    stubs = [context.Process(target=run_stub, args=(urls, stop), daemon=True) for _ in range(args.stubs)]
+    for stub in stubs:
+        stub.start()
+    base_urls = [urls.get(timeout=30) for _ in stubs]
+
+    site_data = manifest(base_urls, args.sites, args.body_size)
+    usernames = [f"claimed{chr(ord('a') + index % 26)}{index}" for index in range(args.usernames)]
+
+    rows = []
+    try:
+        # Warm up the stubs, so that the first measurement is not penalised.
+        measure(usernames[:1], site_data, 1, args.shard_by, args.max_in_flight)
+        print(f"{'processes':>9}  {'seconds':>8}  {'probes/s':>9}  {'MiB/s':>7}  {'speedup':>7}")
+        for processes in args.processes:
+            probes, seconds = measure(usernames, site_data, processes, args.shard_by, args.max_in_flight)
+            rate = probes / seconds
+            speedup = rate / rows[0]["probes_per_second"] if rows else 1.0
+            rows.append({"processes": processes, "probes": probes, "seconds": seconds,
+                         "probes_per_second": rate, "speedup": speedup})
+            print(f"{processes:>9}  {seconds:>8.2f}  {rate:>9.1f}  "
+                  f"{rate * args.body_size / 2 ** 20:>7.1f}  {speedup:>7.2f}")
+    finally:
+        stop.set()
+        for stub in stubs:
+            stub.join()
+
+    if args.json_file:
+        with open(args.json_file, "w", encoding="utf-8") as file:
+            json.dump({"cpus": cpus, "arguments": vars(args), "results": rows}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
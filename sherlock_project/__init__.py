@@ -5,16 +5,17 @@ networks.
 
 """
 
-from importlib.metadata import version as pkg_version, PackageNotFoundError
-import pathlib
-import tomli
-
-
 def get_version() -> str:
     """Fetch the version number of the installed package."""
+    # Imported here, as they are slow to import and only needed for this.
+    from importlib.metadata import version as pkg_version, PackageNotFoundError
+    import pathlib
+
     try:
         return pkg_version("sherlock_project")
     except PackageNotFoundError:
+        import tomli
+
         pyproject_path: pathlib.Path = pathlib.Path(__file__).resolve().parent.parent / "pyproject.toml"
         with pyproject_path.open("rb") as f:
             pyproject_data = tomli.load(f)
@@ -25,6 +26,15 @@ import_error_test_var = None
 
 __shortname__   = "Sherlock"
 __longname__    = "Sherlock: Find Usernames Across Social Networks"
-__version__     = get_version()
+
+
+def __getattr__(name: str):
+    """Work out __version__ on first use, rather than on every import."""
+    if name == "__version__":
+        global __version__
+        __version__ = get_version()
+        return __version__
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 forge_api_latest_release = "https://api.github.com/repos/sherlock-project/sherlock/releases/latest"
@@ -0,0 +1,693 @@
+"""Sherlock Asyncio Engine Module
+
+This module contains an alternative probe engine which keeps every request
+in flight on a single asyncio event loop rather than in a thread pool.
+
+The aiohttp package is an optional dependency of Sherlock, and is only
+needed when this engine is selected.
+"""
+
+import asyncio
+from collections import deque
+from contextlib import nullcontext
+from time import monotonic, thread_time
+from typing import AsyncIterator, Optional
+
+try:
+    import aiohttp
+except ImportError:
+    raise ImportError(
+        "The asyncio engine requires aiohttp. "
+        "Install it with `pip install 'sherlock-project[async]'`."
+    )
+
+from sherlock_project.result import QueryStatus
+from sherlock_project.result import QueryResult
+from sherlock_project.result import BodyRetention
+from sherlock_project.cache import ResultCache
+from sherlock_project.latency import LatencyStats
+from sherlock_project.metrics import ScanMetrics
+from sherlock_project.notify import QueryNotify
+from sherlock_project.sherlock import prepare_request
+from sherlock_project.sherlock import detect_status
+from sherlock_project.sherlock import dump_response_text
+from sherlock_project.sherlock import DEFAULT_MAX_CONNECTIONS
+from sherlock_project.sherlock import BODY_CHUNK_SIZE
+from sherlock_project.sherlock import body_retention
+from sherlock_project.sherlock import deadline_exceeded
+from sherlock_project.scheduler import host_of
+from sherlock_project.timing import ProbeTimer
+from sherlock_project.checks import compile_site_data
+
+
+class ProbeLimiter:
+    def __init__(self, max_in_flight=None, max_per_host=None):
+        """Create Probe Limiter Object.
+
+        Counterpart of ProbeScheduler() for the event loop.  Probes wait
+        for a slot of their host first, and only then for a global slot,
+        so that a busy host never holds up probes to other hosts.
+
+        Keyword Arguments:
+        self                   -- This object.
+        max_in_flight          -- Maximum number of requests in flight across
+                                  all sites.  None for DEFAULT_MAX_CONNECTIONS.
+        max_per_host           -- Maximum number of requests in flight to any
+                                  single host.  None for no limit.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.max_in_flight = max_in_flight or DEFAULT_MAX_CONNECTIONS
+        self.max_per_host = max_per_host
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.hosts = {}
+
+        return
+
+    def host(self, url):
+        """Return the asynchronous context manager limiting the host of url."""
+        if self.max_per_host is None:
+            return nullcontext()
+
+        host = host_of(url)
+        if host not in self.hosts:
+            self.hosts[host] = asyncio.Semaphore(self.max_per_host)
+
+        return self.hosts[host]
+
+    async def fetch(self, session, request, proxy, timeout, keep_body=True, timer=None):
+        """Fetch a response once the limits allow it, see fetch()."""
+        async with self.host(request["url_probe"]):
+            async with self.in_flight:
+                return await fetch(session, request, proxy, timeout, keep_body, timer)
+
+
+def timing_trace_config():
+    """Timing Trace Config.
+
+    Creates the aiohttp.TraceConfig() which times connecting for the
+    ProbeTimer() passed to each request as its trace_request_ctx.  The
+    TLS handshake is part of connecting here, as aiohttp does not trace
+    it on its own.
+
+    Return Value:
+    aiohttp.TraceConfig() object.
+    """
+
+    async def connection_create_start(session, context, params):
+        context.connecting = monotonic()
+
+    async def connection_create_end(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx.add("connect", monotonic() - context.connecting)
+
+    async def connection_reuseconn(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx.add("connect", 0.0)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(connection_create_start)
+    trace_config.on_connection_create_end.append(connection_create_end)
+    trace_config.on_connection_reuseconn.append(connection_reuseconn)
+
+    return trace_config
+
+
+async def fetch(session, request, proxy, timeout, keep_body=True, timer=None):
+    """Fetch Response.
+
+    Performs a single probe and reads the response body, searching it as
+    it arrives and stopping early as body_reader() does.  This is the
+    asyncio counterpart to get_response(), and maps aiohttp failures to
+    the same error contexts.
+
+    Keyword Arguments:
+    session                -- aiohttp.ClientSession() to send the request with.
+    request                -- Dictionary as returned by prepare_request().
+    proxy                  -- String indicating the proxy URL, or None.
+    timeout                -- Time in seconds to wait before timing out request.
+    keep_body              -- Boolean indicating if the body should be kept,
+                              rather than only searched.  Default is True.
+    timer                  -- ProbeTimer() to fill in, or None.  The session
+                              must have been created with the trace config
+                              of timing_trace_config() for connecting to be
+                              timed.
+
+    Return Value:
+    Tuple of the response status code, body bytes (empty if not kept), declared charset,
+    BodyScanner() fed with the body, response time, error context and
+    exception text.  The first five are None if the request failed.
+    """
+
+    error_context = None
+    exception_text = None
+    status_code = None
+    body = None
+    encoding = None
+    scanner = None
+    response_time = None
+
+    start = monotonic()
+    if timer is not None:
+        timer.start()
+    try:
+        async with session.request(
+            request["method"],
+            request["url_probe"],
+            headers=request["headers"],
+            proxy=proxy,
+            allow_redirects=request["allow_redirects"],
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            json=request["payload"],
+            trace_request_ctx=timer,
+        ) as response:
+            response_time = monotonic() - start
+            if timer is not None:
+                timer.responded()
+            reading = monotonic()
+            searching = 0.0
+            searching_cpu = 0.0
+            status_code = response.status
+            # The body is matched as bytes, so it is never decoded here.
+            encoding = response.charset
+            scanner = request["matcher"].scanner(encoding)
+            max_body_size = request["max_body_size"]
+            chunks = []
+            async for chunk in response.content.iter_chunked(BODY_CHUNK_SIZE):
+                chunk = chunk[:max_body_size - scanner.size]
+                if keep_body:
+                    chunks.append(chunk)
+                search_started = monotonic()
+                search_started_cpu = thread_time()
+                scanner.feed(chunk)
+                searching_cpu += thread_time() - search_started_cpu
+                searching += monotonic() - search_started
+                if scanner.final or scanner.size >= max_body_size:
+                    # Drop the connection rather than draining the rest.
+                    response.close()
+                    break
+            body = b"".join(chunks)
+            if timer is not None:
+                timer.add("body", monotonic() - reading - searching)
+                timer.add("detect", searching_cpu)
+    except aiohttp.ClientResponseError as errh:
+        error_context = "HTTP Error"
+        exception_text = str(errh)
+    except aiohttp.ClientProxyConnectionError as errp:
+        error_context = "Proxy Error"
+        exception_text = str(errp)
+    except (aiohttp.ClientConnectionError, aiohttp.InvalidURL) as errc:
+        error_context = "Error Connecting"
+        exception_text = str(errc)
+    except asyncio.TimeoutError as errt:
+        error_context = "Timeout Error"
+        exception_text = str(errt)
+    except aiohttp.ClientError as err:
+        error_context = "Unknown Error"
+        exception_text = str(err)
+    except UnicodeError as err:
+        error_context = "Encoding Error"
+        exception_text = str(err)
+
+    if error_context is not None:
+        status_code = body = encoding = scanner = response_time = None
+
+    return status_code, body, encoding, scanner, response_time, error_context, exception_text
+
+
+def decode_body(body, encoding):
+    """Decode a body returned by fetch() to text, or None if there is none."""
+    if body is None:
+        return None
+    try:
+        return body.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def schedule_probes(
+    session,
+    limiter,
+    username,
+    site_data,
+    proxy=None,
+    timeout=60,
+    keep_body=True,
+    cached=None,
+    latency=None,
+    expires=None,
+    metrics=None,
+):
+    """Schedule Probes.
+
+    Starts the requests for one username on all sites as tasks on the
+    running event loop, within the limits of the ProbeLimiter().  This is
+    the counterpart of submit_probes().
+
+    Return Value:
+    Tuple of the partially filled results (see sherlock()) and a dictionary
+    of tasks keyed by site.  Sites for which the username is not allowed,
+    which have a cached result or which are past the deadline already
+    carry their final status, and have no task.  Each task has the
+    ProbeTimer() of its probe as its timer attribute.
+    """
+
+    # Results from analysis of all sites
+    results_total = {}
+
+    # Pending probes, keyed by site.
+    tasks = {}
+
+    for social_network, net_info in site_data.items():
+        # Results from analysis of this specific site
+        results_site = {"url_main": net_info.get("urlMain")}
+
+        request = prepare_request(username, net_info)
+        url = request["url_user"]
+
+        if request["illegal"]:
+            # No need to do the check at the site: this username is not allowed.
+            results_site["status"] = QueryResult(
+                username, social_network, url, QueryStatus.ILLEGAL
+            )
+            results_site["url_user"] = ""
+            results_site["http_status"] = ""
+            results_site["response_text"] = ""
+        elif cached and social_network in cached:
+            results_site["status"] = cached[social_network]
+            results_site["url_user"] = url
+            results_site["http_status"] = cached[social_network].http_status
+            results_site["response_text"] = None
+        elif expires is not None and expires <= monotonic():
+            results_site["status"] = deadline_exceeded(username, social_network, url)
+            results_site["url_user"] = url
+            results_site["http_status"] = "?"
+            results_site["response_text"] = None
+        else:
+            results_site["url_user"] = url
+            site_timeout = timeout
+            if latency is not None:
+                site_timeout = latency.timeout(social_network, timeout)
+            # Timeout which the probe is recorded with if it times out, unless
+            # it was cut short by the deadline.
+            recorded_timeout = site_timeout
+            if expires is not None and expires - monotonic() < site_timeout:
+                site_timeout = expires - monotonic()
+                recorded_timeout = None
+            timer = ProbeTimer()
+            tasks[social_network] = asyncio.ensure_future(
+                limiter.fetch(session, request, proxy, site_timeout, keep_body, timer)
+            )
+            tasks[social_network].timer = timer
+            tasks[social_network].recorded_timeout = recorded_timeout
+            if metrics is not None:
+                metrics.track(tasks[social_network])
+
+        results_total[social_network] = results_site
+
+    return results_total, tasks
+
+
+async def iter_results(
+    username,
+    site_data,
+    results_total,
+    tasks,
+    dump_response=False,
+    retention=None,
+    cache=None,
+    latency=None,
+    expires=None,
+    metrics=None,
+):
+    """Iterate Results.
+
+    Waits for the probes started by schedule_probes(), and works out the
+    status on each site in the order that the responses arrive.  This is
+    the counterpart of sherlock.iter_results().
+
+    Return Value:
+    Asynchronous generator of QueryResult() objects.  The results_total
+    dictionary is completed as the results are produced.
+    """
+
+    for social_network, results_site in results_total.items():
+        if social_network not in tasks:
+            # We have already determined the status on this site
+            if metrics is not None:
+                metrics.observe(results_site["status"])
+            yield results_site["status"]
+
+    sites = {task: social_network for social_network, task in tasks.items()}
+    pending = set(sites)
+
+    while pending:
+        done, pending = await asyncio.wait(
+            pending,
+            timeout=None if expires is None else max(expires - monotonic(), 0),
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if not done:
+            # Out of time:  the probes which are still running are given up on,
+            # and their connections closed before moving on.
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in pending:
+                social_network = sites[task]
+                results_site = results_total[social_network]
+                result = deadline_exceeded(username, social_network, results_site["url_user"])
+                if getattr(task, "timer", None) is not None:
+                    result.timings = task.timer.timings()
+                results_site["status"] = result
+                results_site["http_status"] = "?"
+                results_site["response_text"] = None
+                if metrics is not None:
+                    metrics.observe(result)
+                yield result
+            break
+
+        for task in done:
+            social_network = sites[task]
+            net_info = site_data[social_network]
+            results_site = results_total[social_network]
+            url = results_site["url_user"]
+
+            (
+                status_code,
+                body,
+                encoding,
+                scanner,
+                response_time,
+                error_text,
+                exception_text,
+            ) = task.result()
+            timer = getattr(task, "timer", None)
+
+            if error_text is not None:
+                query_status = QueryStatus.UNKNOWN
+                error_context = error_text
+                recorded_timeout = getattr(task, "recorded_timeout", None)
+                if latency is not None and error_text == "Timeout Error" and recorded_timeout is not None:
+                    latency.record_timeout(social_network, recorded_timeout)
+            else:
+                detect_started = thread_time()
+                query_status, error_context = detect_status(
+                    social_network, net_info, status_code, scanner
+                )
+                if timer is not None:
+                    timer.add("detect", thread_time() - detect_started)
+                if latency is not None:
+                    latency.record(social_network, response_time)
+
+            if dump_response:
+                dump_response_text(
+                    social_network,
+                    net_info,
+                    username,
+                    url,
+                    status_code,
+                    decode_body(body, encoding),
+                    query_status,
+                )
+
+            http_status = "?" if status_code is None else status_code
+            result = QueryResult(
+                username=username,
+                site_name=social_network,
+                site_url_user=url,
+                status=query_status,
+                query_time=response_time,
+                context=error_context,
+                http_status=http_status,
+                timings=None if timer is None else timer.timings(),
+            )
+
+            results_site["status"] = result
+            results_site["http_status"] = http_status
+            if cache is not None:
+                cache.store(net_info, result)
+            results_site["response_text"] = None
+            if retention is not None and body is not None:
+                results_site["response_text"] = retention.keep(body)
+
+            if metrics is not None:
+                metrics.observe(result, None if scanner is None else scanner.size)
+            yield result
+
+
+def check_proxy(proxy):
+    """Raise an error for proxies which this engine cannot use."""
+    if proxy is not None and not proxy.lower().startswith("http"):
+        raise ValueError(
+            f"The asyncio engine only supports HTTP proxies, not '{proxy}'."
+        )
+
+
+async def iter_batch(
+    usernames,
+    site_data,
+    dump_response=False,
+    keep_bodies=False,
+    cache=None,
+    proxy=None,
+    timeout=60,
+    max_in_flight=None,
+    max_per_host=None,
+    window=2,
+    latency=None,
+    deadline=None,
+    metrics=None,
+):
+    """Iterate Batch.
+
+    Runs the probes for many usernames through one aiohttp.ClientSession(),
+    and therefore one connection pool.  This is the counterpart of
+    sherlock.iter_batch().
+
+    Return Value:
+    Asynchronous generator of (username, stream, results_total) tuples,
+    where stream is the asynchronous generator returned by iter_results()
+    for the username.  Each stream must be exhausted before moving on to
+    the next username.
+    """
+
+    check_proxy(proxy)
+
+    # Work out everything which does not depend on the username just once.
+    site_data = compile_site_data(site_data)
+    retention = body_retention(keep_bodies)
+    expires = None if deadline is None else monotonic() + deadline
+
+    limiter = ProbeLimiter(max_in_flight, max_per_host)
+    if metrics is not None:
+        metrics.pool_size = limiter.max_in_flight
+    connector = aiohttp.TCPConnector(limit=limiter.max_in_flight)
+    async with aiohttp.ClientSession(
+        connector=connector, trace_configs=[timing_trace_config()]
+    ) as session:
+        # Usernames whose probes have been scheduled, oldest first.
+        pending = deque()
+        usernames = iter(usernames)
+        try:
+            while True:
+                while len(pending) < max(window, 1):
+                    username = next(usernames, None)
+                    if username is None:
+                        break
+                    results_total, tasks = schedule_probes(
+                        session,
+                        limiter,
+                        username,
+                        site_data,
+                        proxy=proxy,
+                        timeout=timeout,
+                        keep_body=dump_response or retention is not None,
+                        cached=None if cache is None else cache.lookup(username, site_data),
+                        latency=latency,
+                        expires=expires,
+                        metrics=metrics,
+                    )
+                    pending.append((username, results_total, tasks))
+
+                if not pending:
+                    break
+
+                username, results_total, tasks = pending[0]
+                yield username, iter_results(
+                    username,
+                    site_data,
+                    results_total,
+                    tasks,
+                    dump_response=dump_response,
+                    retention=retention,
+                    cache=cache,
+                    latency=latency,
+                    expires=expires,
+                    metrics=metrics,
+                ), results_total
+                pending.popleft()
+                if cache is not None:
+                    cache.commit()
+                if latency is not None:
+                    latency.commit()
+        finally:
+            cancelled = [task for _, _, tasks in pending for task in tasks.values()]
+            for task in cancelled:
+                task.cancel()
+            # The probes must be done before the session is closed.
+            await asyncio.gather(*cancelled, return_exceptions=True)
+            if cache is not None:
+                cache.commit()
+            if latency is not None:
+                latency.commit()
+
+
+async def sherlock_async(
+    username: str,
+    site_data: dict[str, dict[str, str]],
+    query_notify: QueryNotify,
+    dump_response: bool = False,
+    proxy: Optional[str] = None,
+    timeout: int = 60,
+    max_in_flight: Optional[int] = None,
+    max_per_host: Optional[int] = None,
+    keep_bodies: bool | BodyRetention = False,
+    cache: Optional[ResultCache] = None,
+    latency: Optional[LatencyStats] = None,
+    deadline: Optional[float] = None,
+    metrics: Optional[ScanMetrics] = None,
+) -> dict[str, dict[str, str | QueryResult]]:
+    """Run Sherlock Analysis On The Event Loop.
+
+    Checks for existence of username on various social media sites.  The
+    arguments and results are the same as for sherlock(), which runs this
+    engine when the "asyncio" engine is selected.  Callers which already
+    run an event loop should await this coroutine directly.
+
+    SOCKS proxies are not supported by this engine.
+    """
+
+    batch = sherlock_batch_async(
+        [username],
+        site_data,
+        query_notify,
+        dump_response=dump_response,
+        proxy=proxy,
+        timeout=timeout,
+        max_in_flight=max_in_flight,
+        max_per_host=max_per_host,
+        keep_bodies=keep_bodies,
+        cache=cache,
+        latency=latency,
+        deadline=deadline,
+        metrics=metrics,
+    )
+    try:
+        _, results_total = await batch.__anext__()
+    finally:
+        await batch.aclose()
+
+    return results_total
+
+
+async def sherlock_stream_async(
+    username: str,
+    site_data: dict[str, dict[str, str]],
+    dump_response: bool = False,
+    proxy: Optional[str] = None,
+    timeout: int = 60,
+    max_in_flight: Optional[int] = None,
+    max_per_host: Optional[int] = None,
+    latency: Optional[LatencyStats] = None,
+    deadline: Optional[float] = None,
+    metrics: Optional[ScanMetrics] = None,
+) -> AsyncIterator[QueryResult]:
+    """Stream Sherlock Analysis On The Event Loop.
+
+    Asynchronous generator of QueryResult() objects in the order they
+    complete.  The arguments are the same as for sherlock_stream().
+    """
+
+    batch = iter_batch(
+        [username],
+        site_data,
+        dump_response=dump_response,
+        proxy=proxy,
+        timeout=timeout,
+        max_in_flight=max_in_flight,
+        max_per_host=max_per_host,
+        latency=latency,
+        deadline=deadline,
+        metrics=metrics,
+    )
+    # Closed explicitly, so that the session is closed even when the caller
+    # stops early:  asynchronous generators are not closed by "async for".
+    try:
+        async for _, stream, _ in batch:
+            try:
+                async for result in stream:
+                    yield result
+            finally:
+                await stream.aclose()
+    finally:
+        await batch.aclose()
+
+
+async def sherlock_batch_async(
+    usernames: list[str],
+    site_data: dict[str, dict[str, str]],
+    query_notify: QueryNotify,
+    dump_response: bool = False,
+    proxy: Optional[str] = None,
+    timeout: int = 60,
+    max_in_flight: Optional[int] = None,
+    max_per_host: Optional[int] = None,
+    window: int = 2,
+    keep_bodies: bool | BodyRetention = False,
+    cache: Optional[ResultCache] = None,
+    latency: Optional[LatencyStats] = None,
+    deadline: Optional[float] = None,
+    metrics: Optional[ScanMetrics] = None,
+) -> AsyncIterator[tuple[str, dict[str, dict[str, str | QueryResult]]]]:
+    """Run Sherlock Analysis For Many Usernames On The Event Loop.
+
+    All usernames share one aiohttp.ClientSession(), and therefore one
+    connection pool.  The arguments and results are the same as for
+    sherlock_batch(), except that this is an asynchronous generator.
+    """
+
+    batch = iter_batch(
+        usernames,
+        site_data,
+        dump_response=dump_response,
+        keep_bodies=keep_bodies,
+        cache=cache,
+        proxy=proxy,
+        timeout=timeout,
+        max_in_flight=max_in_flight,
+        max_per_host=max_per_host,
+        window=window,
+        latency=latency,
+        deadline=deadline,
+        metrics=metrics,
+    )
+    # Closed explicitly, so that the session is closed even when the caller
+    # stops early:  asynchronous generators are not closed by "async for".
+    try:
+        async for username, stream, results_total in batch:
+            # Notify caller that we are starting the query.
+            query_notify.start(username)
+
+            try:
+                async for result in stream:
+                    # Notify caller about results of query.
+                    query_notify.update(result)
+            finally:
+                await stream.aclose()
+
+            yield username, results_total
+    finally:
+        await batch.aclose()
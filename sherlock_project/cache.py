@@ -0,0 +1,195 @@
+"""Sherlock Cache Module
+
+This module keeps the results of earlier probes in a local SQLite database,
+so that usernames which are checked again within a while do not need to be
+probed again.
+"""
+import os
+import threading
+from time import time
+
+from sherlock_project.result import QueryStatus
+from sherlock_project.result import QueryResult
+
+
+# Default number of seconds for which results of each status are reused.
+# Errors and WAF blocks are usually transient, so they are only kept long
+# enough to avoid hammering a site which is failing right now.
+DEFAULT_TTLS = {
+    QueryStatus.CLAIMED: 24 * 60 * 60,
+    QueryStatus.AVAILABLE: 24 * 60 * 60,
+    QueryStatus.UNKNOWN: 5 * 60,
+    QueryStatus.WAF: 5 * 60,
+}
+
+
+def cache_dir():
+    """Cache Directory.
+
+    Return Value:
+    String containing the directory which Sherlock keeps cached data in,
+    following the XDG base directory convention.
+    """
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "sherlock")
+
+
+def default_cache_path():
+    """Default location of the result cache database."""
+    return os.path.join(cache_dir(), "results.sqlite3")
+
+
+class ResultCache:
+    def __init__(self, path=None, ttls=None):
+        """Create Result Cache Object.
+
+        Results are keyed by site, username and the digest of the site's
+        entry in the manifest, so that changing how a site is checked
+        invalidates the results which were found the old way.
+
+        Keyword Arguments:
+        self                   -- This object.
+        path                   -- String containing the path of the database
+                                  file, or None for default_cache_path().
+                                  The special path ":memory:" keeps the cache
+                                  in memory only.
+        ttls                   -- Dictionary of the number of seconds for
+                                  which results are reused, keyed by
+                                  QueryStatus().  Statuses which are not
+                                  given keep their DEFAULT_TTLS, and a time
+                                  of 0 turns caching off for that status.
+                                  Illegal usernames are never cached, as
+                                  they need no probe anyway.
+
+        Return Value:
+        Nothing.
+        """
+
+        # Imported here, so that runs without a cache do not pay for it.
+        import sqlite3
+
+        if path is None:
+            path = default_cache_path()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            if path != ":memory:":
+                self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " username TEXT NOT NULL,"
+                " site TEXT NOT NULL,"
+                " digest TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " url_user TEXT,"
+                " http_status INTEGER,"
+                " query_time REAL,"
+                " context TEXT,"
+                " expires REAL NOT NULL,"
+                " PRIMARY KEY (username, site, digest))"
+            )
+            self.connection.execute(
+                "DELETE FROM results WHERE expires <= ?", (time(),)
+            )
+
+        return
+
+    def lookup(self, username, site_data):
+        """Look Up Username.
+
+        Keyword Arguments:
+        self                   -- This object.
+        username               -- String indicating username to look up.
+        site_data              -- Dictionary of SiteCheck() objects of the
+                                  sites to look up.
+
+        Return Value:
+        Dictionary of QueryResult() objects marked as cached, keyed by site,
+        for the sites which have a result for the username that has not yet
+        expired and was found with the same manifest entry.
+        """
+
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT site, digest, status, url_user, http_status, query_time, context"
+                " FROM results WHERE username = ? AND expires > ?",
+                (username, time()),
+            ).fetchall()
+
+        results = {}
+        for site, digest, status, url_user, http_status, query_time, context in rows:
+            net_info = site_data.get(site)
+            if net_info is None or net_info.digest != digest:
+                continue
+            results[site] = QueryResult(
+                username=username,
+                site_name=site,
+                site_url_user=url_user,
+                status=QueryStatus[status],
+                query_time=query_time,
+                context=context,
+                http_status="?" if http_status is None else http_status,
+                cached=True,
+            )
+
+        return results
+
+    def store(self, net_info, result):
+        """Store Result.
+
+        The result is written, but only committed by commit().
+
+        Keyword Arguments:
+        self                   -- This object.
+        net_info               -- SiteCheck() object of the site which was
+                                  probed.
+        result                 -- QueryResult() object of the probe.
+
+        Return Value:
+        Nothing.
+        """
+
+        ttl = self.ttls.get(result.status)
+        if not ttl or result.cached:
+            return
+
+        http_status = result.http_status if isinstance(result.http_status, int) else None
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    result.username,
+                    result.site_name,
+                    net_info.digest,
+                    result.status.name,
+                    result.site_url_user,
+                    http_status,
+                    result.query_time,
+                    result.context,
+                    time() + ttl,
+                ),
+            )
+
+        return
+
+    def commit(self):
+        """Commit the results stored since the last commit."""
+        with self.lock:
+            self.connection.commit()
+
+    def close(self):
+        """Commit any stored results and close the database."""
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
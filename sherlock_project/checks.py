@@ -0,0 +1,439 @@
+"""Sherlock Checks Module
+
+This module compiles the raw information about a site into a check plan,
+which holds everything about probing the site that does not depend on the
+username.  Plans are built once when the site list is loaded, so that
+scanning many usernames only has to fill in each username.
+"""
+import codecs
+import hashlib
+import json
+import re
+from collections.abc import Mapping
+from functools import cached_property
+from types import MappingProxyType
+
+from sherlock_project.result import QueryStatus
+
+
+# A user agent is needed because some sites don't return the correct
+# information since they think that we are bots (Which we actually are...)
+DEFAULT_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:129.0) Gecko/20100101 Firefox/129.0"
+
+# Detection methods which may be named by errorType.
+ERROR_TYPES = ("message", "status_code", "response_url")
+
+# Request methods which may be named by request_method.
+REQUEST_METHODS = ("GET", "HEAD", "POST", "PUT")
+
+# As WAFs advance and evolve, they will occasionally block Sherlock and
+# lead to false positives and negatives. Fingerprints should be added
+# here to filter results that fail to bypass WAFs. Fingerprints should
+# be highly targetted. Comment at the end of each fingerprint to
+# indicate target and date fingerprinted.
+WAF_HIT_MSGS = (
+    r'.loading-spinner{visibility:hidden}body.no-js .challenge-running{display:none}body.dark{background-color:#222;color:#d9d9d9}body.dark a{color:#fff}body.dark a:hover{color:#ee730a;text-decoration:underline}body.dark .lds-ring div{border-color:#999 transparent transparent}body.dark .font-red{color:#b20f03}body.dark', # 2024-05-13 Cloudflare
+    r'<span id="challenge-error-text">', # 2024-11-11 Cloudflare error page
+    r'AwsWafIntegration.forceRefreshToken', # 2024-11-11 Cloudfront (AWS)
+    r'{return l.onPageView}}),Object.defineProperty(r,"perimeterxIdentifiers",{enumerable:' # 2024-04-09 PerimeterX / Human Security
+)
+
+# Default number of bytes of a response body which are read before giving
+# up on finding an error message or WAF fingerprint in it.  Sites may set
+# their own limit with maxBodySize.
+DEFAULT_MAX_BODY_SIZE = 2 * 1024 * 1024
+
+# Number of bytes of a response body after an error message which are still
+# searched for WAF fingerprints, which take precedence.  WAF challenges put
+# their fingerprints near the top of the page, so once this much more of
+# the body has been read the error message is final.
+WAF_LOOKAHEAD = 64 * 1024
+
+# Encodings in which searching the raw bytes for an encoded pattern gives
+# the same answer as searching the decoded text for the pattern.  These are
+# UTF-8 and the single byte encodings; bodies in any other encoding are
+# decoded before being searched.
+BYTE_SEARCHABLE_ENCODINGS = frozenset(
+    ["utf-8", "ascii", "koi8-r", "koi8-u"]
+    + [f"iso8859-{part}" for part in range(1, 17)]
+    + [f"cp{page}" for page in range(1250, 1259)]
+)
+
+
+class BodyMatcher:
+    def __init__(self, error_msgs=()):
+        """Create Body Matcher Object.
+
+        Holds the WAF fingerprints and the error messages of a site, and
+        decides in a single call whether a response body shows a WAF, an
+        error message, or neither.
+
+        The body is searched as raw bytes, against the patterns encoded in
+        the charset of the response, so that it does not have to be decoded
+        at all.  Each pattern is searched for with the substring search of
+        the interpreter, which is many times faster over large bodies than
+        a combined regular expression.
+
+        Keyword Arguments:
+        self                   -- This object.
+        error_msgs             -- Tuple of strings indicating that the
+                                  username is not on the site.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.waf_msgs = WAF_HIT_MSGS
+        self.error_msgs = tuple(error_msgs)
+        self.encoded = {}
+
+        return
+
+    def patterns(self, encoding):
+        """Patterns For Encoding.
+
+        Keyword Arguments:
+        self                   -- This object.
+        encoding               -- String naming the charset of the body, or
+                                  None if the response did not declare one.
+
+        Return Value:
+        Tuple of the WAF fingerprints and error messages encoded as bytes,
+        or None if bodies in this encoding must be decoded to be searched.
+        Patterns which cannot be encoded in the charset are left out, as
+        they can never be found in such a body.
+        """
+
+        try:
+            encoding = codecs.lookup(encoding or "utf-8").name
+        except LookupError:
+            # Undecodable charsets are treated as UTF-8, as requests does.
+            encoding = "utf-8"
+
+        if encoding not in BYTE_SEARCHABLE_ENCODINGS:
+            return None
+
+        try:
+            return self.encoded[encoding]
+        except KeyError:
+            pass
+
+        def encode(msgs):
+            encoded = []
+            for msg in msgs:
+                try:
+                    encoded.append(msg.encode(encoding))
+                except UnicodeEncodeError:
+                    pass
+            return tuple(encoded)
+
+        patterns = (encode(self.waf_msgs), encode(self.error_msgs))
+        self.encoded[encoding] = patterns
+
+        return patterns
+
+    def scanner(self, encoding=None):
+        """Create a BodyScanner() for a body arriving in chunks.
+
+        Keyword Arguments:
+        self                   -- This object.
+        encoding               -- String naming the charset of the body, or
+                                  None if the response did not declare one.
+
+        Return Value:
+        BodyScanner() object.
+        """
+
+        patterns = self.patterns(encoding)
+        if patterns is not None:
+            return BodyScanner(*patterns)
+
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        return BodyScanner(self.waf_msgs, self.error_msgs, decoder)
+
+    def scan(self, body, encoding=None):
+        """Scan Body.
+
+        Keyword Arguments:
+        self                   -- This object.
+        body                   -- Bytes of the response body, or the body
+                                  already decoded to a string.
+        encoding               -- String naming the charset of the body, or
+                                  None if the response did not declare one.
+
+        Return Value:
+        QueryStatus.WAF if a WAF fingerprint is found, which takes
+        precedence over anything else, QueryStatus.AVAILABLE if an error
+        message is found, and None if neither is.
+        """
+
+        if isinstance(body, str):
+            scanner = BodyScanner(self.waf_msgs, self.error_msgs)
+        else:
+            scanner = self.scanner(encoding)
+
+        return scanner.feed(body)
+
+
+class BodyScanner:
+    def __init__(self, waf_msgs, error_msgs, decoder=None):
+        """Create Body Scanner Object.
+
+        Searches a body for WAF fingerprints and error messages as it
+        arrives, chunk by chunk, including matches which straddle two
+        chunks.  A WAF fingerprint is final as soon as it is found.  It
+        also takes precedence over an error message, so an error message
+        only becomes final once another WAF_LOOKAHEAD bytes of the body
+        have been searched for WAF fingerprints (or the body ends).
+
+        Keyword Arguments:
+        self                   -- This object.
+        waf_msgs               -- Tuple of WAF fingerprints.
+        error_msgs             -- Tuple of error messages.
+        decoder                -- Incremental decoder to apply to each chunk
+                                  before searching it, or None to search the
+                                  chunks as they are.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.waf_msgs = waf_msgs
+        self.error_msgs = error_msgs
+        self.decoder = decoder
+        self.overlap = max(map(len, waf_msgs + error_msgs), default=1) - 1
+        self.tail = None
+        self.size = 0
+        self.status = None
+        # Whether the status can no longer change, so that the rest of the
+        # body need not be read.
+        self.final = False
+        # Size of the body at which an error message which was found becomes
+        # final.
+        self.lookahead_end = None
+
+        return
+
+    def feed(self, chunk):
+        """Feed Chunk.
+
+        Keyword Arguments:
+        self                   -- This object.
+        chunk                  -- Next bytes (or string) of the body.
+
+        Return Value:
+        The status found so far, as for BodyMatcher.scan(), or None if
+        nothing has been found yet.
+        """
+
+        if self.final:
+            return self.status
+
+        self.size += len(chunk)
+        if self.decoder is not None:
+            chunk = self.decoder.decode(chunk)
+
+        # Carry the end of the previous chunk over, so that a pattern split
+        # between the two is still found.
+        window = chunk if self.tail is None else self.tail + chunk
+
+        if any(msg in window for msg in self.waf_msgs):
+            self.status = QueryStatus.WAF
+            self.final = True
+        elif self.status is None and any(msg in window for msg in self.error_msgs):
+            self.status = QueryStatus.AVAILABLE
+            self.lookahead_end = self.size + WAF_LOOKAHEAD
+        elif self.lookahead_end is not None and self.size >= self.lookahead_end:
+            self.final = True
+
+        self.tail = window[-self.overlap:] if self.overlap else window[:0]
+
+        return self.status
+
+
+# Matcher shared by all sites which do not detect by error message.
+WAF_MATCHER = BodyMatcher()
+
+
+def interpolate_string(input_object, username):
+    if isinstance(input_object, str):
+        return input_object.replace("{}", username)
+    elif isinstance(input_object, Mapping):
+        return {k: interpolate_string(v, username) for k, v in input_object.items()}
+    elif isinstance(input_object, list):
+        return [interpolate_string(i, username) for i in input_object]
+    return input_object
+
+
+class SiteCheck(Mapping):
+    def __init__(self, name, information):
+        """Create Site Check Object.
+
+        Compiles the information about a site into an immutable plan for
+        probing it.  The object is also a read-only mapping of the original
+        information, so it can be used anywhere the raw site data is.
+
+        Keyword Arguments:
+        self                   -- This object.
+        name                   -- String which identifies site.
+        information            -- Dictionary containing all known information
+                                  about website, as found in the manifest.
+
+        Return Value:
+        Nothing.
+
+        NOTE:  Will raise a KeyError if the information lacks an attribute
+               required to probe the site, and a ValueError if one of the
+               attributes is not usable.
+        """
+
+        error_type = information["errorType"]
+        if isinstance(error_type, str):
+            error_type = [error_type]
+        error_type = tuple(error_type)
+
+        error_codes = information.get("errorCode")
+        if isinstance(error_codes, int):
+            # Type consistency, allowing for both singlets and lists in manifest
+            error_codes = [error_codes]
+        if error_codes is not None:
+            error_codes = frozenset(error_codes)
+
+        error_msgs = information.get("errorMsg")
+        if isinstance(error_msgs, str):
+            error_msgs = [error_msgs]
+        error_msgs = tuple(error_msgs or ())
+
+        regex_check = information.get("regexCheck")
+        if regex_check:
+            try:
+                regex_check = re.compile(regex_check)
+            except re.error as error:
+                raise ValueError(f"Invalid regexCheck for {name}:  {error}")
+        else:
+            regex_check = None
+
+        request_method = information.get("request_method")
+        if request_method is None:
+            if information["errorType"] == "status_code":
+                # In most cases when we are detecting by status code,
+                # it is not necessary to get the entire body:  we can
+                # detect fine with just the HEAD response.
+                request_method = "HEAD"
+            else:
+                # Either this detect method needs the content associated
+                # with the GET response, or this specific website will
+                # not respond properly unless we request the whole page.
+                request_method = "GET"
+        elif request_method not in REQUEST_METHODS:
+            raise ValueError(f"Unsupported request_method for {name}")
+
+        max_body_size = information.get("maxBodySize", DEFAULT_MAX_BODY_SIZE)
+        if not isinstance(max_body_size, int) or max_body_size < 1:
+            raise ValueError(f"Invalid maxBodySize for {name}")
+
+        headers = {
+            "User-Agent": DEFAULT_USER_AGENT,
+        }
+        if "headers" in information:
+            # Override/append any extra headers required by a given site.
+            headers.update(information["headers"])
+
+        vars(self).update(
+            name=name,
+            information=MappingProxyType(information),
+            url_main=information.get("urlMain"),
+            url=information["url"],
+            url_probe=information.get("urlProbe"),
+            payload=information.get("request_payload"),
+            regex_check=regex_check,
+            method=request_method,
+            headers=MappingProxyType(headers),
+            # Site forwards request to a different URL if username not
+            # found.  Disallow the redirect so we can capture the
+            # http status from the original URL request.
+            allow_redirects=information["errorType"] != "response_url",
+            error_type=error_type,
+            known_error_type=all(errtype in ERROR_TYPES for errtype in error_type),
+            error_codes=error_codes,
+            error_msgs=error_msgs,
+            matcher=BodyMatcher(error_msgs) if "message" in error_type else WAF_MATCHER,
+            max_body_size=max_body_size,
+        )
+
+        return
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __getitem__(self, key):
+        return self.information[key]
+
+    def __iter__(self):
+        return iter(self.information)
+
+    def __len__(self):
+        return len(self.information)
+
+    def __str__(self):
+        """Convert Object To String.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nicely formatted string to get information about this object.
+        """
+
+        return f"{self.name} ({', '.join(self.error_type)})"
+
+    @cached_property
+    def digest(self):
+        """Digest of the site's entry in the manifest, which changes with it."""
+        entry = json.dumps(dict(self.information), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(entry.encode("utf-8")).hexdigest()
+
+    def allows(self, username):
+        """Check whether the username is allowed on the site by regexCheck."""
+        return self.regex_check is None or self.regex_check.search(username) is not None
+
+    def url_user(self, username):
+        """URL of the username on the site."""
+        return self.url.replace("{}", username.replace(" ", "%20"))
+
+    def request_url(self, username):
+        """URL which should be requested to probe for the username."""
+        if self.url_probe is None:
+            # Probe URL is normal one seen by people out on the web.
+            return self.url_user(username)
+
+        # There is a special URL for probing existence separate
+        # from where the user profile normally can be found.
+        return self.url_probe.replace("{}", username)
+
+    def request_payload(self, username):
+        """JSON payload of the probe for the username, or None."""
+        if self.payload is None:
+            return None
+        return interpolate_string(self.payload, username)
+
+
+def compile_site_data(site_data):
+    """Compile Site Data.
+
+    Keyword Arguments:
+    site_data              -- Dictionary containing all of the site data.
+                              Values may be raw site information or
+                              SiteCheck() objects, which are used as is.
+
+    Return Value:
+    Dictionary of SiteCheck() objects, keyed by site.
+    """
+
+    return {
+        name: info if isinstance(info, SiteCheck) else SiteCheck(name, info)
+        for name, info in site_data.items()
+    }
@@ -0,0 +1,653 @@
+"""Sherlock Distributed Module
+
+This module splits large scans into work units of one username on one
+site, which any number of workers, on any number of machines, take from a
+shared work queue.  A worker leases units for a while; if it dies before
+reporting them, their lease runs out and another worker takes them over,
+so no work is lost.  Units whose probe failed are retried, and results
+which are reported more than once are only recorded once.
+
+    python -m sherlock_project.distributed submit --queue work.db user1 user2
+    python -m sherlock_project.distributed work --queue work.db
+    python -m sherlock_project.distributed report --queue work.db JOB
+"""
+import json
+import os
+import socket
+import threading
+import uuid
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from time import sleep
+from time import time
+
+from sherlock_project.checks import compile_site_data
+from sherlock_project.result import QueryResult
+from sherlock_project.result import QueryStatus
+from sherlock_project.scheduler import ProbeScheduler
+from sherlock_project.sherlock import DEFAULT_MAX_WORKERS
+from sherlock_project.sherlock import positive_int_check
+from sherlock_project.sherlock import create_session
+from sherlock_project.sherlock import iter_batch
+
+
+# Default number of times a unit is attempted before its last result is
+# taken as final.
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Default number of seconds for which a worker holds the units it leased.
+# It must be long enough for the worker to probe them all.
+DEFAULT_LEASE_SECONDS = 300
+
+# Default number of units a worker leases at a time.
+DEFAULT_LEASE_SIZE = 100
+
+# Default number of seconds to wait before asking an empty queue again.
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Number of jobs whose compiled sites and session a worker keeps.  The
+# least recently worked on job is closed to make room for another.
+MAX_CACHED_JOBS = 4
+
+
+class WorkUnit:
+    def __init__(self, job, username, site, information, attempts):
+        """Create Work Unit Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        job                    -- String identifying the job of the unit.
+        username               -- String indicating username to probe for.
+        site                   -- String identifying site to probe.
+        information            -- Dictionary of the information about the
+                                  site from the manifest.
+        attempts               -- Number of times the unit has been leased,
+                                  including this time.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.job = job
+        self.username = username
+        self.site = site
+        self.information = information
+        self.attempts = attempts
+
+        return
+
+
+class WorkQueue:
+    """Work Queue Object.
+
+    Base class that describes the methods of the queue shared by the
+    coordinator and its workers.  It is intended that backends inherit from
+    this base class and override its methods, which hold no work at all.
+    """
+
+    def submit(self, job, usernames, site_data):
+        """Submit Job.
+
+        Adds a unit for each username on each site.  Units which are
+        already in the queue are left as they are, so submitting a job
+        again only adds what is missing.
+
+        Keyword Arguments:
+        self                   -- This object.
+        job                    -- String identifying the job.
+        usernames              -- List of strings indicating usernames.
+        site_data              -- Dictionary of the information about each
+                                  site, keyed by site.
+
+        Return Value:
+        Nothing.
+        """
+
+    def lease(self, owner, count=DEFAULT_LEASE_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Lease Units.
+
+        Keyword Arguments:
+        self                   -- This object.
+        owner                  -- String identifying the worker.
+        count                  -- Maximum number of units to lease.
+        lease_seconds          -- Number of seconds after which the units
+                                  may be leased by another worker, if they
+                                  have not been completed.
+
+        Return Value:
+        List of WorkUnit() objects, which are units that are pending or
+        whose lease has run out, taking those of a job's usernames in order.
+        """
+        return []
+
+    def complete(self, owner, outcomes):
+        """Complete Units.
+
+        Records the results of units.  The first result reported for a unit
+        is kept, and later ones are ignored.  A unit whose result should be
+        retried is put back in the queue, unless it has been attempted as
+        often as allowed, in which case its result is kept.
+
+        Keyword Arguments:
+        self                   -- This object.
+        owner                  -- String identifying the worker.
+        outcomes               -- List of (job, username, site, record, retry)
+                                  tuples, where record is a dictionary of
+                                  the result, and retry a Boolean indicating
+                                  if the unit should be tried again.
+
+        Return Value:
+        Nothing.
+        """
+
+    def sites(self, job):
+        """Dictionary of the information about each site of the job."""
+        return {}
+
+    def progress(self, job):
+        """Progress.
+
+        Keyword Arguments:
+        self                   -- This object.
+        job                    -- String identifying the job.
+
+        Return Value:
+        List of (username, units, done) tuples, in the order the usernames
+        were submitted.
+        """
+        return []
+
+    def results(self, job, username):
+        """Results.
+
+        Keyword Arguments:
+        self                   -- This object.
+        job                    -- String identifying the job.
+        username               -- String indicating username.
+
+        Return Value:
+        Dictionary of the records of the completed units of the username,
+        keyed by site.  The record of a unit which was given up on because
+        its workers kept dying is None.
+        """
+        return {}
+
+    def close(self):
+        """Close the queue."""
+        return
+
+
+class WorkQueueSQLite(WorkQueue):
+    """Work Queue SQLite Object.
+
+    Work queue kept in a SQLite database, which can be shared by the
+    processes of one machine, or of several machines through a network file
+    system whose file locking works, such as NFS with its lock manager.  The
+    database uses a rollback journal rather than a write-ahead log for this,
+    as the write-ahead log needs memory shared between the processes.
+    """
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Create Work Queue SQLite Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        path                   -- String containing the path of the database
+                                  file.
+        max_attempts           -- Maximum number of times a unit is
+                                  attempted.  Default is DEFAULT_MAX_ATTEMPTS.
+
+        Return Value:
+        Nothing.
+        """
+
+        # Imported here, so that runs without a work queue do not pay for it.
+        import sqlite3
+
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Transactions are begun explicitly, so that leasing takes the write
+        # lock of the database before looking for units.
+        self.connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self.lock:
+            # Also turns the write-ahead log off in older queues.
+            self.connection.execute("PRAGMA journal_mode=DELETE")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sites ("
+                " job TEXT NOT NULL,"
+                " site TEXT NOT NULL,"
+                " information TEXT NOT NULL,"
+                " PRIMARY KEY (job, site))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS units ("
+                " job TEXT NOT NULL,"
+                " username TEXT NOT NULL,"
+                " site TEXT NOT NULL,"
+                " position INTEGER NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " owner TEXT,"
+                " expires REAL,"
+                " record TEXT,"
+                " PRIMARY KEY (job, username, site))"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS units_by_state ON units (state, job, position)"
+            )
+
+        return
+
+    @contextmanager
+    def transaction(self):
+        """Run a write transaction, holding the lock of the connection."""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def submit(self, job, usernames, site_data):
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO sites VALUES (?, ?, ?)",
+                [(job, site, json.dumps(dict(information))) for site, information in site_data.items()],
+            )
+            position = connection.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM units WHERE job = ?", (job,)
+            ).fetchone()[0]
+            for offset, username in enumerate(usernames):
+                connection.executemany(
+                    "INSERT OR IGNORE INTO units (job, username, site, position) VALUES (?, ?, ?, ?)",
+                    [(job, username, site, position + offset) for site in site_data],
+                )
+
+    def lease(self, owner, count=DEFAULT_LEASE_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time()
+        with self.transaction() as connection:
+            # Units whose workers kept dying are given up on.
+            connection.execute(
+                "UPDATE units SET state = 'done', owner = NULL"
+                " WHERE state = 'leased' AND expires <= ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            rows = connection.execute(
+                "SELECT units.job, units.username, units.site, sites.information, units.attempts"
+                " FROM units JOIN sites ON sites.job = units.job AND sites.site = units.site"
+                " WHERE units.state = 'pending' OR (units.state = 'leased' AND units.expires <= ?)"
+                " ORDER BY units.job, units.position, units.site LIMIT ?",
+                (now, count),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE units SET state = 'leased', owner = ?, expires = ?, attempts = attempts + 1"
+                " WHERE job = ? AND username = ? AND site = ?",
+                [(owner, now + lease_seconds, job, username, site) for job, username, site, _, _ in rows],
+            )
+
+        return [
+            WorkUnit(job, username, site, json.loads(information), attempts + 1)
+            for job, username, site, information, attempts in rows
+        ]
+
+    def complete(self, owner, outcomes):
+        with self.transaction() as connection:
+            for job, username, site, record, retry in outcomes:
+                record = json.dumps(record)
+                if retry:
+                    # Only the current holder of the lease may put it back.
+                    cursor = connection.execute(
+                        "UPDATE units SET state = 'pending', owner = NULL, record = ?"
+                        " WHERE job = ? AND username = ? AND site = ?"
+                        " AND state = 'leased' AND owner = ? AND attempts < ?",
+                        (record, job, username, site, owner, self.max_attempts),
+                    )
+                    if cursor.rowcount:
+                        continue
+                connection.execute(
+                    "UPDATE units SET state = 'done', owner = NULL, record = ?"
+                    " WHERE job = ? AND username = ? AND site = ? AND state != 'done'",
+                    (record, job, username, site),
+                )
+
+    def sites(self, job):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT site, information FROM sites WHERE job = ? ORDER BY rowid", (job,)
+            ).fetchall()
+        return {site: json.loads(information) for site, information in rows}
+
+    def progress(self, job):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT username, COUNT(*), SUM(state = 'done') FROM units WHERE job = ?"
+                " GROUP BY username ORDER BY MIN(position)",
+                (job,),
+            ).fetchall()
+
+    def results(self, job, username):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT site, record FROM units WHERE job = ? AND username = ? AND state = 'done'",
+                (job, username),
+            ).fetchall()
+        return {site: None if record is None else json.loads(record) for site, record in rows}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def submit_job(queue, usernames, site_data, job=None):
+    """Submit Job.
+
+    Keyword Arguments:
+    queue                  -- WorkQueue() object.
+    usernames              -- List of strings indicating usernames to scan.
+    site_data              -- Dictionary containing all of the site data.
+    job                    -- String identifying the job, or None to make up
+                              a new one.  Submitting the same job again
+                              adds no duplicate units.
+
+    Return Value:
+    String identifying the job.
+    """
+
+    job = job or uuid.uuid4().hex[:16]
+    queue.submit(job, list(usernames), site_data)
+    return job
+
+
+def collect(queue, job, query_notify, poll_interval=DEFAULT_POLL_INTERVAL, wait=True):
+    """Collect Results.
+
+    Keyword Arguments:
+    queue                  -- WorkQueue() object.
+    job                    -- String identifying the job.
+    query_notify           -- Object with base type of QueryNotify().
+    poll_interval          -- Number of seconds to wait between looking at
+                              the progress of the job.
+    wait                   -- Boolean indicating if usernames which are not
+                              complete yet should be waited for.  If not,
+                              collecting stops at the first of them.
+
+    Return Value:
+    Generator of (username, results) tuples, in the order the usernames
+    were submitted, as each username is complete.  The results are the
+    same as returned by sherlock(), without response bodies.  The caller is
+    notified about the results of one username at a time.
+    """
+
+    sites = queue.sites(job)
+    position = 0
+    while True:
+        progress = queue.progress(job)
+        while position < len(progress) and progress[position][1] == progress[position][2]:
+            username = progress[position][0]
+            records = queue.results(job, username)
+            query_notify.start(username)
+            results = {}
+            for site, information in sites.items():
+                if site not in records:
+                    continue
+                record = records[site]
+                if record is None:
+                    result = QueryResult(
+                        username, site, None, QueryStatus.UNKNOWN,
+                        context="Gave up after the workers probing it stopped responding",
+                    )
+                    record = {"url_user": None}
+                else:
+                    result = QueryResult.from_dict(record["result"])
+                query_notify.update(result)
+                results[site] = {
+                    "url_main": information.get("urlMain"),
+                    "url_user": record["url_user"],
+                    "status": result,
+                    "http_status": result.http_status,
+                    "response_text": None,
+                }
+            yield username, results
+            position += 1
+
+        if position == len(progress) or not wait:
+            return
+        sleep(poll_interval)
+
+
+class Worker:
+    def __init__(
+        self,
+        queue,
+        name=None,
+        lease_size=DEFAULT_LEASE_SIZE,
+        lease_seconds=DEFAULT_LEASE_SECONDS,
+        poll_interval=DEFAULT_POLL_INTERVAL,
+        max_in_flight=DEFAULT_MAX_WORKERS,
+        max_per_host=None,
+        proxy=None,
+        timeout=60,
+    ):
+        """Create Worker Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        queue                  -- WorkQueue() object to take units from.
+        name                   -- String identifying the worker, or None for
+                                  one made of the host name and process.
+        lease_size             -- Number of units to lease at a time.
+        lease_seconds          -- Number of seconds to lease units for.
+        poll_interval          -- Number of seconds to wait before asking
+                                  an empty queue again.
+        max_in_flight          -- Maximum number of requests in flight.
+        max_per_host           -- Maximum number of requests in flight to
+                                  any single host.  None for no limit.
+        proxy                  -- String indicating the proxy URL, or None.
+        timeout                -- Time in seconds to wait for each site.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_size = lease_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.proxy = proxy
+        self.timeout = timeout
+        self.stopping = threading.Event()
+        # Compiled sites and session of the most recently worked on jobs,
+        # least recently worked on first.
+        self.jobs = {}
+
+        return
+
+    def job(self, job):
+        """Tuple of the compiled site data and the session of the job."""
+        entry = self.jobs.pop(job, None)
+        if entry is None:
+            site_data = compile_site_data(self.queue.sites(job))
+            session = ProbeScheduler(
+                create_session(site_data, max_workers=self.max_in_flight),
+                max_per_host=self.max_per_host,
+            )
+            entry = (site_data, session)
+            while len(self.jobs) >= MAX_CACHED_JOBS:
+                # Units are worked on one job at a time, so the session of
+                # another job is not in use.
+                _, evicted = self.jobs.pop(next(iter(self.jobs)))
+                evicted.close()
+        self.jobs[job] = entry
+        return entry
+
+    def work(self, units):
+        """Work.
+
+        Probes the units, and reports their results to the queue one
+        username at a time.
+
+        Keyword Arguments:
+        self                   -- This object.
+        units                  -- List of WorkUnit() objects.
+
+        Return Value:
+        Nothing.
+        """
+
+        groups = {}
+        for unit in units:
+            groups.setdefault((unit.job, unit.username), []).append(unit.site)
+
+        for (job, username), site_names in groups.items():
+            site_data, session = self.job(job)
+            outcomes = []
+            for _, stream, results_total in iter_batch(
+                [username],
+                {site: site_data[site] for site in site_names},
+                proxy=self.proxy,
+                timeout=self.timeout,
+                session=session,
+            ):
+                for result in stream:
+                    record = {
+                        "url_user": results_total[result.site_name]["url_user"],
+                        "result": result.to_dict(),
+                    }
+                    # Errors are often transient, so the unit is tried again.
+                    retry = result.status is QueryStatus.UNKNOWN
+                    outcomes.append((job, username, result.site_name, record, retry))
+            self.queue.complete(self.name, outcomes)
+
+    def run(self, idle_timeout=None):
+        """Run.
+
+        Takes units from the queue and works on them until stop() is called,
+        or the queue has been empty for idle_timeout seconds.
+
+        Keyword Arguments:
+        self                   -- This object.
+        idle_timeout           -- Number of seconds after which an empty
+                                  queue stops the worker, or None to keep
+                                  waiting for work.
+
+        Return Value:
+        Number of units worked on.
+        """
+
+        worked = 0
+        idle_since = time()
+        try:
+            while not self.stopping.is_set():
+                units = self.queue.lease(self.name, self.lease_size, self.lease_seconds)
+                if units:
+                    self.work(units)
+                    worked += len(units)
+                    idle_since = time()
+                elif idle_timeout is not None and time() - idle_since >= idle_timeout:
+                    break
+                else:
+                    self.stopping.wait(self.poll_interval)
+        finally:
+            for _, session in self.jobs.values():
+                session.close()
+            self.jobs = {}
+
+        return worked
+
+    def stop(self):
+        """Stop taking new units.  Units being worked on are finished."""
+        self.stopping.set()
+
+
+def main(args=None):
+    parser = ArgumentParser(
+        prog="python -m sherlock_project.distributed",
+        description="Spread large scans over workers through a shared work queue.",
+    )
+    parser.add_argument(
+        "--queue", required=True, metavar="PATH",
+        help="Path of the SQLite database of the work queue.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Submit a job, and print its identifier.")
+    submit.add_argument("usernames", nargs="+", metavar="USERNAMES")
+    submit.add_argument("--job", help="Identifier of the job.  Submitting a job again adds what is missing.")
+    submit.add_argument("--json", "-j", metavar="JSON_FILE", dest="json_file", default=None,
+                        help="Load data from a JSON file, a compiled manifest, or an online, valid, JSON file.")
+    submit.add_argument("--site", action="append", metavar="SITE_NAME", dest="site_list", default=[],
+                        help="Limit the job to the listed sites.")
+    submit.add_argument("--nsfw", action="store_true", default=False,
+                        help="Include checking of NSFW sites from default list.")
+    submit.add_argument("--ignore-exclusions", action="store_true", default=False,
+                        help="Ignore upstream exclusions (may return more false positives).")
+
+    work = commands.add_parser("work", help="Work on the units of the queue.")
+    work.add_argument("--idle-timeout", type=float, default=None, metavar="SECONDS",
+                      help="Stop once the queue has been empty this long (Default: keep waiting).")
+    work.add_argument("--lease-size", type=positive_int_check, default=DEFAULT_LEASE_SIZE)
+    work.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS)
+    work.add_argument("--max-in-flight", type=positive_int_check, default=DEFAULT_MAX_WORKERS)
+    work.add_argument("--max-per-host", type=positive_int_check, default=None)
+    work.add_argument("--proxy", "-p", metavar="PROXY_URL", default=None)
+    work.add_argument("--timeout", type=float, default=60)
+
+    report = commands.add_parser("report", help="Print the results of a job.")
+    report.add_argument("job")
+    report.add_argument("--no-wait", action="store_false", dest="wait",
+                        help="Only print the usernames which are complete.")
+    report.add_argument("--print-all", action="store_true", default=False,
+                        help="Output sites where the username was not found.")
+
+    args = parser.parse_args(args)
+    queue = WorkQueueSQLite(args.queue)
+    try:
+        if args.command == "submit":
+            # Imported here, as only the coordinator loads the manifest.
+            from sherlock_project.sites import SitesInformation
+
+            sites = SitesInformation(
+                args.json_file,
+                honor_exclusions=not args.ignore_exclusions,
+                do_not_exclude=args.site_list,
+            )
+            if args.site_list:
+                selected = sites.select(names=args.site_list)
+            else:
+                selected = sites.select(nsfw=None if args.nsfw else False)
+            site_data = {site_name: site.information for site_name, site in selected.items()}
+            print(submit_job(queue, args.usernames, site_data, job=args.job))
+
+        elif args.command == "work":
+            worker = Worker(
+                queue,
+                lease_size=args.lease_size,
+                lease_seconds=args.lease_seconds,
+                max_in_flight=args.max_in_flight,
+                max_per_host=args.max_per_host,
+                proxy=args.proxy,
+                timeout=args.timeout,
+            )
+            print(f"Worked on {worker.run(idle_timeout=args.idle_timeout)} units.")
+
+        elif args.command == "report":
+            from sherlock_project.notify import QueryNotifyPrint
+
+            query_notify = QueryNotifyPrint(print_all=args.print_all)
+            for _ in collect(queue, args.job, query_notify, wait=args.wait):
+                print()
+            query_notify.finish()
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Sherlock Fetch Module
+
+This module fetches the remote files which Sherlock depends on, such as the
+site manifest, through an on-disk cache.  Cached copies are reused for a
+while, then revalidated with the server, and still used if the server
+cannot be reached.
+"""
+import hashlib
+import json
+import os
+from time import time
+
+import requests
+
+from sherlock_project.cache import cache_dir
+
+
+# Default number of seconds for which a cached copy is used without asking
+# the server whether it has changed.
+DEFAULT_MAX_AGE = 60 * 60
+
+
+class FetchResult:
+    def __init__(self, url, content, source, fetched_at, error=None):
+        """Create Fetch Result Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        url                    -- String containing URL which was fetched.
+        content                -- Bytes of the file.
+        source                 -- String indicating where the content came
+                                  from:  "network" if it was downloaded,
+                                  "revalidated" if the server confirmed that
+                                  the cached copy is current, "cache" if the
+                                  cached copy was young enough to use as is,
+                                  and "stale" if the server could not be
+                                  reached and the cached copy was used anyway.
+        fetched_at             -- Time (in seconds since the epoch) at which
+                                  the content was last confirmed by the server.
+        error                  -- String describing why the server could not
+                                  be reached, for stale content.
+                                  Default is None.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.url = url
+        self.content = content
+        self.source = source
+        self.fetched_at = fetched_at
+        self.error = error
+
+        return
+
+    @property
+    def text(self):
+        """Content decoded as UTF-8."""
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        """Content parsed as JSON."""
+        return json.loads(self.content)
+
+
+def cache_paths(url, cache_directory=None):
+    """Cache Paths.
+
+    Keyword Arguments:
+    url                    -- String containing URL of file.
+    cache_directory        -- String containing directory to keep cached
+                              copies in, or None for the default.
+
+    Return Value:
+    Tuple of the paths of the cached copy of the file and of its metadata.
+    """
+
+    directory = os.path.join(cache_directory or cache_dir(), "http")
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(directory, key), os.path.join(directory, key + ".json")
+
+
+def read_cached(url, cache_directory=None):
+    """Read the cached copy of url, as a (content, metadata) tuple or None."""
+    content_path, meta_path = cache_paths(url, cache_directory)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        with open(content_path, "rb") as file:
+            content = file.read()
+    except (OSError, ValueError):
+        return None
+
+    if meta.get("url") != url or meta.get("size") != len(content):
+        # Left over from an interrupted write, or a different URL.
+        return None
+
+    return content, meta
+
+
+def write_cached(url, content, meta, cache_directory=None):
+    """Write the cached copy of url.  Failures to write are ignored."""
+    content_path, meta_path = cache_paths(url, cache_directory)
+    meta = dict(meta, url=url, size=len(content))
+    try:
+        os.makedirs(os.path.dirname(content_path), exist_ok=True)
+        for path, data in ((content_path, content), (meta_path, json.dumps(meta).encode("utf-8"))):
+            # Write beside the file and move it into place, so that readers
+            # never see a partial file.
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, path)
+    except OSError:
+        pass
+
+
+def fetch_cached(url, timeout, max_age=DEFAULT_MAX_AGE, cache_directory=None, headers=None):
+    """Fetch Cached.
+
+    Fetches a file over HTTP through the on-disk cache.  A cached copy
+    younger than max_age is used without contacting the server.  An older
+    one is revalidated with its ETag and Last-Modified date, so an
+    unchanged file is not downloaded again.  If the server cannot be
+    reached, or answers with an error, the cached copy is used regardless
+    of its age.
+
+    Keyword Arguments:
+    url                    -- String containing URL of file.
+    timeout                -- Time in seconds to wait for the server.
+    max_age                -- Number of seconds for which a cached copy is
+                              used without revalidating it.  0 always
+                              revalidates.  Default is DEFAULT_MAX_AGE.
+    cache_directory        -- String containing directory to keep cached
+                              copies in, or None for the default.
+    headers                -- Dictionary of extra request headers, or None.
+
+    Return Value:
+    FetchResult() object.
+
+    NOTE:  Will raise a requests.RequestException if the file cannot be
+           fetched and there is no cached copy, which is an HTTPError if
+           the server answered with an error.
+    """
+
+    cached = read_cached(url, cache_directory)
+    now = time()
+
+    if cached is not None:
+        content, meta = cached
+        if now - meta.get("fetched_at", 0) < max_age:
+            return FetchResult(url, content, "cache", meta["fetched_at"])
+
+    request_headers = dict(headers or {})
+    if cached is not None:
+        if meta.get("etag"):
+            request_headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            request_headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = requests.get(url=url, headers=request_headers, timeout=timeout)
+        if cached is not None and response.status_code == 304:
+            meta["fetched_at"] = now
+            write_cached(url, content, meta, cache_directory)
+            return FetchResult(url, content, "revalidated", now)
+        if response.status_code != 200:
+            raise requests.HTTPError(
+                f"{response.status_code} response from {url}", response=response
+            )
+        new_content = response.content
+    except requests.RequestException as error:
+        if cached is None:
+            raise
+        return FetchResult(url, content, "stale", meta.get("fetched_at", 0), error=str(error))
+
+    write_cached(
+        url,
+        new_content,
+        {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": now,
+        },
+        cache_directory,
+    )
+
+    return FetchResult(url, new_content, "network", now)
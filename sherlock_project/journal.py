@@ -0,0 +1,258 @@
+"""Sherlock Journal Module
+
+This module keeps an append-only journal of the results of a scan, written
+as each result arrives, so that a scan which is interrupted can be resumed
+without probing again the sites it already has results for.
+"""
+import json
+import os
+from time import monotonic
+
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import QueryResult
+from sherlock_project.result import QueryStatus
+
+
+# Maximum number of seconds between forcing the journal to disk, so that
+# little is lost if the machine itself goes down.
+SYNC_INTERVAL = 1.0
+
+
+class ScanJournal:
+    """Scan Journal Object.
+
+    Journal of results, kept as one JSON object per line, in the form
+    returned by QueryResult.to_dict().  Results for which an error occurred
+    are journaled too, but do not count as done, so that they are probed
+    again when the scan is resumed.
+    """
+
+    def __init__(self, path, sync_interval=SYNC_INTERVAL):
+        """Create Scan Journal Object.
+
+        Reads the results already in the journal, then opens it to append
+        new ones.
+
+        Keyword Arguments:
+        self                   -- This object.
+        path                   -- String containing the path of the journal.
+        sync_interval          -- Maximum number of seconds between forcing
+                                  the journal to disk.
+                                  Default is SYNC_INTERVAL.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.path = path
+        self.sync_interval = sync_interval
+        # Results done so far, keyed by username, then by site.
+        self.results = {}
+        self.skipped = 0
+
+        ends_with_newline = True
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                for line in file:
+                    ends_with_newline = line.endswith(b"\n")
+                    try:
+                        result = QueryResult.from_dict(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        # Most likely the last line, cut short by a crash.
+                        self.skipped += 1
+                        continue
+                    self.add(result)
+
+        self.file = open(path, "a", encoding="utf-8")
+        if not ends_with_newline:
+            # Start afresh after a line which was cut short.
+            self.file.write("\n")
+        self.synced = monotonic()
+
+        return
+
+    def add(self, result):
+        """Count the result as done, unless an error occurred."""
+        sites = self.results.setdefault(result.username, {})
+        if result.status is QueryStatus.UNKNOWN:
+            sites.pop(result.site_name, None)
+        else:
+            sites[result.site_name] = result
+
+    def done(self, username, site_name):
+        """Return whether the journal has a result for username on site."""
+        return site_name in self.results.get(username, ())
+
+    def write(self, result):
+        """Write Result.
+
+        Appends the result to the journal, unless it is already done.
+
+        Keyword Arguments:
+        self                   -- This object.
+        result                 -- Object of type QueryResult().
+
+        Return Value:
+        Nothing.
+        """
+
+        if self.done(result.username, result.site_name):
+            return
+
+        self.add(result)
+        self.file.write(json.dumps(result.to_dict()) + "\n")
+        self.file.flush()
+        if monotonic() - self.synced >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Force the journal to disk."""
+        os.fsync(self.file.fileno())
+        self.synced = monotonic()
+
+    def close(self):
+        """Force the journal to disk and close it."""
+        if self.file.closed:
+            return
+        self.file.flush()
+        self.sync()
+        self.file.close()
+
+
+class QueryNotifyJournal(QueryNotify):
+    """Query Notify Journal Object.
+
+    Query notify class that appends every result to a ScanJournal().
+    """
+
+    def __init__(self, journal, result=None):
+        """Create Query Notify Journal Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        journal                -- ScanJournal() object to write to.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result)
+        self.journal = journal
+
+    def update(self, result):
+        self.result = result
+        self.journal.write(result)
+
+
+class QueryNotifyResume(QueryNotify):
+    """Query Notify Resume Object.
+
+    Query notify class that passes every notification on, and when the
+    queries for a username start, first notifies the results the journal
+    already has for it.
+    """
+
+    def __init__(self, query_notify, replay, result=None):
+        """Create Query Notify Resume Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        query_notify           -- Object with base type of QueryNotify() to
+                                  pass the notifications on to.
+        replay                 -- Dictionary of the results to notify for
+                                  each username, keyed by site.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result)
+        self.query_notify = query_notify
+        self.replay = replay
+
+    def start(self, message=None):
+        self.query_notify.start(message)
+        for result in self.replay.get(message, {}).values():
+            self.query_notify.update(result)
+
+    def update(self, result):
+        self.result = result
+        self.query_notify.update(result)
+
+    def finish(self, message=None):
+        if message is None:
+            self.query_notify.finish()
+        else:
+            self.query_notify.finish(message)
+
+
+def resume_batch(usernames, site_data, query_notify, journal, run_batch, **options):
+    """Resume Batch.
+
+    Runs a batch, skipping the sites for which the journal already has a
+    result.  The journaled results are notified and returned as if they
+    had just been probed.
+
+    Keyword Arguments:
+    usernames              -- List of strings indicating usernames.
+    site_data              -- Dictionary containing all of the site data.
+    query_notify           -- Object with base type of QueryNotify().
+    journal                -- ScanJournal() object with the results done.
+    run_batch              -- Function running the batch, such as
+                              sherlock_batch().
+
+    The other arguments are passed on to run_batch.
+
+    Return Value:
+    Generator of (username, results) tuples, in the order of usernames, as
+    for sherlock_batch().  Journaled results have no response body.
+    """
+
+    replay = {
+        username: {
+            site_name: journal.results[username][site_name]
+            for site_name in site_data
+            if journal.done(username, site_name)
+        }
+        for username in usernames
+    }
+    notify = QueryNotifyResume(query_notify, replay)
+
+    # Usernames next to each other with the same sites left to probe are run
+    # in one batch.  Usually only the few usernames in flight when the scan
+    # was interrupted have some sites left.
+    groups = []
+    for username in usernames:
+        remaining = tuple(site_name for site_name in site_data if site_name not in replay[username])
+        if groups and groups[-1][0] == remaining:
+            groups[-1][1].append(username)
+        else:
+            groups.append((remaining, [username]))
+
+    for remaining, group in groups:
+        if remaining:
+            batch = run_batch(
+                group, {site_name: site_data[site_name] for site_name in remaining}, notify, **options
+            )
+        else:
+            batch = []
+            for username in group:
+                notify.start(username)
+                batch.append((username, {}))
+
+        for username, results in batch:
+            for site_name, result in replay[username].items():
+                results[site_name] = {
+                    "url_main": site_data[site_name].get("urlMain"),
+                    "url_user": result.site_url_user,
+                    "status": result,
+                    "http_status": result.http_status,
+                    "response_text": None,
+                }
+            yield username, {
+                site_name: results[site_name] for site_name in site_data if site_name in results
+            }
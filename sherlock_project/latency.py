@@ -0,0 +1,217 @@
+"""Sherlock Latency Module
+
+This module keeps the response times of recent probes of each site in a
+local SQLite database, and derives from them how long to wait for each
+site, so that a dead host does not hold a scan open for the full timeout
+while sites which are known to be slow still get the time they need.
+"""
+import os
+import threading
+from collections import deque
+from time import time
+
+from sherlock_project.cache import cache_dir
+
+
+# Number of response times kept for each site.
+MAX_SAMPLES = 200
+
+# Number of response times needed before the timeout of a site is derived
+# from them.  Until then, the timeout given by the caller applies.
+MIN_SAMPLES = 10
+
+# Percentile of the response times which the timeout is derived from.
+DEFAULT_PERCENTILE = 99
+
+# Multiple of that percentile to wait for.
+DEFAULT_MULTIPLIER = 3.0
+
+# Shortest timeout ever derived, in seconds, so that a site which usually
+# answers at once is not given up on after a single slow response.
+DEFAULT_FLOOR = 2.0
+
+
+def default_latency_path():
+    """Default location of the latency database."""
+    return os.path.join(cache_dir(), "latency.sqlite3")
+
+
+def percentile(samples, percent):
+    """Percentile.
+
+    Keyword Arguments:
+    samples                -- Iterable of numbers.
+    percent                -- Number between 0 and 100.
+
+    Return Value:
+    The smallest sample which at least percent of the samples are not
+    greater than (the nearest-rank method).
+    """
+
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+class LatencyStats:
+    def __init__(
+        self,
+        path=None,
+        percent=DEFAULT_PERCENTILE,
+        multiplier=DEFAULT_MULTIPLIER,
+        floor=DEFAULT_FLOOR,
+        ceiling=None,
+    ):
+        """Create Latency Stats Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        path                   -- String containing the path of the database
+                                  file, or None for default_latency_path().
+                                  The special path ":memory:" keeps the
+                                  response times in memory only.
+        percent                -- Percentile of the response times of a site
+                                  which its timeout is derived from.
+                                  Default is DEFAULT_PERCENTILE.
+        multiplier             -- Multiple of the percentile to wait for.
+                                  Default is DEFAULT_MULTIPLIER.
+        floor                  -- Shortest timeout, in seconds.
+                                  Default is DEFAULT_FLOOR.
+        ceiling                -- Longest timeout, in seconds, or None for the
+                                  timeout given by the caller of timeout().
+
+        Return Value:
+        Nothing.
+        """
+
+        # Imported here, so that runs without latency stats do not pay for it.
+        import sqlite3
+
+        if path is None:
+            path = default_latency_path()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.percent = percent
+        self.multiplier = multiplier
+        self.floor = floor
+        self.ceiling = ceiling
+        self.lock = threading.Lock()
+        # Recent response times of each site, oldest first.
+        self.samples = {}
+        # Timeouts derived so far, dropped when a site gets a new sample.
+        self.timeouts = {}
+        self.recorded = set()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            if path != ":memory:":
+                self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS latency ("
+                " site TEXT NOT NULL,"
+                " at REAL NOT NULL,"
+                " seconds REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS latency_by_site ON latency (site, at)"
+            )
+            for site, seconds in self.connection.execute(
+                "SELECT site, seconds FROM latency ORDER BY at"
+            ):
+                self.samples.setdefault(site, deque(maxlen=MAX_SAMPLES)).append(seconds)
+
+        return
+
+    def timeout(self, site_name, default):
+        """Timeout Of Site.
+
+        Keyword Arguments:
+        self                   -- This object.
+        site_name              -- String identifying the site.
+        default                -- Time in seconds to wait for sites without
+                                  enough response times, which is also the
+                                  longest timeout unless a ceiling was given.
+
+        Return Value:
+        Time in seconds to wait for the site: the multiple of the percentile
+        of its response times, within the floor and the ceiling.
+        """
+
+        timeout = self.timeouts.get(site_name)
+        if timeout is None:
+            with self.lock:
+                samples = list(self.samples.get(site_name, ()))
+            if len(samples) < MIN_SAMPLES:
+                return default
+            timeout = max(percentile(samples, self.percent) * self.multiplier, self.floor)
+            self.timeouts[site_name] = timeout
+
+        return min(timeout, default if self.ceiling is None else self.ceiling)
+
+    def record(self, site_name, seconds):
+        """Record Response Time.
+
+        The response time is written, but only committed by commit().  Only
+        responses and timeouts (see record_timeout()) are recorded:  probes
+        which failed otherwise say little about how long the site takes to
+        answer.
+
+        Keyword Arguments:
+        self                   -- This object.
+        site_name              -- String identifying the site.
+        seconds                -- Response time in seconds.
+
+        Return Value:
+        Nothing.
+        """
+
+        with self.lock:
+            self.samples.setdefault(site_name, deque(maxlen=MAX_SAMPLES)).append(seconds)
+            self.timeouts.pop(site_name, None)
+            self.recorded.add(site_name)
+            self.connection.execute(
+                "INSERT INTO latency VALUES (?, ?, ?)", (site_name, time(), seconds)
+            )
+
+        return
+
+    def record_timeout(self, site_name, seconds):
+        """Record Timeout.
+
+        Records a probe which timed out as a response time of the timeout
+        it was given, which the site took at least.  Otherwise a site whose
+        timeout was derived from fast responses, and which then slows down,
+        would time out from then on without ever getting a longer timeout:
+        each timeout raises the percentile, and so the timeout, instead.
+
+        Keyword Arguments:
+        self                   -- This object.
+        site_name              -- String identifying the site.
+        seconds                -- Timeout of the probe in seconds.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.record(site_name, seconds)
+
+        return
+
+    def commit(self):
+        """Commit the response times recorded since the last commit."""
+        with self.lock:
+            self.connection.commit()
+
+    def close(self):
+        """Commit, drop all but the latest MAX_SAMPLES of each site, and close."""
+        with self.lock:
+            self.connection.executemany(
+                "DELETE FROM latency WHERE rowid IN (SELECT rowid FROM latency"
+                " WHERE site = ? ORDER BY at DESC LIMIT -1 OFFSET ?)",
+                [(site, MAX_SAMPLES) for site in self.recorded],
+            )
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,382 @@
+"""Sherlock Manifest Module
+
+This module compiles the site manifest (data.json), together with the list
+of exclusions, into a compact file which is validated once when it is built.
+The compiled manifest is memory-mapped when loaded, and the entry of a site
+is only parsed when that site is used, so a run which only checks a few
+sites does not pay for all of them.
+
+A compiled manifest can be built ahead of time with
+
+    python -m sherlock_project.manifest data.json -o data.sherlock
+
+and given to Sherlock in place of data.json.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from argparse import ArgumentParser
+from functools import cached_property
+from urllib.parse import urlsplit
+
+from sherlock_project.checks import SiteCheck
+
+
+# Compiled manifests start with MAGIC and the version of their format, then
+# the length of the index which follows the header.  The index holds what
+# sites are selected by (flags, error types, host and tags), so that they
+# can be selected without parsing their entries.  The entries of the sites
+# follow the index, each as compact JSON.  The version is raised whenever the
+# layout changes, and files of other versions are rejected (the cache of
+# compiled manifests simply builds them again).
+MAGIC = b"SHERLOCK"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sHI")
+
+# Flags of sites in the index of a compiled manifest.
+FLAG_NSFW = 1
+FLAG_EXCLUDED = 2
+
+# Attributes every entry of the manifest must have.
+REQUIRED_ATTRIBUTES = ("urlMain", "url", "username_claimed")
+
+# Number of compiled manifests kept in the cache, newest first.
+MAX_CACHED_MANIFESTS = 8
+
+
+def build_manifest(site_data, exclusions=(), source=None):
+    """Build Manifest.
+
+    Keyword Arguments:
+    site_data              -- Dictionary of the manifest, as parsed from
+                              data.json.  The "$schema" key is ignored.
+    exclusions             -- Iterable of the names of sites known to give
+                              false positives.  These are flagged rather
+                              than left out, so that they can still be
+                              selected when loading the manifest.
+    source                 -- String describing where the manifest came
+                              from, for error messages.
+
+    Return Value:
+    Bytes of the compiled manifest.
+
+    NOTE:  Will raise a ValueError if an entry of the manifest is missing
+           an attribute, or cannot be compiled into a SiteCheck().  Entries
+           which are not objects are skipped with a warning, as they always
+           have been.
+    """
+
+    exclusions = set(exclusions)
+    index = []
+    entries = []
+    offset = 0
+
+    for site_name, information in site_data.items():
+        if site_name == "$schema":
+            continue
+        try:
+            if not isinstance(information, dict):
+                raise TypeError(site_name)
+            for attribute in REQUIRED_ATTRIBUTES:
+                if attribute not in information:
+                    raise KeyError(attribute)
+            # Compiled here only to validate the entry.
+            SiteCheck(site_name, information)
+        except KeyError as error:
+            raise ValueError(
+                f"Problem parsing json contents at '{source}':  Missing attribute {error}."
+            )
+        except TypeError:
+            print(f"Encountered TypeError parsing json contents for target '{site_name}' at {source}\nSkipping target.\n", file=sys.stderr)
+            continue
+
+        flags = 0
+        if information.get("isNSFW", False):
+            flags |= FLAG_NSFW
+        if site_name in exclusions:
+            flags |= FLAG_EXCLUDED
+
+        error_types = information["errorType"]
+        if isinstance(error_types, str):
+            error_types = [error_types]
+        tags = information.get("tags", [])
+        if isinstance(tags, str):
+            tags = [tags]
+        host = urlsplit(information["urlMain"]).hostname or ""
+
+        entry = json.dumps(information, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        index.append([site_name, offset, len(entry), flags, error_types, host, tags])
+        entries.append(entry)
+        offset += len(entry)
+
+    index = json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    return HEADER.pack(MAGIC, FORMAT_VERSION, len(index)) + index + b"".join(entries)
+
+
+def is_compiled(data):
+    """Return True if data (bytes) starts like a compiled manifest."""
+    return data[:len(MAGIC)] == MAGIC
+
+
+class CompiledManifest:
+    def __init__(self, data, source=None):
+        """Create Compiled Manifest Object.
+
+        Only the header and the index are read here.  The entries of the
+        sites are parsed by information(), when they are needed.
+
+        Keyword Arguments:
+        self                   -- This object.
+        data                   -- Bytes or mmap of the compiled manifest.
+        source                 -- String describing where the manifest came
+                                  from, for error messages.
+
+        Return Value:
+        Nothing.
+
+        NOTE:  Will raise a ValueError if data is not a compiled manifest, or
+               was compiled with another version of the format.
+        """
+
+        if len(data) < HEADER.size or not is_compiled(data):
+            raise ValueError(f"'{source}' is not a compiled manifest.")
+        magic, version, index_length = HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                f"Compiled manifest '{source}' has format version {version}, "
+                f"but version {FORMAT_VERSION} is required.  Please build it again."
+            )
+
+        start = HEADER.size + index_length
+        try:
+            index = json.loads(bytes(data[HEADER.size:start]))
+        except ValueError as error:
+            raise ValueError(f"Problem parsing compiled manifest '{source}':  {error}.")
+
+        self.data = data
+        self.source = source
+        self.index = {
+            site_name: (start + offset, start + offset + length, flags,
+                        tuple(error_types), host, tuple(tags))
+            for site_name, offset, length, flags, error_types, host, tags in index
+        }
+
+        return
+
+    @classmethod
+    def open(cls, path):
+        """Open the compiled manifest at path, memory-mapping it."""
+        with open(path, "rb") as file:
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped.
+                data = file.read()
+
+        return cls(data, source=path)
+
+    def names(self):
+        """List of the names of all sites, in the order of the manifest."""
+        return list(self.index)
+
+    def flags(self, site_name):
+        """Flags of the site, a combination of FLAG_NSFW and FLAG_EXCLUDED."""
+        return self.index[site_name][2]
+
+    def information(self, site_name):
+        """Dictionary of the entry of the site in the manifest."""
+        begin, end = self.index[site_name][:2]
+        return json.loads(self.data[begin:end])
+
+    @cached_property
+    def positions(self):
+        """Dictionary of the position of each site in the manifest."""
+        return {site_name: position for position, site_name in enumerate(self.index)}
+
+    @cached_property
+    def indexes(self):
+        """Indexes.
+
+        Built the first time they are used, and shared by all selections
+        from this manifest.
+
+        Return Value:
+        Dictionary with the following keys, each of a dictionary of the
+        names of the sites with a given value:
+            name:            Case-folded site name, to a tuple of names.
+            error_type:      Error type, to a frozenset of names.
+            host:            Case-folded host name of the home page of the
+                             site, to a frozenset of names.
+            tag:             Case-folded tag, to a frozenset of names.
+        """
+
+        indexes = {"name": {}, "error_type": {}, "host": {}, "tag": {}}
+        for site_name, (begin, end, flags, error_types, host, tags) in self.index.items():
+            indexes["name"].setdefault(site_name.casefold(), []).append(site_name)
+            for error_type in error_types:
+                indexes["error_type"].setdefault(error_type, set()).add(site_name)
+            indexes["host"].setdefault(host.casefold(), set()).add(site_name)
+            for tag in tags:
+                indexes["tag"].setdefault(tag.casefold(), set()).add(site_name)
+
+        indexes["name"] = {key: tuple(names) for key, names in indexes["name"].items()}
+        for key in ("error_type", "host", "tag"):
+            indexes[key] = {value: frozenset(names) for value, names in indexes[key].items()}
+
+        return indexes
+
+    def __contains__(self, site_name):
+        return site_name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+
+def write_manifest(path, data):
+    """Write a compiled manifest beside path, and move it into place."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+
+
+def prune_manifests(directory, keep=MAX_CACHED_MANIFESTS):
+    """Remove all but the keep most recently used compiled manifests from directory.
+
+    load_manifest() touches a compiled manifest whenever it is used, so its
+    modification time is the time it was last used.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+
+    # Another process may remove a manifest while this one is looking, which
+    # must not stop the others from being pruned.
+    used = []
+    for name in names:
+        if not name.endswith(".sherlock"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            used.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    used.sort(reverse=True)
+    for _, path in used[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_manifest(content, exclusions, source, cache_directory):
+    """Load Manifest.
+
+    Loads data.json through the cache of compiled manifests, compiling it
+    only if it (or the list of exclusions) has changed since it was last
+    compiled.
+
+    Keyword Arguments:
+    content                -- Bytes of data.json.
+    exclusions             -- List of the names of sites known to give
+                              false positives.
+    source                 -- String describing where data.json came from,
+                              for error messages.
+    cache_directory        -- String containing the directory of the cache
+                              of compiled manifests, or None to compile in
+                              memory only.
+
+    Return Value:
+    CompiledManifest() object.
+
+    NOTE:  Will raise a ValueError if data.json cannot be parsed or is not
+           valid.
+    """
+
+    key = hashlib.sha256(struct.pack("<H", FORMAT_VERSION))
+    key.update(content)
+    key.update(b"\0" + "\n".join(exclusions).encode("utf-8"))
+    path = None
+    if cache_directory is not None:
+        path = os.path.join(cache_directory, key.hexdigest()[:32] + ".sherlock")
+        try:
+            manifest = CompiledManifest.open(path)
+        except (OSError, ValueError):
+            pass
+        else:
+            try:
+                # Marks the manifest as used, so that it is pruned last.
+                os.utime(path)
+            except OSError:
+                pass
+            return manifest
+
+    try:
+        site_data = json.loads(content)
+    except Exception as error:
+        raise ValueError(f"Problem parsing json contents at '{source}':  {error}.")
+    if not isinstance(site_data, dict):
+        raise ValueError(f"Problem parsing json contents at '{source}':  Not a JSON object.")
+
+    data = build_manifest(site_data, exclusions, source)
+    if path is not None:
+        try:
+            write_manifest(path, data)
+            prune_manifests(cache_directory)
+        except OSError:
+            # The cache is only an optimisation.
+            pass
+
+    return CompiledManifest(data, source=source)
+
+
+def main(args=None):
+    parser = ArgumentParser(
+        prog="python -m sherlock_project.manifest",
+        description="Compile the Sherlock site manifest for fast loading.",
+    )
+    parser.add_argument(
+        "json_file",
+        help="Path of the manifest (data.json) to compile.",
+    )
+    parser.add_argument(
+        "--exclusions", metavar="FILE",
+        help="Path of a list of sites known to give false positives, one per line.",
+    )
+    parser.add_argument(
+        "--output", "-o", metavar="FILE",
+        help="Path of the compiled manifest.  Default is the path of the "
+             "manifest, with the extension .sherlock.",
+    )
+    args = parser.parse_args(args)
+
+    exclusions = []
+    if args.exclusions:
+        with open(args.exclusions, "r", encoding="utf-8") as file:
+            exclusions = [line.strip() for line in file if line.strip()]
+
+    with open(args.json_file, "r", encoding="utf-8") as file:
+        try:
+            site_data = json.load(file)
+        except ValueError as error:
+            sys.exit(f"Problem parsing json contents at '{args.json_file}':  {error}.")
+
+    try:
+        data = build_manifest(site_data, exclusions, args.json_file)
+    except ValueError as error:
+        sys.exit(str(error))
+
+    output = args.output or os.path.splitext(args.json_file)[0] + ".sherlock"
+    write_manifest(output, data)
+    print(f"Compiled {len(CompiledManifest(data))} sites into '{output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""Sherlock Metrics Module
+
+This module keeps counters, gauges and histograms of the probes of scans,
+for monitoring Sherlock in production.  They are rendered in the
+OpenMetrics text format (or the older Prometheus text format), to be
+scraped over HTTP or written for the textfile collector of the Prometheus
+node exporter.
+
+    sherlock_probes_total{site,status}         Results, by site and status.
+                                               The WAF hit rate of a site is
+                                               its share of "WAF" results.
+    sherlock_cached_results_total{site}        Results taken from the cache
+                                               instead, which are not counted
+                                               otherwise.
+    sherlock_probe_errors_total{site,error}    Results with an error, by its
+                                               context, such as "Timeout
+                                               Error" or "Deadline Exceeded".
+    sherlock_response_body_bytes_total{site}   Bytes of response bodies read.
+    sherlock_probe_duration_seconds            Histogram of response times.
+    sherlock_probe_phase_seconds{phase}        Histogram of the time spent in
+                                               each phase of a probe, as
+                                               given by timing.PHASES.
+    sherlock_probes_waiting                    Probes waiting to be sent.
+    sherlock_probes_in_flight                  Probes being sent.
+    sherlock_pool_size                         Most probes in flight at a time.
+    sherlock_pool_saturation                   Probes in flight over the size
+                                               of the pool.
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sherlock_project.result import QueryStatus
+
+
+# Address which metrics are served on by default.
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+# Upper bounds of the buckets of the histograms, in seconds.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Seconds between writes of the textfile.
+DEFAULT_WRITE_INTERVAL = 15.0
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value):
+    """Escape a label value for the text formats."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    """Format a tuple of (name, value) pairs as the labels of a sample."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    """Format the value of a sample."""
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Create Histogram Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        buckets                -- Sorted tuple of the upper bounds of the
+                                  buckets.  Default is DEFAULT_BUCKETS.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.buckets = buckets
+        # Observations of each bucket on its own, and over the last one.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+        return
+
+    def observe(self, value):
+        """Count a value in its bucket."""
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+
+    def samples(self, name, labels=()):
+        """Return the (name, labels, value) samples of the histogram."""
+        samples = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            samples.append((f"{name}_bucket", labels + (("le", format_value(float(bound))),), total))
+        samples.append((f"{name}_count", labels, total))
+        samples.append((f"{name}_sum", labels, self.sum))
+        return samples
+
+
+class ScanMetrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Create Scan Metrics Object.
+
+        Fed by the engines, which count every result and the bytes read as
+        they go, and keep track of the probes in flight.  One object may be
+        shared by any number of scans, on any threads.
+
+        Keyword Arguments:
+        self                   -- This object.
+        buckets                -- Sorted tuple of the upper bounds of the
+                                  buckets of the histograms, in seconds.
+                                  Default is DEFAULT_BUCKETS.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.probes = {}
+        self.cached = {}
+        self.errors = {}
+        self.body_bytes = {}
+        self.duration = Histogram(buckets)
+        self.phases = {}
+        # Timers of the probes which have been submitted and not finished.
+        self.pending = set()
+        self.pool_size = None
+
+        return
+
+    def observe(self, result, body_bytes=None):
+        """Observe Result.
+
+        Keyword Arguments:
+        self                   -- This object.
+        result                 -- QueryResult() of a probe.
+        body_bytes             -- Integer number of bytes of the response body
+                                  which were read, or None if unknown.
+
+        Return Value:
+        Nothing.
+        """
+
+        site = result.site_name
+        with self.lock:
+            if result.cached:
+                self.cached[site] = self.cached.get(site, 0) + 1
+                return
+            key = (site, str(result.status))
+            self.probes[key] = self.probes.get(key, 0) + 1
+            if result.status == QueryStatus.UNKNOWN:
+                key = (site, result.context or "")
+                self.errors[key] = self.errors.get(key, 0) + 1
+            if body_bytes is not None:
+                self.body_bytes[site] = self.body_bytes.get(site, 0) + body_bytes
+            if result.query_time is not None:
+                self.duration.observe(result.query_time)
+            for phase, seconds in (result.timings or {}).items():
+                if seconds is not None:
+                    if phase not in self.phases:
+                        self.phases[phase] = Histogram(self.buckets)
+                    self.phases[phase].observe(seconds)
+
+        return
+
+    def track(self, future):
+        """Track Probe.
+
+        Counts the probe of the future as waiting until its ProbeTimer()
+        shows that it has been sent, and as in flight until it is done.
+
+        Keyword Arguments:
+        self                   -- This object.
+        future                 -- Future or task of a probe, with the timer
+                                  attribute given to it by submit_probes().
+
+        Return Value:
+        Nothing.
+        """
+
+        timer = getattr(future, "timer", None)
+        if timer is None:
+            return
+        with self.lock:
+            self.pending.add(timer)
+
+        def finished(future):
+            with self.lock:
+                self.pending.discard(timer)
+
+        future.add_done_callback(finished)
+
+    def samples(self):
+        """Samples.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        List of (name, type, help, samples) tuples of each metric family,
+        where samples is a list of (sample name, labels, value) tuples.
+        """
+
+        with self.lock:
+            in_flight = sum(1 for timer in self.pending if timer.started is not None)
+            waiting = len(self.pending) - in_flight
+            families = [
+                ("sherlock_probes", "counter", "Results of probes, by site and status.", [
+                    ("sherlock_probes_total", (("site", site), ("status", status)), count)
+                    for (site, status), count in sorted(self.probes.items())
+                ]),
+                ("sherlock_cached_results", "counter", "Results taken from the cache, by site.", [
+                    ("sherlock_cached_results_total", (("site", site),), count)
+                    for site, count in sorted(self.cached.items())
+                ]),
+                ("sherlock_probe_errors", "counter", "Results of probes which failed, by site and error.", [
+                    ("sherlock_probe_errors_total", (("site", site), ("error", error)), count)
+                    for (site, error), count in sorted(self.errors.items())
+                ]),
+                ("sherlock_response_body_bytes", "counter", "Bytes of response bodies read, by site.", [
+                    ("sherlock_response_body_bytes_total", (("site", site),), count)
+                    for site, count in sorted(self.body_bytes.items())
+                ]),
+                ("sherlock_probe_duration_seconds", "histogram", "Response times of probes.",
+                 self.duration.samples("sherlock_probe_duration_seconds")),
+                ("sherlock_probe_phase_seconds", "histogram", "Time spent in each phase of probes.", [
+                    sample
+                    for phase, histogram in sorted(self.phases.items())
+                    for sample in histogram.samples("sherlock_probe_phase_seconds", (("phase", phase),))
+                ]),
+                ("sherlock_probes_waiting", "gauge", "Probes waiting to be sent.", [
+                    ("sherlock_probes_waiting", (), waiting),
+                ]),
+                ("sherlock_probes_in_flight", "gauge", "Probes being sent.", [
+                    ("sherlock_probes_in_flight", (), in_flight),
+                ]),
+            ]
+            if self.pool_size:
+                families += [
+                    ("sherlock_pool_size", "gauge", "Most probes in flight at a time.", [
+                        ("sherlock_pool_size", (), self.pool_size),
+                    ]),
+                    ("sherlock_pool_saturation", "gauge", "Probes in flight over the size of the pool.", [
+                        ("sherlock_pool_saturation", (), in_flight / self.pool_size),
+                    ]),
+                ]
+
+        return families
+
+    def render(self, openmetrics=True):
+        """Render Metrics.
+
+        Keyword Arguments:
+        self                   -- This object.
+        openmetrics            -- Boolean indicating if the OpenMetrics text
+                                  format should be used, rather than the
+                                  Prometheus text format (version 0.0.4),
+                                  which the textfile collector reads.
+                                  Default is True.
+
+        Return Value:
+        String of the metrics in the text format.
+        """
+
+        lines = []
+        for name, kind, text, samples in self.samples():
+            if kind == "counter" and not openmetrics:
+                # The older format names counters after their samples.
+                name += "_total"
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample, labels, value in samples:
+                lines.append(f"{sample}{format_labels(labels)} {format_value(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Write the metrics to a file for the textfile collector, in one go."""
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(self.render(openmetrics=False))
+        # Replaced at once, so that the collector never reads half a file.
+        os.replace(temporary, path)
+
+
+class TextfileWriter:
+    def __init__(self, metrics, path, interval=DEFAULT_WRITE_INTERVAL):
+        """Create Textfile Writer Object.
+
+        Writes the metrics to a file every interval seconds in the
+        background, from start() until stop(), which writes them once more.
+
+        Keyword Arguments:
+        self                   -- This object.
+        metrics                -- ScanMetrics() to write.
+        path                   -- String containing the path of the file, which
+                                  should end in ".prom" for the collector.
+        interval               -- Seconds between writes.
+                                  Default is DEFAULT_WRITE_INTERVAL.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+        return
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.metrics.write_textfile(self.path)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="sherlock-metrics", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.metrics.write_textfile(self.path)
+
+
+def send_metrics(handler, metrics):
+    """Send Metrics.
+
+    Keyword Arguments:
+    handler                -- BaseHTTPRequestHandler() of the request.
+    metrics                -- ScanMetrics() to send.
+
+    Return Value:
+    Nothing.  The metrics are sent in the OpenMetrics text format if the
+    request accepts it, and in the Prometheus text format otherwise.
+    """
+
+    openmetrics = "application/openmetrics-text" in handler.headers.get("Accept", "")
+    body = metrics.render(openmetrics).encode("utf-8")
+    handler.send_response(200)
+    handler.send_header(
+        "Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+    )
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the metrics of a MetricsServer() at /metrics."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        send_metrics(self, self.server.metrics)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """HTTP server of the metrics of a scan, for as long as the scan runs."""
+
+    daemon_threads = True
+
+    def __init__(self, server_address, metrics):
+        super().__init__(server_address, MetricsRequestHandler)
+        self.metrics = metrics
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="sherlock-metrics", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -4,11 +4,14 @@ This module defines the objects for notifying the caller about the
 results of queries.
 """
 from sherlock_project.result import QueryStatus
+from sherlock_project.latency import percentile
+from sherlock_project.timing import PHASES
 from colorama import Fore, Style
-import webbrowser
-
-# Global variable to count the number of results.
-globvar = 0
+from time import monotonic
+import csv
+import json
+import os
+import sys
 
 
 class QueryNotify:
@@ -132,6 +135,9 @@ class QueryNotifyPrint(QueryNotify):
         self.verbose = verbose
         self.print_all = print_all
         self.browse = browse
+        # Number of results counted by countResults().  It is kept with the
+        # object, so that scans which run at the same time count their own.
+        self.results_count = 0
 
 
     def start(self, message):
@@ -169,9 +175,8 @@ class QueryNotifyPrint(QueryNotify):
         Return Value:
         The number of results by the time we call the function.
         """
-        global globvar
-        globvar += 1
-        return globvar
+        self.results_count += 1
+        return self.results_count
 
     def update(self, result):
         """Notify Update.
@@ -189,7 +194,9 @@ class QueryNotifyPrint(QueryNotify):
         self.result = result
 
         response_time_text = ""
-        if self.result.query_time is not None and self.verbose is True:
+        if self.result.cached:
+            response_time_text = " [cached]"
+        elif self.result.query_time is not None and self.verbose is True:
             response_time_text = f" [{round(self.result.query_time * 1000)}ms]"
 
         # Output to the terminal is desired.
@@ -204,6 +211,8 @@ class QueryNotifyPrint(QueryNotify):
                   Style.RESET_ALL +
                   f"{self.result.site_url_user}")
             if self.browse:
+                import webbrowser
+
                 webbrowser.open(self.result.site_url_user, 2)
 
         elif result.status == QueryStatus.AVAILABLE:
@@ -277,3 +286,480 @@ class QueryNotifyPrint(QueryNotify):
         Nicely formatted string to get information about this object.
         """
         return str(self.result)
+
+
+class QueryNotifyMultiple(QueryNotify):
+    """Query Notify Multiple Object.
+
+    Query notify class that passes every notification on to several other
+    query notify objects, so that results can be printed and written to
+    files from the same stream of results.
+    """
+
+    def __init__(self, notifiers, result=None):
+        """Create Query Notify Multiple Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        notifiers              -- List of objects with base type of
+                                  QueryNotify(), notified in that order.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result)
+        self.notifiers = notifiers
+
+    def start(self, message=None):
+        for notifier in self.notifiers:
+            notifier.start(message)
+
+    def update(self, result):
+        self.result = result
+        for notifier in self.notifiers:
+            notifier.update(result)
+
+    def finish(self, message=None):
+        for notifier in self.notifiers:
+            if message is None:
+                notifier.finish()
+            else:
+                notifier.finish(message)
+
+
+class QueryNotifyFile(QueryNotify):
+    """Query Notify File Object.
+
+    Base class for query notify classes that write a report file for each
+    username.  The report for a username is opened when its queries start,
+    written to as each result arrives, and closed when the queries for the
+    next username start, or when all queries are finished.
+    """
+
+    extension = "txt"
+
+    def __init__(self, result=None, output=None, folderoutput=None):
+        """Create Query Notify File Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+        output                 -- String containing the file to write the
+                                  report to, for a single username.
+        folderoutput           -- String containing the folder to write the
+                                  reports to, named after each username.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result)
+        self.output = output
+        self.folderoutput = folderoutput
+        self.username = None
+
+    def path(self, username):
+        """Path Of Report.
+
+        Keyword Arguments:
+        self                   -- This object.
+        username               -- String containing username of the report.
+
+        Return Value:
+        String containing the path of the report file for the username.
+        """
+
+        if self.output:
+            return self.output
+
+        result_file = f"{username}.{self.extension}"
+        if self.folderoutput:
+            # The usernames results should be stored in a targeted folder.
+            # If the folder doesn't exist, create it first
+            os.makedirs(self.folderoutput, exist_ok=True)
+            result_file = os.path.join(self.folderoutput, result_file)
+
+        return result_file
+
+    def start(self, message=None):
+        self.close()
+        self.username = message
+        self.open(self.path(message))
+
+    def finish(self, message=None):
+        self.close()
+
+    def open(self, path):
+        """Open the report for self.username at path."""
+
+    def close(self):
+        """Close the report of the current username, if there is one."""
+
+
+class QueryNotifyTXT(QueryNotifyFile):
+    """Query Notify TXT Object.
+
+    Query notify class that writes the URL of every claimed account to a
+    text file, followed by the number of accounts found.
+    """
+
+    def open(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.exists_counter = 0
+
+    def update(self, result):
+        self.result = result
+        if result.status == QueryStatus.CLAIMED:
+            self.exists_counter += 1
+            self.file.write(result.site_url_user + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.username is None:
+            return
+        self.file.write(f"Total Websites Username Detected On : {self.exists_counter}\n")
+        self.file.close()
+        self.username = None
+
+
+class QueryNotifyCSV(QueryNotifyFile):
+    """Query Notify CSV Object.
+
+    Query notify class that writes a row for each result to a
+    Comma-Separated Values (CSV) file.
+    """
+
+    extension = "csv"
+    fieldnames = [
+        "username",
+        "name",
+        "url_main",
+        "url_user",
+        "exists",
+        "http_status",
+        "response_time_s",
+    ]
+
+    def __init__(self, site_data, result=None, folderoutput=None, print_all=False,
+                 print_found=True, timings=False):
+        """Create Query Notify CSV Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        site_data              -- Dictionary containing all of the site data.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+        folderoutput           -- String containing the folder to write the
+                                  reports to, named after each username.
+        print_all              -- Boolean indicating whether to write all
+                                  sites, including not found.
+        print_found            -- Boolean indicating whether to only write
+                                  sites where the username was found.
+        timings                -- Boolean indicating whether to add a column
+                                  with the seconds spent in each phase of the
+                                  query, such as "connect_s".
+                                  Default is False.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result, folderoutput=folderoutput)
+        self.site_data = site_data
+        self.print_all = print_all
+        self.print_found = print_found
+        self.timings = timings
+        if timings:
+            self.fieldnames = self.fieldnames + [f"{phase}_s" for phase in PHASES]
+
+    def include(self, result):
+        """Return whether the result should be written to the report."""
+        return not (
+            self.print_found
+            and not self.print_all
+            and result.status != QueryStatus.CLAIMED
+        )
+
+    def row(self, result):
+        """Return the list of column values of the result."""
+        if result.status == QueryStatus.ILLEGAL:
+            url_user = ""
+            http_status = ""
+        else:
+            url_user = result.site_url_user
+            http_status = result.http_status
+
+        response_time_s = result.query_time
+        if response_time_s is None:
+            response_time_s = ""
+
+        row = [
+            result.username,
+            result.site_name,
+            self.site_data[result.site_name].get("urlMain"),
+            url_user,
+            str(result.status),
+            http_status,
+            response_time_s,
+        ]
+        if self.timings:
+            timings = result.timings or {}
+            row += ["" if timings.get(phase) is None else timings[phase] for phase in PHASES]
+
+        return row
+
+    def open(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.fieldnames)
+
+    def update(self, result):
+        self.result = result
+        if self.include(result):
+            self.writer.writerow(self.row(result))
+            self.file.flush()
+
+    def close(self):
+        if self.username is None:
+            return
+        self.file.close()
+        self.username = None
+
+
+class QueryNotifyXLSX(QueryNotifyCSV):
+    """Query Notify XLSX Object.
+
+    Query notify class that writes the results to the standard file for the
+    modern Microsoft Excel spreadsheet (xlsx).  The rows are written as the
+    results arrive, and the file is saved once the username is done.
+    """
+
+    extension = "xlsx"
+    # Columns whose URLs are made into links.
+    link_columns = ("url_main", "url_user")
+
+    def __init__(self, site_data, result=None, print_all=False, print_found=True,
+                 timings=False):
+        super().__init__(site_data, result, print_all=print_all, print_found=print_found,
+                         timings=timings)
+
+    def open(self, path):
+        # Imported here, as openpyxl takes longer to import than most scans
+        # take to start, and only this output needs it.
+        from openpyxl import Workbook
+
+        self.file = path
+        # Rows of a write-only workbook are kept in a temporary file rather
+        # than in memory until it is saved.
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("sheet1")
+        self.sheet.append(self.fieldnames)
+        self.links = [self.fieldnames.index(name) for name in self.link_columns]
+
+    def update(self, result):
+        self.result = result
+        if self.include(result):
+            row = self.row(result)
+            for index in self.links:
+                row[index] = f'=HYPERLINK("{row[index]}")'
+            self.sheet.append(row)
+
+    def close(self):
+        if self.username is None:
+            return
+        self.workbook.save(self.file)
+        self.username = None
+
+
+class QueryNotifyNDJSON(QueryNotify):
+    """Query Notify NDJSON Object.
+
+    Query notify class that writes every result as a line of JSON (the
+    NDJSON or JSON Lines format) as soon as it arrives, so that the results
+    of a scan can be consumed as a stream.  The results of every username
+    go to the same stream.
+    """
+
+    def __init__(self, result=None, output="-"):
+        """Create Query Notify NDJSON Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+        output                 -- String containing the path of the file to
+                                  write the results to, or "-" to write them
+                                  to the standard output.  An open text file
+                                  may be given instead.
+                                  Default is "-".
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result)
+        if output == "-":
+            self.file = sys.stdout
+            self.owned = False
+        elif isinstance(output, str):
+            self.file = open(output, "w", encoding="utf-8")
+            self.owned = True
+        else:
+            self.file = output
+            self.owned = False
+
+    def update(self, result):
+        """Write the result as a record with the fields of QueryResult.to_dict()."""
+        self.result = result
+        self.file.write(json.dumps(result.to_dict()) + "\n")
+        self.file.flush()
+
+    def finish(self, message=None):
+        if self.owned and not self.file.closed:
+            self.file.close()
+
+
+class QueryNotifyTimings(QueryNotify):
+    """Query Notify Timings Object.
+
+    Query notify class that gathers the timings of every query of a scan,
+    and sums them up by phase, so that it shows where the time of the scan
+    went.  Results without timings, such as cached ones, are left out.
+    """
+
+    def __init__(self, result=None, output=None):
+        """Create Query Notify Timings Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+        output                 -- String containing the path of the JSON file
+                                  to write the summary() to once the scan is
+                                  finished, or None to not write it.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result)
+        self.output = output
+        self.queries = 0
+        self.samples = {phase: [] for phase in PHASES}
+        # Probes may be sent before the first start(), so the scan is
+        # timed from here.
+        self.started = monotonic()
+        self.finished = None
+
+    def update(self, result):
+        self.result = result
+        if result.timings is None:
+            return
+        self.queries += 1
+        for phase in PHASES:
+            seconds = result.timings.get(phase)
+            if seconds is not None:
+                self.samples[phase].append(seconds)
+
+    def finish(self, message=None):
+        self.finished = monotonic()
+        if self.output:
+            with open(self.output, "w", encoding="utf-8") as file:
+                json.dump(self.summary(), file, indent=2)
+
+    def summary(self):
+        """Summary Of Timings.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Dictionary with the number of timed queries, the seconds that the
+        scan took since this object was created, and for each phase:  the
+        number of queries which went through it, and the total, mean,
+        median, 95th and 99th percentile and maximum seconds spent in it.
+        The seconds of the scan are None until it is finished.
+        """
+
+        phases = {}
+        for phase, samples in self.samples.items():
+            if not samples:
+                phases[phase] = {"count": 0}
+                continue
+            total = sum(samples)
+            phases[phase] = {
+                "count": len(samples),
+                "total": total,
+                "mean": total / len(samples),
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+                "max": max(samples),
+            }
+
+        seconds = None
+        if self.finished is not None:
+            seconds = self.finished - self.started
+
+        return {"queries": self.queries, "seconds": seconds, "phases": phases}
+
+    def __str__(self):
+        """Convert Object To String.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Table of the time spent in each phase, in milliseconds.
+        """
+        summary = self.summary()
+        lines = [f"Timings of {summary['queries']} queries (ms)"]
+        lines.append(f"{'phase':<10}  {'count':>6}  {'mean':>8}  {'p50':>8}  {'p95':>8}  "
+                     f"{'p99':>8}  {'max':>8}  {'total':>10}")
+        for phase, measures in summary["phases"].items():
+            if not measures["count"]:
+                lines.append(f"{phase:<10}  {0:>6}")
+                continue
+            lines.append(
+                f"{phase:<10}  {measures['count']:>6}"
+                + "".join(f"  {measures[name] * 1000:>8.1f}"
+                          for name in ("mean", "p50", "p95", "p99", "max"))
+                + f"  {measures['total'] * 1000:>10.1f}"
+            )
+        if summary["seconds"] is not None:
+            lines.append(f"Scan took {summary['seconds']:.2f}s")
+
+        return "\n".join(lines)
+
+
+class QueryNotifyMetrics(QueryNotify):
+    """Query Notify Metrics Object.
+
+    Query notify class that counts every result in a ScanMetrics(), for
+    results which do not come straight from an engine, such as those of
+    scans split between processes or machines.
+    """
+
+    def __init__(self, metrics, result=None):
+        """Create Query Notify Metrics Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        metrics                -- ScanMetrics() to count the results in.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result)
+        self.metrics = metrics
+
+    def update(self, result):
+        self.result = result
+        self.metrics.observe(result)
@@ -0,0 +1,329 @@
+"""Sherlock Profiling Module
+
+This module profiles scans, so that a scan which has become slower (after
+an update of the site data, say) can be looked into without patching the
+code.  A ScanProfiler() captures, while it is active:
+
+    profile.pstats     cProfile statistics of the thread running the scan,
+                       for pstats, snakeviz and the like.
+    profile.txt        The functions of those which took the longest.
+    wallclock.folded   Stacks of every thread, sampled at a fixed interval,
+                       in the folded format of flamegraph.pl and speedscope.
+    wallclock.txt      The functions which the samples were taken in most.
+    memory.txt         The lines which allocated the most memory that was
+                       still held at the end, as traced by tracemalloc.
+    phases.json        Time spent in each phase of the scan, and how long
+                       the scan took, as also printed by the CLI.
+
+cProfile only sees the thread which runs the scan:  the requests of the
+threads engine are sent by worker threads, which are only seen by the
+wall-clock samples.
+"""
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from time import monotonic
+
+
+# Seconds between wall-clock samples.
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Number of entries in each of the text reports.
+REPORT_LENGTH = 40
+
+# Functions which mark the phases of a scan, by the file name of their
+# module and the name of their code, as other modules have functions of
+# the same names (SitesInformation.select, say).  The stack of a sample is
+# in the phase of the innermost of them on it.
+PHASE_FUNCTIONS = {
+    # Building and submitting the requests.
+    ("sherlock.py", "submit_probes"): "build",
+    ("aio.py", "schedule_probes"): "build",
+    ("sherlock.py", "prepare_request"): "build",
+    # Waiting for responses, with nothing else to do.
+    ("sherlock.py", "completed_by"): "wait",
+    ("sherlock.py", "get_response"): "wait",
+    ("selectors.py", "select"): "wait",
+    # Deciding the status from the response.
+    ("sherlock.py", "detect_status"): "detect",
+    ("checks.py", "feed"): "detect",
+    # Worker threads:  connecting, sending and reading responses.
+    ("connection.py", "_new_conn"): "connect",
+    ("connectionpool.py", "urlopen"): "send",
+    ("sherlock.py", "read_body"): "body",
+    ("thread.py", "_worker"): "idle",
+}
+
+# Phases which cProfile times, by the functions which make them up.  Only
+# the thread running the scan is profiled, so there are fewer of them.
+PROFILED_PHASES = {
+    "build": (("sherlock.py", "submit_probes"), ("aio.py", "schedule_probes")),
+    "wait": (("sherlock.py", "completed_by"), ("sherlock.py", "get_response"), ("selectors.py", "select")),
+    "detect": (("sherlock.py", "detect_status"),),
+}
+
+
+def phase_of(stack):
+    """Phase Of Stack.
+
+    Keyword Arguments:
+    stack                  -- List of the functions on a stack, outermost
+                              first, each a tuple of the file name of its
+                              module and its name.
+
+    Return Value:
+    String naming the phase of the scan that the stack is in, or "other".
+    """
+
+    for function in reversed(stack):
+        phase = PHASE_FUNCTIONS.get(function)
+        if phase is not None:
+            return phase
+
+    return "other"
+
+
+class ScanProfiler:
+    def __init__(
+        self,
+        directory,
+        sample_interval=DEFAULT_SAMPLE_INTERVAL,
+        cprofile=True,
+        memory=True,
+    ):
+        """Create Scan Profiler Object.
+
+        Used as a context manager around a scan, on the thread which runs
+        it, for example:
+
+            with ScanProfiler("reports") as profiler:
+                sherlock("user123", site_data, QueryNotify())
+            print(profiler)
+
+        Keyword Arguments:
+        self                   -- This object.
+        directory              -- String containing the path of the directory
+                                  to write the reports to.  It is created if
+                                  needed.
+        sample_interval        -- Seconds between wall-clock samples, or None
+                                  to not take any.
+                                  Default is DEFAULT_SAMPLE_INTERVAL.
+        cprofile               -- Boolean indicating if cProfile should
+                                  profile the thread.  Default is True.
+        memory                 -- Boolean indicating if allocations should be
+                                  traced.  This slows the scan down the most.
+                                  Default is True.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.cprofile = cprofile
+        self.memory = memory
+
+        self.profile = None
+        self.sampler = None
+        self.stopped = threading.Event()
+        # Number of samples of each stack, keyed by the thread name and the
+        # functions on the stack, outermost first.
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.seconds = None
+        self.phases = None
+
+        return
+
+    def start(self):
+        """Start profiling the current thread, and sampling all threads."""
+        # Imported here, as only profiled scans need them.
+        import cProfile
+        import tracemalloc
+
+        self.started = monotonic()
+        if self.memory:
+            tracemalloc.start()
+        if self.sample_interval is not None:
+            self.sampler = threading.Thread(target=self.sample, name="sherlock-profiler", daemon=True)
+            self.sampler.start()
+        if self.cprofile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+        return self
+
+    def sample(self):
+        """Sample the stacks of all other threads until stopped."""
+        names = {}
+        own = threading.get_ident()
+        while not self.stopped.wait(self.sample_interval):
+            frames = sys._current_frames()
+            if not frames.keys() <= names.keys():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[(names.get(ident, str(ident)), tuple(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        """Stop profiling, and write the reports."""
+        import tracemalloc
+
+        if self.profile is not None:
+            self.profile.disable()
+        self.seconds = monotonic() - self.started
+        if self.sampler is not None:
+            self.stopped.set()
+            self.sampler.join()
+
+        os.makedirs(self.directory, exist_ok=True)
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.write_memory(snapshot, current, peak)
+        if self.profile is not None:
+            self.write_profile()
+        if self.sampler is not None:
+            self.write_samples()
+
+        self.phases = {
+            "seconds": self.seconds,
+            "profiled": self.profiled_phases(),
+            "sampled": self.sampled_phases(),
+        }
+        with open(self.path("phases.json"), "w", encoding="utf-8") as file:
+            json.dump(self.phases, file, indent=2)
+
+        return
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def path(self, name):
+        """Path of the report with the given file name."""
+        return os.path.join(self.directory, name)
+
+    def write_profile(self):
+        import pstats
+
+        self.profile.dump_stats(self.path("profile.pstats"))
+        with open(self.path("profile.txt"), "w", encoding="utf-8") as file:
+            stats = pstats.Stats(self.profile, stream=file)
+            stats.sort_stats("cumulative").print_stats(REPORT_LENGTH)
+            stats.sort_stats("tottime").print_stats(REPORT_LENGTH)
+
+    def write_samples(self):
+        with open(self.path("wallclock.folded"), "w", encoding="utf-8") as file:
+            for (thread, stack), count in self.stacks.most_common():
+                file.write(";".join((thread,) + stack) + f" {count}\n")
+
+        # Samples which each function was on the stack in, and at the top of.
+        total = Counter()
+        own = Counter()
+        for (_, stack), count in self.stacks.items():
+            for function in set(stack):
+                total[function] += count
+            if stack:
+                own[stack[-1]] += count
+        with open(self.path("wallclock.txt"), "w", encoding="utf-8") as file:
+            file.write(f"{self.samples} samples of all threads, every {self.sample_interval}s\n\n")
+            for title, counter in (("On the stack", total), ("At the top of the stack", own)):
+                file.write(f"{title}:\n")
+                for function, count in counter.most_common(REPORT_LENGTH):
+                    file.write(f"{count:>8}  {function}\n")
+                file.write("\n")
+
+    def write_memory(self, snapshot, current, peak):
+        with open(self.path("memory.txt"), "w", encoding="utf-8") as file:
+            file.write(f"Traced memory:  {current / 2 ** 20:.1f} MiB held at the end, "
+                       f"{peak / 2 ** 20:.1f} MiB at the peak\n\n")
+            for statistic in snapshot.statistics("lineno")[:REPORT_LENGTH]:
+                file.write(f"{statistic}\n")
+
+    def profiled_phases(self):
+        """Dictionary of the seconds which cProfile timed in each phase, or None."""
+        if self.profile is None:
+            return None
+
+        import pstats
+
+        stats = pstats.Stats(self.profile).stats
+        listed = {function for functions in PROFILED_PHASES.values() for function in functions}
+        phases = {}
+        for phase, functions in PROFILED_PHASES.items():
+            # Only the outermost calls of the listed functions count, so that
+            # a call made by another listed function, which is part of the
+            # phase of that function, is not counted twice.  cProfile already
+            # counts recursive calls once.
+            phases[phase] = sum(
+                cumulative - sum(
+                    caller_cumulative
+                    for (caller_file, _, caller), (_, _, _, caller_cumulative) in callers.items()
+                    if (os.path.basename(caller_file), caller) in listed
+                )
+                for (file, _, name), (_, _, _, cumulative, callers) in stats.items()
+                if (os.path.basename(file), name) in functions
+            )
+
+        return phases
+
+    def sampled_phases(self):
+        """Dictionary of the share of samples of each thread in each phase, or None."""
+        if self.sampler is None:
+            return None
+
+        phases = {}
+        for (thread, stack), count in self.stacks.items():
+            # Each function of a sample is "name (file:line)".
+            functions = [
+                (function.rsplit(" (", 1)[1].rsplit(":", 1)[0], function.split(" ", 1)[0])
+                for function in stack
+            ]
+            # Worker threads of a pool are counted together.
+            group = thread.rsplit("_", 1)[0] if thread.startswith("ThreadPoolExecutor") else thread
+            counter = phases.setdefault(group, Counter())
+            counter[phase_of(functions)] += count
+
+        return {
+            group: {phase: count / sum(counter.values()) for phase, count in counter.most_common()}
+            for group, counter in phases.items()
+        }
+
+    def __str__(self):
+        """Convert Object To String.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nicely formatted summary of where the time of the scan went.
+        """
+        if self.phases is None:
+            return "Profiling has not finished."
+
+        lines = [f"Profiled {self.seconds:.2f}s, reports written to {self.directory}"]
+        if self.phases["profiled"] is not None:
+            lines.append("Scan thread:  " + ", ".join(
+                f"{phase} {seconds:.2f}s" for phase, seconds in self.phases["profiled"].items()
+            ))
+        for group, shares in (self.phases["sampled"] or {}).items():
+            lines.append(f"{group}:  " + ", ".join(
+                f"{phase} {share:.0%}" for phase, share in shares.items()
+            ))
+
+        return "\n".join(lines)
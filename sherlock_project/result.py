@@ -2,6 +2,7 @@
 
 This module defines various objects for recording the results of queries.
 """
+import threading
 from enum import Enum
 
 
@@ -33,7 +34,8 @@ class QueryResult():
     Describes result of query about a given username.
     """
     def __init__(self, username, site_name, site_url_user, status,
-                 query_time=None, context=None):
+                 query_time=None, context=None, http_status=None, cached=False,
+                 timings=None):
         """Create Query Result Object.
 
         Contains information about a specific method of detecting usernames on
@@ -57,6 +59,17 @@ class QueryResult():
                                   an error, this might indicate the type of
                                   error that occurred.
                                   Default of None.
+        http_status            -- HTTP status code of the response to the
+                                  query, or "?" if there was no response.
+                                  Default of None (no query was made).
+        cached                 -- Boolean indicating that the result was
+                                  taken from the result cache rather than
+                                  from a new query.
+                                  Default of False.
+        timings                -- Dictionary of the seconds spent in each
+                                  phase of the query, keyed by the names in
+                                  timing.PHASES, as given by ProbeTimer().
+                                  Default of None (not measured).
 
         Return Value:
         Nothing.
@@ -68,9 +81,63 @@ class QueryResult():
         self.status        = status
         self.query_time    = query_time
         self.context       = context
+        self.http_status   = http_status
+        self.cached        = cached
+        self.timings       = timings
 
         return
 
+    def to_dict(self):
+        """Convert Object To Dictionary.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Dictionary of the result, which can be serialized as JSON.  The
+        status is given by its value, such as "Claimed", and the HTTP
+        status is None rather than "?" if there was no response.
+        """
+        return {
+            "username": self.username,
+            "site": self.site_name,
+            "url": self.site_url_user,
+            "status": str(self.status),
+            "http_status": None if self.http_status == "?" else self.http_status,
+            "query_time": self.query_time,
+            "context": self.context,
+            "cached": self.cached,
+            "timings": self.timings,
+        }
+
+    @classmethod
+    def from_dict(cls, record):
+        """Create Query Result Object From Dictionary.
+
+        Keyword Arguments:
+        cls                    -- This class.
+        record                 -- Dictionary as returned by to_dict().
+
+        Return Value:
+        QueryResult() object.
+        """
+        status = QueryStatus(record["status"])
+        http_status = record.get("http_status")
+        if http_status is None and status is not QueryStatus.ILLEGAL:
+            # A query was made, but there was no response.
+            http_status = "?"
+        return cls(
+            username=record["username"],
+            site_name=record["site"],
+            site_url_user=record["url"],
+            status=status,
+            query_time=record.get("query_time"),
+            context=record.get("context"),
+            http_status=http_status,
+            cached=record.get("cached", False),
+            timings=record.get("timings"),
+        )
+
     def __str__(self):
         """Convert Object To String.
 
@@ -87,3 +154,74 @@ class QueryResult():
             status += f" ({self.context})"
 
         return status
+
+
+# Default number of bytes of response bodies kept by a BodyRetention().
+DEFAULT_MAX_RETAINED_BYTES = 64 * 1024 * 1024
+
+
+class BodyRetention():
+    """Body Retention Object.
+
+    Keeps count of the response bodies kept in the results of scans, so
+    that together they stay within a size limit.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_RETAINED_BYTES):
+        """Create Body Retention Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        max_bytes              -- Maximum number of bytes of response bodies
+                                  to keep in total.
+                                  Default of DEFAULT_MAX_RETAINED_BYTES.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.max_bytes     = max_bytes
+        self.kept          = 0
+        self.kept_bytes    = 0
+        self.dropped       = 0
+        self.dropped_bytes = 0
+        self.lock          = threading.Lock()
+
+        return
+
+    def keep(self, body):
+        """Keep Body.
+
+        Keyword Arguments:
+        self                   -- This object.
+        body                   -- Bytes of a response body.
+
+        Return Value:
+        The body if it fits within the limit, in which case it is counted
+        against it, or None if it does not.
+        """
+        with self.lock:
+            if self.kept_bytes + len(body) > self.max_bytes:
+                self.dropped += 1
+                self.dropped_bytes += len(body)
+                return None
+
+            self.kept += 1
+            self.kept_bytes += len(body)
+
+        return body
+
+    def __str__(self):
+        """Convert Object To String.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nicely formatted string to get information about this object.
+        """
+        report = f"Kept {self.kept} response bodies ({self.kept_bytes} bytes)"
+        if self.dropped:
+            report += (f", dropped {self.dropped} ({self.dropped_bytes} bytes)"
+                       f" over the limit of {self.max_bytes} bytes")
+
+        return report
@@ -0,0 +1,134 @@
+"""Sherlock Scheduler Module
+
+This module keeps the probes of a scan within the configured concurrency
+limits, so that no single host is sent more requests at once than it is
+allowed.
+"""
+import threading
+from collections import deque
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+
+def host_of(url):
+    """Host Of URL.
+
+    Keyword Arguments:
+    url                    -- String containing URL.
+
+    Return Value:
+    String identifying the host (and port, if any) which the URL points at.
+    """
+
+    return urlsplit(url).netloc.lower()
+
+
+class ProbeScheduler:
+    def __init__(self, session, max_per_host=None):
+        """Create Probe Scheduler Object.
+
+        Wraps a SherlockFuturesSession() so that at most max_per_host
+        requests to any one host are submitted to its thread pool at a
+        time.  Requests over that limit wait in a queue for their host,
+        without occupying a worker thread, and are submitted as earlier
+        requests to the same host complete.  The global limit is the
+        number of workers of the session itself.
+
+        Keyword Arguments:
+        self                   -- This object.
+        session                -- SherlockFuturesSession() to send requests with.
+        max_per_host           -- Maximum number of requests in flight to a
+                                  single host.  None for no limit.
+                                  Default is None.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.session = session
+        self.max_per_host = max_per_host
+        self.lock = threading.Lock()
+        self.active = {}
+        self.waiting = {}
+
+        return
+
+    def request(self, method, url, **kwargs):
+        """Request URL.
+
+        Keyword Arguments:
+        self                   -- This object.
+        method                 -- String containing method desired for request.
+        url                    -- String containing URL for request.
+        kwargs                 -- Keyword arguments for the session's request.
+
+        Return Value:
+        Future which resolves to the response.  It may be cancelled for as
+        long as the request is still waiting for its host.
+        """
+
+        future = Future()
+        host = host_of(url)
+        probe = (future, host, method, url, kwargs)
+
+        with self.lock:
+            if self.max_per_host is None or self.active.get(host, 0) < self.max_per_host:
+                self.active[host] = self.active.get(host, 0) + 1
+            else:
+                self.waiting.setdefault(host, deque()).append(probe)
+                return future
+
+        if not self._start(probe):
+            self._release(host)
+
+        return future
+
+    def _start(self, probe):
+        """Start Probe.
+
+        Submits a probe which holds a slot of its host to the session.
+
+        Return Value:
+        Boolean indicating if the probe is now in flight.  If it is not, the
+        slot of its host is still held and must be released by the caller.
+        """
+        future, host, method, url, kwargs = probe
+
+        if not future.set_running_or_notify_cancel():
+            # Cancelled while waiting for its host.
+            return False
+
+        try:
+            inner = self.session.request(method, url=url, **kwargs)
+        except Exception as error:
+            future.set_exception(error)
+            return False
+
+        inner.add_done_callback(lambda inner: self._finish(future, host, inner))
+
+        return True
+
+    def _finish(self, future, host, inner):
+        """Pass the outcome of a request on, and release its host slot."""
+        try:
+            future.set_result(inner.result())
+        except BaseException as error:
+            future.set_exception(error)
+        self._release(host)
+
+    def _release(self, host):
+        """Give the slot of a finished request to the next one for its host."""
+        while True:
+            with self.lock:
+                waiting = self.waiting.get(host)
+                if not waiting:
+                    self.active[host] -= 1
+                    return
+                probe = waiting.popleft()
+
+            if self._start(probe):
+                return
+
+    def close(self):
+        """Close the underlying session."""
+        self.session.close()
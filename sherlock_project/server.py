@@ -0,0 +1,501 @@
+"""Sherlock Server Module
+
+This module runs Sherlock as a long-lived HTTP service.  The site data is
+loaded, and the checks compiled, once when the service starts, and all
+scans share one pool of warm connections.  Results are streamed back as
+they arrive, as newline-delimited JSON or as server-sent events.
+
+    POST /scan      Scan one or more usernames.  The body is a JSON object:
+                      username   String, or
+                      usernames  List of strings, to scan.
+                      sites      List of site names to limit the scan to.
+                                 Default is all sites.
+                      nsfw       Boolean indicating if NSFW sites should be
+                                 scanned when no sites are given.
+                                 Default is false.
+                      timeout    Seconds to wait for each site.
+                    Each QueryResult is sent as a JSON object, one per line
+                    (application/x-ndjson), or as a "result" event, followed
+                    by a "done" event, if text/event-stream is accepted.
+    GET /health     Status of the service, as a JSON object.
+    GET /metrics    Metrics of the scans run so far, in the OpenMetrics text
+                    format if it is accepted, and in the Prometheus text
+                    format otherwise.  See the metrics module.
+"""
+import json
+import os
+import signal
+import sys
+import threading
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from sherlock_project.__init__ import __longname__
+from sherlock_project.cache import ResultCache
+from sherlock_project.fetch import DEFAULT_MAX_AGE
+from sherlock_project.metrics import ScanMetrics
+from sherlock_project.metrics import send_metrics
+from sherlock_project.scheduler import ProbeScheduler
+from sherlock_project.sherlock import DEFAULT_MAX_WORKERS
+from sherlock_project.sherlock import check_for_parameter
+from sherlock_project.sherlock import create_session
+from sherlock_project.sherlock import iter_batch
+from sherlock_project.sherlock import multiple_usernames
+from sherlock_project.sherlock import non_negative_int_check
+from sherlock_project.sherlock import positive_int_check
+from sherlock_project.sherlock import timeout_check
+from sherlock_project.sites import SitesInformation
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8642
+
+# Default number of scans which run at the same time, and which may wait
+# for one of them to finish before further scans are turned away.
+DEFAULT_MAX_SCANS = 4
+DEFAULT_MAX_QUEUED = 16
+
+# Default number of seconds for which running scans may finish when the
+# service is asked to shut down.
+DEFAULT_SHUTDOWN_GRACE = 30
+
+# Largest request body accepted, in bytes.
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+class ServiceUnavailable(Exception):
+    """Raised when the service cannot take on another scan."""
+
+
+class ScanService:
+    def __init__(
+        self,
+        sites,
+        max_scans=DEFAULT_MAX_SCANS,
+        max_queued=DEFAULT_MAX_QUEUED,
+        max_in_flight=DEFAULT_MAX_WORKERS,
+        max_per_host=None,
+        timeout=60,
+        proxy=None,
+        cache=None,
+    ):
+        """Create Scan Service Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        sites                  -- SitesInformation() object of the sites
+                                  which may be scanned.  Their checks are
+                                  compiled here, once.
+        max_scans              -- Maximum number of scans running at a time.
+        max_queued             -- Maximum number of scans waiting for one of
+                                  the running scans to finish.  Further
+                                  scans are refused.
+        max_in_flight          -- Maximum number of requests in flight
+                                  across all scans.
+        max_per_host           -- Maximum number of requests in flight to
+                                  any single host, across all scans.  None
+                                  for no limit.
+        timeout                -- Default time in seconds to wait for each
+                                  site.
+        proxy                  -- String indicating the proxy URL, or None.
+        cache                  -- ResultCache() shared by all scans, or None.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.sites = sites
+        self.site_data = {site.name: site.check for site in sites}
+        self.session = ProbeScheduler(
+            create_session(self.site_data, max_workers=max_in_flight),
+            max_per_host=max_per_host,
+        )
+        self.max_scans = max_scans
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.proxy = proxy
+        self.cache = cache
+        self.metrics = ScanMetrics()
+        self.metrics.pool_size = self.session.session.max_workers
+
+        self.condition = threading.Condition()
+        self.running = 0
+        self.queued = 0
+        self.closing = False
+        # Set once the grace period of a shutdown is over, to stop the
+        # scans which are still running.
+        self.cancelled = threading.Event()
+
+        return
+
+    @contextmanager
+    def slot(self):
+        """Slot.
+
+        Context manager which holds one of the slots for running scans,
+        waiting in the queue for one if all are taken.
+
+        NOTE:  Will raise ServiceUnavailable if the queue is full, or the
+               service is shutting down.
+        """
+
+        with self.condition:
+            if self.closing:
+                raise ServiceUnavailable("The service is shutting down.")
+            if self.running >= self.max_scans:
+                if self.queued >= self.max_queued:
+                    raise ServiceUnavailable("Too many scans are waiting, try again later.")
+                self.queued += 1
+                try:
+                    self.condition.wait_for(
+                        lambda: self.running < self.max_scans or self.closing
+                    )
+                finally:
+                    self.queued -= 1
+                if self.closing:
+                    raise ServiceUnavailable("The service is shutting down.")
+            self.running += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.condition.notify_all()
+
+    def prepare(self, job):
+        """Prepare Scan.
+
+        Keyword Arguments:
+        self                   -- This object.
+        job                    -- Dictionary of the scan, as described in
+                                  the documentation of this module.
+
+        Return Value:
+        Tuple of the list of usernames, the dictionary of SiteCheck()
+        objects of the sites to scan, and the timeout.
+
+        NOTE:  Will raise a ValueError if the job is not valid.
+        """
+
+        if not isinstance(job, dict):
+            raise ValueError("The scan must be a JSON object.")
+
+        usernames = job.get("usernames", [job["username"]] if "username" in job else None)
+        if (not isinstance(usernames, list) or not usernames
+                or not all(isinstance(username, str) and username for username in usernames)):
+            raise ValueError("Give a username, or a list of usernames, to scan.")
+        expanded = []
+        for username in usernames:
+            if check_for_parameter(username):
+                expanded.extend(multiple_usernames(username))
+            else:
+                expanded.append(username)
+
+        names = job.get("sites")
+        if names:
+            if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+                raise ValueError("Sites must be a list of site names.")
+            selected = self.sites.select(names=names)
+            found = {site_name.casefold() for site_name in selected}
+            missing = [f"'{name}'" for name in names if name.casefold() not in found]
+            if missing:
+                raise ValueError(f"Desired sites not found: {', '.join(missing)}.")
+        else:
+            selected = self.sites.select(nsfw=None if job.get("nsfw") else False)
+
+        timeout = job.get("timeout", self.timeout)
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError("Timeout must be a positive number of seconds.")
+
+        return expanded, {site_name: self.site_data[site_name] for site_name in selected}, timeout
+
+    def scan(self, usernames, site_data, timeout=None):
+        """Scan.
+
+        Keyword Arguments:
+        self                   -- This object.
+        usernames              -- List of strings indicating usernames to
+                                  scan for.
+        site_data              -- Dictionary of SiteCheck() objects of the
+                                  sites to scan.
+        timeout                -- Time in seconds to wait for each site, or
+                                  None for the default of the service.
+
+        Return Value:
+        Generator of QueryResult() objects, in the order they complete.  It
+        stops early if the service is shut down before the scan finishes.
+        """
+
+        batch = iter_batch(
+            usernames,
+            site_data,
+            cache=self.cache,
+            proxy=self.proxy,
+            timeout=timeout or self.timeout,
+            session=self.session,
+            metrics=self.metrics,
+        )
+        try:
+            for username, stream, results_total in batch:
+                for result in stream:
+                    if self.cancelled.is_set():
+                        return
+                    yield result
+        finally:
+            batch.close()
+
+    def status(self):
+        """Dictionary of the status of the service."""
+        with self.condition:
+            return {
+                "status": "closing" if self.closing else "ok",
+                "sites": len(self.site_data),
+                "running": self.running,
+                "queued": self.queued,
+                "max_scans": self.max_scans,
+                "max_queued": self.max_queued,
+            }
+
+    def close(self, grace=DEFAULT_SHUTDOWN_GRACE):
+        """Close.
+
+        Turns away new and queued scans, and gives the running scans up to
+        grace seconds to finish before stopping them.  The connections of
+        the service are closed once the scans are over.
+
+        Keyword Arguments:
+        self                   -- This object.
+        grace                  -- Number of seconds to wait for running
+                                  scans.
+
+        Return Value:
+        Nothing.
+        """
+
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+            finished = self.condition.wait_for(lambda: self.running == 0, timeout=grace)
+
+        if not finished:
+            # Stopped at their next result.
+            self.cancelled.set()
+            with self.condition:
+                self.condition.wait_for(lambda: self.running == 0, timeout=grace)
+
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+        return
+
+
+class ScanRequestHandler(BaseHTTPRequestHandler):
+    """Handles the requests of the HTTP API of a ScanService()."""
+
+    server_version = "Sherlock"
+
+    def send_json(self, status, document, headers=None):
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self.send_json(200, self.server.service.status())
+        elif path == "/metrics":
+            send_metrics(self, self.server.service.metrics)
+        else:
+            self.send_json(404, {"error": "Not found."})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/scan":
+            self.send_json(404, {"error": "Not found."})
+            return
+
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError("Invalid Content-Length.")
+            if length > MAX_REQUEST_SIZE:
+                self.send_json(413, {"error": "The scan is too large."})
+                return
+            job = json.loads(self.rfile.read(length) or b"null")
+            usernames, site_data, timeout = service.prepare(job)
+        except ValueError as error:
+            self.send_json(400, {"error": str(error)})
+            return
+
+        events = (parse_qs(url.query).get("format") == ["sse"]
+                  or "text/event-stream" in self.headers.get("Accept", ""))
+
+        try:
+            with service.slot():
+                self.stream(service.scan(usernames, site_data, timeout), events)
+        except ServiceUnavailable as error:
+            self.send_json(503, {"error": str(error)}, {"Retry-After": "5"})
+
+    def stream(self, results, events):
+        """Stream the results of a scan, until it finishes or the client goes away."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if events else "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        count = 0
+        try:
+            for result in results:
+                record = json.dumps(result.to_dict())
+                if events:
+                    self.wfile.write(f"event: result\ndata: {record}\n\n".encode("utf-8"))
+                else:
+                    self.wfile.write(f"{record}\n".encode("utf-8"))
+                self.wfile.flush()
+                count += 1
+            if events:
+                done = json.dumps({"results": count})
+                self.wfile.write(f"event: done\ndata: {done}\n\n".encode("utf-8"))
+        except ConnectionError:
+            # The client went away, so the rest of the scan is not needed.
+            pass
+        finally:
+            results.close()
+
+
+class ScanServer(ThreadingHTTPServer):
+    """HTTP server of a ScanService(), handling each request on its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, server_address, service):
+        super().__init__(server_address, ScanRequestHandler)
+        self.service = service
+
+
+def main(args=None):
+    parser = ArgumentParser(
+        description=f"{__longname__}, as a service which streams scan results over HTTP.",
+    )
+    parser.add_argument(
+        "--host", default=DEFAULT_HOST,
+        help=f"Address to listen on (Default: {DEFAULT_HOST}).",
+    )
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT,
+        help=f"Port to listen on (Default: {DEFAULT_PORT}).",
+    )
+    parser.add_argument(
+        "--json", "-j", metavar="JSON_FILE", dest="json_file", default=None,
+        help="Load data from a JSON file, a compiled manifest, or an online, valid, JSON file.",
+    )
+    parser.add_argument(
+        "--local", "-l", action="store_true", default=False,
+        help="Force the use of the local data.json file.",
+    )
+    parser.add_argument(
+        "--ignore-exclusions", action="store_true", dest="ignore_exclusions", default=False,
+        help="Ignore upstream exclusions (may return more false positives).",
+    )
+    parser.add_argument(
+        "--manifest-max-age", metavar="SECONDS", type=float, dest="manifest_max_age",
+        default=DEFAULT_MAX_AGE,
+        help=f"Seconds for which cached copies of the data file and exclusions are used without revalidating them (Default: {DEFAULT_MAX_AGE}).",
+    )
+    parser.add_argument(
+        "--max-scans", type=positive_int_check, default=DEFAULT_MAX_SCANS,
+        help=f"Maximum number of scans running at a time (Default: {DEFAULT_MAX_SCANS}).",
+    )
+    parser.add_argument(
+        "--max-queued", type=non_negative_int_check, default=DEFAULT_MAX_QUEUED,
+        help=f"Maximum number of scans waiting to run before further scans are refused (Default: {DEFAULT_MAX_QUEUED}).",
+    )
+    parser.add_argument(
+        "--max-in-flight", type=positive_int_check, default=DEFAULT_MAX_WORKERS,
+        help=f"Maximum number of requests in flight across all scans (Default: {DEFAULT_MAX_WORKERS}).",
+    )
+    parser.add_argument(
+        "--max-per-host", type=positive_int_check, default=None,
+        help="Maximum number of requests in flight to any single host (Default: no limit).",
+    )
+    parser.add_argument(
+        "--timeout", type=timeout_check, default=60,
+        help="Default time (in seconds) to wait for response to requests (Default: 60).",
+    )
+    parser.add_argument(
+        "--proxy", "-p", metavar="PROXY_URL", default=None,
+        help="Make requests over a proxy. e.g. socks5://127.0.0.1:1080",
+    )
+    parser.add_argument(
+        "--cache", metavar="PATH", nargs="?", const="", default=None,
+        help="Reuse recent results from a local cache instead of probing again, "
+             "optionally at PATH (Default: off).",
+    )
+    parser.add_argument(
+        "--shutdown-grace", metavar="SECONDS", type=float, default=DEFAULT_SHUTDOWN_GRACE,
+        help=f"Seconds for which running scans may finish when shutting down (Default: {DEFAULT_SHUTDOWN_GRACE}).",
+    )
+    args = parser.parse_args(args)
+
+    try:
+        if args.local:
+            sites = SitesInformation(
+                os.path.join(os.path.dirname(__file__), "resources/data.json"),
+                honor_exclusions=False,
+            )
+        else:
+            sites = SitesInformation(
+                data_file_path=args.json_file,
+                honor_exclusions=not args.ignore_exclusions,
+                max_age=args.manifest_max_age,
+            )
+    except Exception as error:
+        print(f"ERROR:  {error}")
+        sys.exit(1)
+
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(args.cache or None)
+
+    service = ScanService(
+        sites,
+        max_scans=args.max_scans,
+        max_queued=args.max_queued,
+        max_in_flight=args.max_in_flight,
+        max_per_host=args.max_per_host,
+        timeout=args.timeout,
+        proxy=args.proxy,
+        cache=cache,
+    )
+    server = ScanServer((args.host, args.port), service)
+
+    def stop():
+        service.close(args.shutdown_grace)
+        server.shutdown()
+
+    def shutdown(signal_received, frame):
+        # The server cannot be shut down from the thread which serves it.
+        print("Shutting down, waiting for running scans.")
+        threading.Thread(target=stop, name="sherlock-shutdown").start()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    host, port = server.server_address[:2]
+    print(f"Serving {len(service.site_data)} sites on http://{host}:{port}/")
+    server.serve_forever()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
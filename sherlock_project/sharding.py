@@ -0,0 +1,332 @@
+"""Sherlock Sharding Module
+
+This module spreads the work of a scan over several processes, so that
+reading, decoding and searching response bodies is not held to a single
+core by the global interpreter lock.  Each process scans its own shard
+with its own connection pool, and the results are merged back into one
+stream, which notifies the caller just as sherlock_batch() does.
+"""
+import multiprocessing
+import os
+import queue as queue_module
+import traceback
+from time import time
+
+from sherlock_project.cache import ResultCache
+from sherlock_project.latency import LatencyStats
+from sherlock_project.notify import QueryNotify
+from sherlock_project.notify import QueryNotifyMetrics
+from sherlock_project.notify import QueryNotifyMultiple
+from sherlock_project.result import BodyRetention
+from sherlock_project.scheduler import host_of
+from sherlock_project.sherlock import body_retention
+from sherlock_project.sherlock import sherlock_batch
+
+
+# Ways in which the work of a scan may be split between processes.
+SHARD_BY = ["site", "username"]
+
+# Number of seconds to wait for the next message from the workers before
+# checking that they are all still alive.
+POLL_INTERVAL = 1.0
+
+# Number of seconds to wait for the workers to exit once they are done,
+# as they commit the cache and latency stats on the way out.
+EXIT_TIMEOUT = 30.0
+
+
+def plan_shards(usernames, site_data, shards, shard_by="site"):
+    """Plan Shards.
+
+    Keyword Arguments:
+    usernames              -- List of strings indicating usernames to scan.
+    site_data              -- Dictionary of the sites to scan.
+    shards                 -- Maximum number of shards.
+    shard_by               -- String indicating how to split the work:
+                              "site" gives each shard all usernames on a
+                              part of the sites, "username" gives each shard
+                              all sites for a part of the usernames.
+                              Default is "site".
+
+    Return Value:
+    List of (username indexes, site names) tuples, one per shard.  Empty
+    shards are left out.  When sharding by site, all sites of a host are
+    kept in the same shard, so that a limit on the requests in flight to
+    a host holds across shards.  Hosts with the most sites are placed
+    first, each in the shard with the fewest sites so far.
+    """
+
+    if shard_by == "site":
+        hosts = {}
+        for site_name, net_info in site_data.items():
+            host = host_of(net_info.get("urlProbe") or net_info["url"])
+            hosts.setdefault(host, []).append(site_name)
+
+        plan = [[] for _ in range(shards)]
+        for site_names in sorted(hosts.values(), key=len, reverse=True):
+            min(plan, key=len).extend(site_names)
+        indexes = list(range(len(usernames)))
+        return [(indexes, site_names) for site_names in plan if site_names]
+
+    elif shard_by == "username":
+        plan = [list(range(len(usernames)))[shard::shards] for shard in range(shards)]
+        return [(indexes, list(site_data)) for indexes in plan if indexes]
+
+    raise ValueError(f"Unknown way to shard '{shard_by}'. Expected one of {', '.join(SHARD_BY)}.")
+
+
+class QueryNotifyShard(QueryNotify):
+    """Query Notify Shard Object.
+
+    Query notify class of the workers, which passes every result on to
+    the process which merges them.
+    """
+
+    def __init__(self, queue, shard, indexes, result=None):
+        """Create Query Notify Shard Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        queue                  -- Queue to put the results on.
+        shard                  -- Integer identifying the shard.
+        indexes                -- List of the indexes of the usernames of
+                                  the shard, in the order they are scanned.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__(result)
+        self.queue = queue
+        self.shard = shard
+        self.indexes = iter(indexes)
+        self.index = None
+
+        return
+
+    def start(self, message=None):
+        """Move on to the next username of the shard."""
+        self.index = next(self.indexes)
+
+    def update(self, result):
+        """Pass the result on to the merging process."""
+        self.queue.put(("result", self.shard, self.index, result))
+
+
+def run_shard(shard, indexes, usernames, site_data, options, queue):
+    """Run Shard.
+
+    Entry point of the worker processes.  Scans the usernames of the shard
+    on its sites, putting each result on the queue as it arrives, then the
+    results of each username once they are complete.
+
+    Keyword Arguments:
+    shard                  -- Integer identifying the shard.
+    indexes                -- List of the indexes of the usernames.
+    usernames              -- List of strings indicating usernames to scan.
+    site_data              -- Dictionary of the raw information of the
+                              sites of the shard.
+    options                -- Dictionary of keyword arguments of
+                              sherlock_batch(), where a kept bodies limit
+                              is given by "retained_bytes", the cache by
+                              "cache_path" and "cache_ttls", and the latency
+                              stats by "latency_path" and "latency_options".
+                              The deadline is given by "deadline_at", as
+                              returned by time.time(), as the workers start
+                              some time after the scan.
+    queue                  -- Queue to put the results on.
+
+    Return Value:
+    Nothing.
+    """
+
+    cache = None
+    latency = None
+    try:
+        retained_bytes = options.pop("retained_bytes", None)
+        if retained_bytes is not None:
+            options["keep_bodies"] = BodyRetention(retained_bytes)
+        cache_path = options.pop("cache_path", None)
+        cache_ttls = options.pop("cache_ttls", None)
+        if cache_path is not None:
+            cache = ResultCache(cache_path, ttls=cache_ttls)
+        latency_path = options.pop("latency_path", None)
+        latency_options = options.pop("latency_options", None)
+        if latency_path is not None:
+            latency = LatencyStats(latency_path, **latency_options)
+        deadline_at = options.pop("deadline_at", None)
+        if deadline_at is not None:
+            options["deadline"] = max(deadline_at - time(), 0)
+
+        notify = QueryNotifyShard(queue, shard, indexes)
+        batch = sherlock_batch(usernames, site_data, notify, cache=cache, latency=latency, **options)
+        for index, (username, results) in zip(indexes, batch):
+            queue.put(("done", shard, index, results))
+    except BaseException:
+        queue.put(("error", shard, None, traceback.format_exc()))
+    finally:
+        if cache is not None:
+            cache.close()
+        if latency is not None:
+            latency.close()
+
+
+def sherlock_sharded(
+    usernames,
+    site_data,
+    query_notify,
+    processes=None,
+    shard_by="site",
+    keep_bodies=False,
+    cache=None,
+    latency=None,
+    metrics=None,
+    **options,
+):
+    """Run Sherlock Analysis In Several Processes.
+
+    Splits the scan into shards, and runs each in a process of its own,
+    with its own connection pool.  max_in_flight applies to each process
+    on its own.  When sharding by username, so does max_per_host.
+
+    Keyword Arguments:
+    usernames              -- List of strings indicating usernames that
+                              reports should be created against.
+    site_data              -- Dictionary containing all of the site data.
+    query_notify           -- Object with base type of QueryNotify().
+    processes              -- Number of processes to run.  Default of None
+                              runs one for each CPU.
+    shard_by               -- String indicating how to split the work, see
+                              plan_shards().  Default is "site".
+    keep_bodies            -- As for sherlock(), with the limit on the size
+                              of the kept bodies applied as the results are
+                              merged.
+    cache                  -- ResultCache() whose database is opened by each
+                              process.  It must not be in memory.
+                              Default is None.
+    latency                -- LatencyStats() whose database is opened by each
+                              process.  It must not be in memory.
+                              Default is None.
+    metrics                -- ScanMetrics() to count the results in as they
+                              arrive.  The bytes read and the probes in
+                              flight stay with the workers, and are not
+                              counted.  Default is None.
+
+    The other arguments are the same as for sherlock_batch().
+
+    Return Value:
+    Generator of (username, results) tuples, in the order of usernames, as
+    for sherlock_batch().  The caller is notified about the results of one
+    username at a time.  Results of later usernames which arrive early are
+    held back until their username is reached.
+
+    NOTE:  Will raise a RuntimeError if a worker process fails.
+    """
+
+    usernames = list(usernames)
+    processes = processes or os.cpu_count() or 1
+    if metrics is not None:
+        query_notify = QueryNotifyMultiple([query_notify, QueryNotifyMetrics(metrics)])
+    retention = body_retention(keep_bodies)
+    if retention is not None:
+        options["retained_bytes"] = retention.max_bytes
+    if cache is not None:
+        if cache.path == ":memory:":
+            raise ValueError("An in-memory cache cannot be shared between processes.")
+        options["cache_path"] = cache.path
+        options["cache_ttls"] = cache.ttls
+    if latency is not None:
+        if latency.path == ":memory:":
+            raise ValueError("In-memory latency stats cannot be shared between processes.")
+        # Response times recorded so far must be seen by the workers.
+        latency.commit()
+        options["latency_path"] = latency.path
+        options["latency_options"] = {
+            "percent": latency.percent,
+            "multiplier": latency.multiplier,
+            "floor": latency.floor,
+            "ceiling": latency.ceiling,
+        }
+    if options.get("deadline") is not None:
+        options["deadline_at"] = time() + options.pop("deadline")
+
+    # Raw information travels to the workers, which compile it themselves.
+    site_data = {site_name: dict(net_info) for site_name, net_info in site_data.items()}
+    plan = plan_shards(usernames, site_data, processes, shard_by)
+
+    # Workers are started fresh rather than forked, as the caller may have
+    # threads (and locks held by them) which must not be copied.
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    workers = []
+    # Number of shards which have yet to complete each username.
+    outstanding = [0] * len(usernames)
+    for shard, (indexes, site_names) in enumerate(plan):
+        for index in indexes:
+            outstanding[index] += 1
+        worker = context.Process(
+            target=run_shard,
+            args=(
+                shard,
+                indexes,
+                [usernames[index] for index in indexes],
+                {site_name: site_data[site_name] for site_name in site_names},
+                options,
+                queue,
+            ),
+            name=f"sherlock-shard-{shard}",
+            daemon=True,
+        )
+        worker.start()
+        workers.append(worker)
+
+    def receive():
+        while True:
+            try:
+                return queue.get(timeout=POLL_INTERVAL)
+            except queue_module.Empty:
+                for worker in workers:
+                    if worker.exitcode not in (None, 0):
+                        raise RuntimeError(f"{worker.name} exited with code {worker.exitcode}.")
+
+    early = {}
+    results = {}
+    try:
+        for index, username in enumerate(usernames):
+            # Notify caller that we are starting the query.
+            query_notify.start(username)
+            for result in early.pop(index, []):
+                query_notify.update(result)
+
+            while outstanding[index]:
+                kind, shard, message_index, payload = receive()
+                if kind == "error":
+                    raise RuntimeError(f"Shard {shard} failed:\n{payload}")
+                elif kind == "result":
+                    if message_index == index:
+                        query_notify.update(payload)
+                    else:
+                        early.setdefault(message_index, []).append(payload)
+                elif kind == "done":
+                    results.setdefault(message_index, {}).update(payload)
+                    outstanding[message_index] -= 1
+
+            merged = results.pop(index, {})
+            if retention is not None:
+                for results_site in merged.values():
+                    if results_site.get("response_text"):
+                        results_site["response_text"] = retention.keep(results_site["response_text"])
+            yield username, {
+                site_name: merged[site_name] for site_name in site_data if site_name in merged
+            }
+
+        for worker in workers:
+            worker.join(EXIT_TIMEOUT)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        queue.close()
@@ -16,15 +16,16 @@ except ImportError:
     print("This is an outdated method. Please see https://sherlockproject.xyz/installation for up to date instructions.")
     sys.exit(1)
 
-import csv
 import signal
-import pandas as pd
+from collections import deque
+from concurrent.futures import as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import os
-import re
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 from json import loads as json_loads
-from time import monotonic
-from typing import Optional
+from time import monotonic, thread_time
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
 
 import requests
 from requests_futures.sessions import FuturesSession
@@ -32,15 +33,37 @@ from requests_futures.sessions import FuturesSession
 from sherlock_project.__init__ import (
     __longname__,
     __shortname__,
-    __version__,
-    forge_api_latest_release,
 )
 
 from sherlock_project.result import QueryStatus
 from sherlock_project.result import QueryResult
+from sherlock_project.result import BodyRetention
 from sherlock_project.notify import QueryNotify
 from sherlock_project.notify import QueryNotifyPrint
+from sherlock_project.notify import QueryNotifyMultiple
+from sherlock_project.notify import QueryNotifyTXT
+from sherlock_project.notify import QueryNotifyCSV
+from sherlock_project.notify import QueryNotifyXLSX
+from sherlock_project.notify import QueryNotifyTimings
+from sherlock_project.notify import QueryNotifyNDJSON
 from sherlock_project.sites import SitesInformation
+from sherlock_project.cache import ResultCache
+from sherlock_project.latency import LatencyStats
+from sherlock_project.metrics import ScanMetrics
+from sherlock_project.metrics import DEFAULT_METRICS_HOST
+from sherlock_project.fetch import DEFAULT_MAX_AGE
+from sherlock_project.update import UpdateCheck
+from sherlock_project.update import DEFAULT_UPDATE_INTERVAL
+from sherlock_project.scheduler import ProbeScheduler
+from sherlock_project.timing import ProbeTimer
+from sherlock_project.timing import TimedHTTPAdapter
+from sherlock_project.timing import TimedSession
+from sherlock_project.timing import current_timer
+from sherlock_project.checks import SiteCheck
+from sherlock_project.checks import BodyScanner
+from sherlock_project.checks import compile_site_data
+from sherlock_project.checks import interpolate_string  # noqa: F401
+from sherlock_project.checks import WAF_HIT_MSGS  # noqa: F401
 from colorama import init
 from argparse import ArgumentTypeError
 
@@ -50,7 +73,8 @@ class SherlockFuturesSession(FuturesSession):
         """Request URL.
 
         This extends the FuturesSession request method to calculate a response
-        time metric to each request.
+        time metric to each request, and to fill in the ProbeTimer() given
+        as the timer keyword argument, if any.
 
         It is taken (almost) directly from the following Stack Overflow answer:
         https://github.com/ross/requests-futures#working-in-the-background
@@ -71,6 +95,9 @@ class SherlockFuturesSession(FuturesSession):
         if hooks is None:
             hooks = {}
         start = monotonic()
+        if not isinstance(self.session, TimedSession):
+            # Only a TimedSession() knows what to do with a timer.
+            kwargs.pop("timer", None)
 
         def response_time(resp, *args, **kwargs):
             """Response Time Hook.
@@ -84,6 +111,9 @@ class SherlockFuturesSession(FuturesSession):
             Nothing.
             """
             resp.elapsed = monotonic() - start
+            timer = current_timer()
+            if timer is not None:
+                timer.responded()
 
             return
 
@@ -143,16 +173,6 @@ def get_response(request_future, error_type, social_network):
     return response, error_context, exception_text
 
 
-def interpolate_string(input_object, username):
-    if isinstance(input_object, str):
-        return input_object.replace("{}", username)
-    elif isinstance(input_object, dict):
-        return {k: interpolate_string(v, username) for k, v in input_object.items()}
-    elif isinstance(input_object, list):
-        return [interpolate_string(i, username) for i in input_object]
-    return input_object
-
-
 def check_for_parameter(username):
     """checks if {?} exists in the username
     if exist it means that sherlock is looking for more multiple username"""
@@ -170,87 +190,388 @@ def multiple_usernames(username):
     return allUsernames
 
 
-def sherlock(
-    username: str,
-    site_data: dict[str, dict[str, str]],
-    query_notify: QueryNotify,
-    dump_response: bool = False,
-    proxy: Optional[str] = None,
-    timeout: int = 60,
-) -> dict[str, dict[str, str | QueryResult]]:
-    """Run Sherlock Analysis.
+# Probe engines which may be selected by the caller.
+ENGINES = ["threads", "asyncio"]
 
-    Checks for existence of username on various social media sites.
+# Default number of requests in flight for the threads engine.
+DEFAULT_MAX_WORKERS = 20
+
+# Default number of requests in flight for the asyncio engine.
+DEFAULT_MAX_CONNECTIONS = 100
+
+# Number of bytes of a response body read at a time.
+BODY_CHUNK_SIZE = 16 * 1024
+
+
+def prepare_request(username, net_info):
+    """Prepare Request.
+
+    Works out everything needed to probe a single site for a username,
+    independent of the engine which will actually send the request.
 
     Keyword Arguments:
     username               -- String indicating username that report
                               should be created against.
-    site_data              -- Dictionary containing all of the site data.
-    query_notify           -- Object with base type of QueryNotify().
-                              This will be used to notify the caller about
-                              query results.
-    proxy                  -- String indicating the proxy URL
-    timeout                -- Time in seconds to wait before timing out request.
-                              Default is 60 seconds.
+    net_info               -- SiteCheck() object of the site.  Raw site
+                              information is compiled on the fly.
 
     Return Value:
-    Dictionary containing results from report. Key of dictionary is the name
-    of the social network site, and the value is another dictionary with
-    the following keys:
-        url_main:      URL of main site.
-        url_user:      URL of user on site (if account exists).
-        status:        QueryResult() object indicating results of test for
-                       account existence.
-        http_status:   HTTP status code of query which checked for existence on
-                       site.
-        response_text: Text that came back from request.  May be None if
-                       there was an HTTP error when checking for existence.
+    Dictionary with the following keys:
+        url_user:        URL of user on site (if account exists).
+        illegal:         Boolean indicating that the username does not
+                         satisfy the site's regexCheck, in which case no
+                         request should be made.
+        url_probe:       URL which should be requested.
+        method:          String containing the HTTP method to use.
+        headers:         Mapping containing the request headers.
+        allow_redirects: Boolean indicating if redirects should be followed.
+        payload:         JSON payload of the request, or None.
+        matcher:         BodyMatcher() to search the response body with.
+        max_body_size:   Integer number of bytes of the response body
+                         which should be read at most.
+    """
+
+    if not isinstance(net_info, SiteCheck):
+        net_info = SiteCheck(None, net_info)
+
+    request = {"url_user": net_info.url_user(username), "illegal": False}
+
+    # Don't make request if username is invalid for the site
+    if not net_info.allows(username):
+        # No need to do the check at the site: this username is not allowed.
+        request["illegal"] = True
+        return request
+
+    request["url_probe"] = net_info.request_url(username)
+    request["method"] = net_info.method
+    request["headers"] = net_info.headers
+    request["allow_redirects"] = net_info.allow_redirects
+    request["payload"] = net_info.request_payload(username)
+    request["matcher"] = net_info.matcher
+    request["max_body_size"] = net_info.max_body_size
+
+    return request
+
+
+def body_reader(matcher, max_body_size, keep_body=True):
+    """Body Reader.
+
+    Creates a response hook which reads the body of a streamed response
+    in the worker thread, searching it as it arrives.  Reading stops as
+    soon as the BodyScanner() has a final answer, or max_body_size bytes
+    have been read, and the connection is then dropped rather than drained.
+
+    Keyword Arguments:
+    matcher                -- BodyMatcher() to search the body with.
+    max_body_size          -- Integer number of bytes to read at most.
+    keep_body              -- Boolean indicating if the bytes read should be
+                              kept, rather than searched and thrown away.
+                              Default is True.
+
+    Return Value:
+    Response hook function.  The hook leaves the bytes read (or no bytes,
+    if they are not kept) as the content of the response, and the
+    BodyScanner() as its scanner attribute.  The time spent reading and
+    searching is added to the ProbeTimer() of the probe, if it has one.
+    """
+
+    def read_body(resp, *args, **kwargs):
+        started = monotonic()
+        searching = 0.0
+        searching_cpu = 0.0
+        scanner = matcher.scanner(resp.encoding)
+        chunks = []
+        complete = True
+        for chunk in resp.iter_content(BODY_CHUNK_SIZE):
+            chunk = chunk[:max_body_size - scanner.size]
+            if keep_body:
+                chunks.append(chunk)
+            search_started = monotonic()
+            search_started_cpu = thread_time()
+            scanner.feed(chunk)
+            searching_cpu += thread_time() - search_started_cpu
+            searching += monotonic() - search_started
+            if scanner.final or scanner.size >= max_body_size:
+                complete = False
+                break
+
+        if not complete:
+            # Closes the connection, as the rest of the body is still unread.
+            resp.close()
+
+        timer = current_timer()
+        if timer is not None:
+            timer.add("body", monotonic() - started - searching)
+            timer.add("detect", searching_cpu)
+
+        resp._content = b"".join(chunks)
+        resp._content_consumed = True
+        resp.scanner = scanner
+
+        return
+
+    return read_body
+
+
+def detect_status(social_network, net_info, status_code, body, encoding=None):
+    """Detect Status.
+
+    Decides whether the username exists on a site, given the response
+    which came back from the probe.
+
+    Keyword Arguments:
+    social_network         -- String which identifies site.
+    net_info               -- SiteCheck() object of the site.  Raw site
+                              information is compiled on the fly.
+    status_code            -- Integer HTTP status code of the response.
+    body                   -- Bytes of the body of the response, the body
+                              already decoded to a string, or a BodyScanner()
+                              which has already been fed the body.
+    encoding               -- String naming the charset of the body, or
+                              None if the response did not declare one.
+
+    Return Value:
+    Tuple of the QueryStatus() and a string with any error context (or None).
     """
 
-    # Notify caller that we are starting the query.
-    query_notify.start(username)
+    if not isinstance(net_info, SiteCheck):
+        net_info = SiteCheck(social_network, net_info)
 
-    # Normal requests
-    underlying_session = requests.session()
+    # Get the expected error type
+    error_type = net_info.error_type
 
-    # Limit number of workers to 20.
-    # This is probably vastly overkill.
-    if len(site_data) >= 20:
-        max_workers = 20
+    query_status = QueryStatus.UNKNOWN
+    error_context = None
+
+    # Look for WAF fingerprints and error messages in one go.
+    if isinstance(body, BodyScanner):
+        body_status = body.status
     else:
-        max_workers = len(site_data)
+        body_status = net_info.matcher.scan(body, encoding)
+
+    if body_status is QueryStatus.WAF:
+        query_status = QueryStatus.WAF
+
+    elif not net_info.known_error_type:
+        error_context = f"Unknown error type '{list(error_type)}' for {social_network}"
+        query_status = QueryStatus.UNKNOWN
+
+    else:
+        if "message" in error_type:
+            # The username is available if any of the error messages
+            # is found in the HTML
+            if body_status is QueryStatus.AVAILABLE:
+                query_status = QueryStatus.AVAILABLE
+            else:
+                query_status = QueryStatus.CLAIMED
+
+        if "status_code" in error_type and query_status is not QueryStatus.AVAILABLE:
+            error_codes = net_info.error_codes
+            query_status = QueryStatus.CLAIMED
+
+            if error_codes is not None and status_code in error_codes:
+                query_status = QueryStatus.AVAILABLE
+            elif status_code >= 300 or status_code < 200:
+                query_status = QueryStatus.AVAILABLE
+
+        if "response_url" in error_type and query_status is not QueryStatus.AVAILABLE:
+            # For this detection method, we have turned off the redirect.
+            # So, there is no need to check the response URL: it will always
+            # match the request.  Instead, we will ensure that the response
+            # code indicates that the request was successful (i.e. no 404, or
+            # forward to some odd redirect).
+            if 200 <= status_code < 300:
+                query_status = QueryStatus.CLAIMED
+            else:
+                query_status = QueryStatus.AVAILABLE
+
+    return query_status, error_context
+
+
+def body_retention(keep_bodies):
+    """Body Retention.
+
+    Keyword Arguments:
+    keep_bodies            -- Boolean or BodyRetention(), as accepted by
+                              sherlock().
+
+    Return Value:
+    BodyRetention() object to keep response bodies within, or None if they
+    should not be kept at all.
+    """
+
+    if isinstance(keep_bodies, BodyRetention):
+        return keep_bodies
+    if keep_bodies:
+        return BodyRetention()
+    return None
+
+
+def dump_response_text(social_network, net_info, username, url, status_code, text, query_status):
+    """Dump the HTTP response to stdout for targeted debugging."""
+    error_type = net_info["errorType"]
+    if isinstance(error_type, str):
+        error_type = [error_type]
+    else:
+        error_type = list(error_type)
+
+    print("+++++++++++++++++++++")
+    print(f"TARGET NAME   : {social_network}")
+    print(f"USERNAME      : {username}")
+    print(f"TARGET URL    : {url}")
+    print(f"TEST METHOD   : {error_type}")
+    try:
+        print(f"STATUS CODES  : {net_info['errorCode']}")
+    except KeyError:
+        pass
+    print("Results...")
+    if status_code is not None:
+        print(f"RESPONSE CODE : {status_code}")
+    try:
+        print(f"ERROR TEXT    : {net_info['errorMsg']}")
+    except KeyError:
+        pass
+    print(">>>>> BEGIN RESPONSE TEXT")
+    if text is not None:
+        print(text)
+    print("<<<<< END RESPONSE TEXT")
+    print("VERDICT       : " + str(query_status))
+    print("+++++++++++++++++++++")
+
+
+def create_session(site_data, max_workers=DEFAULT_MAX_WORKERS):
+    """Create Session.
+
+    Creates the multi-threaded session used to send probes.  The
+    underlying connection pool keeps a pool for every host in the site
+    data, so that keep-alive connections can be reused for as long as the
+    session lives rather than being evicted after the first few hosts.
+
+    Keyword Arguments:
+    site_data              -- Dictionary containing all of the site data.
+    max_workers            -- Maximum number of requests in flight.
+                              Default is DEFAULT_MAX_WORKERS.
+
+    Return Value:
+    SherlockFuturesSession() object, with the number of workers in its
+    pool as its max_workers attribute.
+    """
+
+    hosts = {urlsplit(net_info.get("urlProbe") or net_info["url"]).netloc
+             for net_info in site_data.values()}
+    max_workers = max(1, min(max_workers, len(site_data)))
+
+    underlying_session = TimedSession()
+    adapter = TimedHTTPAdapter(
+        pool_connections=max(len(hosts), 1), pool_maxsize=max_workers
+    )
+    underlying_session.mount("http://", adapter)
+    underlying_session.mount("https://", adapter)
 
-    # Create multi-threaded session for all requests.
     session = SherlockFuturesSession(
         max_workers=max_workers, session=underlying_session
     )
+    session.max_workers = max_workers
+
+    return session
+
+
+def deadline_exceeded(username, site_name, url):
+    """Result of a probe which was given up on, as the scan ran out of time."""
+    return QueryResult(
+        username, site_name, url, QueryStatus.UNKNOWN, context="Deadline Exceeded", http_status="?"
+    )
+
+
+def completed_by(futures, expires=None):
+    """Completed By.
+
+    Keyword Arguments:
+    futures                -- Iterable of futures.
+    expires                -- Time, as given by time.monotonic(), after which
+                              futures which have not completed are left out,
+                              or None to wait for all of them.
+
+    Return Value:
+    Generator of the futures in the order that they complete.
+    """
+
+    pending = set(futures)
+    try:
+        for future in as_completed(
+            list(pending), timeout=None if expires is None else max(expires - monotonic(), 0)
+        ):
+            pending.discard(future)
+            yield future
+    except FutureTimeoutError:
+        # Futures which completed just as time ran out are still of use.
+        yield from [future for future in pending if future.done()]
+
+
+def submit_probes(
+    session,
+    username,
+    site_data,
+    proxy=None,
+    timeout=60,
+    keep_body=True,
+    cached=None,
+    latency=None,
+    expires=None,
+    metrics=None,
+):
+    """Submit Probes.
+
+    Starts the requests for one username on all sites.  The requests run
+    in the background on the session's thread pool.
+
+    Keyword Arguments:
+    session                -- ProbeScheduler() or SherlockFuturesSession() to
+                              send requests with.
+    username               -- String indicating username that report
+                              should be created against.
+    site_data              -- Dictionary containing all of the site data.
+    proxy                  -- String indicating the proxy URL
+    timeout                -- Time in seconds to wait before timing out request.
+    keep_body              -- Boolean indicating if response bodies should be
+                              read into memory, rather than only searched.
+                              Default is True.
+    cached                 -- Dictionary of cached QueryResult() objects keyed
+                              by site, as returned by ResultCache.lookup().
+                              These sites are not probed.  Default is None.
+    latency                -- LatencyStats() to derive the timeout of each
+                              site from, within timeout, or None.
+    expires                -- Time, as given by time.monotonic(), after which
+                              no probe may run, or None.  Probes are given
+                              no longer than what is left.
+    metrics                -- ScanMetrics() to track the probes in, or None.
+
+    Return Value:
+    Tuple of the partially filled results (see sherlock()) and a dictionary
+    of request futures keyed by site.  Sites for which the username is not
+    allowed, which have a cached result or which are past the deadline
+    already carry their final status, and have no future.  Each future has
+    the ProbeTimer() of its probe as its timer attribute.
+    """
 
     # Results from analysis of all sites
     results_total = {}
 
-    # First create futures for all requests. This allows for the requests to run in parallel
+    # Pending requests, keyed by site
+    futures = {}
+
+    proxies = None
+    if proxy is not None:
+        proxies = {"http": proxy, "https": proxy}
+
     for social_network, net_info in site_data.items():
         # Results from analysis of this specific site
         results_site = {"url_main": net_info.get("urlMain")}
 
-        # Record URL of main site
-
-        # A user agent is needed because some sites don't return the correct
-        # information since they think that we are bots (Which we actually are...)
-        headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:129.0) Gecko/20100101 Firefox/129.0",
-        }
-
-        if "headers" in net_info:
-            # Override/append any extra headers required by a given site.
-            headers.update(net_info["headers"])
-
-        # URL of user on site (if it exists)
-        url = interpolate_string(net_info["url"], username.replace(' ', '%20'))
+        request = prepare_request(username, net_info)
+        url = request["url_user"]
 
-        # Don't make request if username is invalid for the site
-        regex_check = net_info.get("regexCheck")
-        if regex_check and re.search(regex_check, username) is None:
+        if request["illegal"]:
             # No need to do the check at the site: this username is not allowed.
             results_site["status"] = QueryResult(
                 username, social_network, url, QueryStatus.ILLEGAL
@@ -258,107 +579,121 @@ def sherlock(
             results_site["url_user"] = ""
             results_site["http_status"] = ""
             results_site["response_text"] = ""
-            query_notify.update(results_site["status"])
+        elif cached and social_network in cached:
+            # A recent enough result is known, so there is no need to ask again.
+            results_site["status"] = cached[social_network]
+            results_site["url_user"] = url
+            results_site["http_status"] = cached[social_network].http_status
+            results_site["response_text"] = None
+        elif expires is not None and expires <= monotonic():
+            # No time is left to ask.
+            results_site["status"] = deadline_exceeded(username, social_network, url)
+            results_site["url_user"] = url
+            results_site["http_status"] = "?"
+            results_site["response_text"] = None
         else:
             # URL of user on site (if it exists)
             results_site["url_user"] = url
-            url_probe = net_info.get("urlProbe")
-            request_method = net_info.get("request_method")
-            request_payload = net_info.get("request_payload")
-            request = None
-
-            if request_method is not None:
-                if request_method == "GET":
-                    request = session.get
-                elif request_method == "HEAD":
-                    request = session.head
-                elif request_method == "POST":
-                    request = session.post
-                elif request_method == "PUT":
-                    request = session.put
-                else:
-                    raise RuntimeError(f"Unsupported request_method for {url}")
-
-            if request_payload is not None:
-                request_payload = interpolate_string(request_payload, username)
-
-            if url_probe is None:
-                # Probe URL is normal one seen by people out on the web.
-                url_probe = url
-            else:
-                # There is a special URL for probing existence separate
-                # from where the user profile normally can be found.
-                url_probe = interpolate_string(url_probe, username)
-
-            if request is None:
-                if net_info["errorType"] == "status_code":
-                    # In most cases when we are detecting by status code,
-                    # it is not necessary to get the entire body:  we can
-                    # detect fine with just the HEAD response.
-                    request = session.head
-                else:
-                    # Either this detect method needs the content associated
-                    # with the GET response, or this specific website will
-                    # not respond properly unless we request the whole page.
-                    request = session.get
-
-            if net_info["errorType"] == "response_url":
-                # Site forwards request to a different URL if username not
-                # found.  Disallow the redirect so we can capture the
-                # http status from the original URL request.
-                allow_redirects = False
-            else:
-                # Allow whatever redirect that the site wants to do.
-                # The final result of the request will be what is available.
-                allow_redirects = True
 
-            # This future starts running the request in a new thread, doesn't block the main thread
-            if proxy is not None:
-                proxies = {"http": proxy, "https": proxy}
-                future = request(
-                    url=url_probe,
-                    headers=headers,
-                    proxies=proxies,
-                    allow_redirects=allow_redirects,
-                    timeout=timeout,
-                    json=request_payload,
-                )
-            else:
-                future = request(
-                    url=url_probe,
-                    headers=headers,
-                    allow_redirects=allow_redirects,
-                    timeout=timeout,
-                    json=request_payload,
-                )
+            site_timeout = timeout
+            if latency is not None:
+                site_timeout = latency.timeout(social_network, timeout)
+            # Timeout which the probe is recorded with if it times out, unless
+            # it was cut short by the deadline.
+            recorded_timeout = site_timeout
+            if expires is not None and expires - monotonic() < site_timeout:
+                site_timeout = expires - monotonic()
+                recorded_timeout = None
 
-            # Store future in data for access later
-            net_info["request_future"] = future
+            # This future starts running the request in a new thread, doesn't block the main thread
+            timer = ProbeTimer()
+            futures[social_network] = session.request(
+                request["method"],
+                url=request["url_probe"],
+                headers=request["headers"],
+                proxies=proxies,
+                allow_redirects=request["allow_redirects"],
+                timeout=site_timeout,
+                json=request["payload"],
+                stream=True,
+                hooks={"response": body_reader(
+                    request["matcher"], request["max_body_size"], keep_body=keep_body
+                )},
+                timer=timer,
+            )
+            futures[social_network].timer = timer
+            futures[social_network].recorded_timeout = recorded_timeout
+            if metrics is not None:
+                metrics.track(futures[social_network])
 
         # Add this site's results into final dictionary with all the other results.
         results_total[social_network] = results_site
 
-    # Open the file containing account links
-    for social_network, net_info in site_data.items():
+    return results_total, futures
+
+
+def iter_results(
+    username,
+    site_data,
+    results_total,
+    futures,
+    dump_response=False,
+    retention=None,
+    cache=None,
+    latency=None,
+    expires=None,
+    metrics=None,
+):
+    """Iterate Results.
+
+    Waits for the probes started by submit_probes(), and works out the
+    status on each site in the order that the responses arrive.
+
+    Keyword Arguments:
+    username               -- String indicating username that report
+                              should be created against.
+    site_data              -- Dictionary of SiteCheck() objects of all sites.
+    results_total          -- Results as returned by submit_probes().
+    futures                -- Futures as returned by submit_probes().
+    dump_response          -- Boolean indicating if responses should be
+                              dumped to stdout.
+    retention              -- BodyRetention() to keep response bodies within,
+                              or None to not keep them.
+    cache                  -- ResultCache() to store new results in, or None.
+    latency                -- LatencyStats() to record response times in, or
+                              None.
+    expires                -- Time, as given by time.monotonic(), after which
+                              probes which have not finished are given up,
+                              or None.
+    metrics                -- ScanMetrics() to count the results in, or None.
+
+    Return Value:
+    Generator of QueryResult() objects.  The results_total dictionary is
+    completed as the results are produced.
+    """
+
+    for social_network, results_site in results_total.items():
+        if social_network not in futures:
+            # We have already determined the status on this site
+            if metrics is not None:
+                metrics.observe(results_site["status"])
+            yield results_site["status"]
+
+    sites = {future: social_network for social_network, future in futures.items()}
+
+    for future in completed_by(sites, expires):
+        social_network = sites[future]
+        net_info = site_data[social_network]
+
         # Retrieve results again
         results_site = results_total.get(social_network)
 
         # Retrieve other site information again
         url = results_site.get("url_user")
-        status = results_site.get("status")
-        if status is not None:
-            # We have already determined the user doesn't exist here
-            continue
-
-        # Get the expected error type
-        error_type = net_info["errorType"]
-        if isinstance(error_type, str):
-            error_type: list[str] = [error_type]
 
         # Retrieve future and ensure it has finished
-        future = net_info["request_future"]
         r, error_text, exception_text = get_response(
-            request_future=future, error_type=error_type, social_network=social_network
+            request_future=future, error_type=net_info.error_type, social_network=social_network
         )
 
         # Get response time for response of our request.
@@ -366,122 +701,45 @@ def sherlock(
             response_time = r.elapsed
         except AttributeError:
             response_time = None
+        timer = getattr(future, "timer", None)
 
         # Attempt to get request information
         try:
             http_status = r.status_code
         except Exception:
             http_status = "?"
-        try:
-            response_text = r.text.encode(r.encoding or "UTF-8")
-        except Exception:
-            response_text = ""
-
-        query_status = QueryStatus.UNKNOWN
-        error_context = None
-
-        # As WAFs advance and evolve, they will occasionally block Sherlock and
-        # lead to false positives and negatives. Fingerprints should be added
-        # here to filter results that fail to bypass WAFs. Fingerprints should
-        # be highly targetted. Comment at the end of each fingerprint to
-        # indicate target and date fingerprinted.
-        WAFHitMsgs = [
-            r'.loading-spinner{visibility:hidden}body.no-js .challenge-running{display:none}body.dark{background-color:#222;color:#d9d9d9}body.dark a{color:#fff}body.dark a:hover{color:#ee730a;text-decoration:underline}body.dark .lds-ring div{border-color:#999 transparent transparent}body.dark .font-red{color:#b20f03}body.dark', # 2024-05-13 Cloudflare
-            r'<span id="challenge-error-text">', # 2024-11-11 Cloudflare error page
-            r'AwsWafIntegration.forceRefreshToken', # 2024-11-11 Cloudfront (AWS)
-            r'{return l.onPageView}}),Object.defineProperty(r,"perimeterxIdentifiers",{enumerable:' # 2024-04-09 PerimeterX / Human Security
-        ]
+        response_text = None
+        if retention is not None and r is not None:
+            # The body is already bytes, so it is kept as it is.
+            response_text = retention.keep(r.content)
 
         if error_text is not None:
+            query_status = QueryStatus.UNKNOWN
             error_context = error_text
-
-        elif any(hitMsg in r.text for hitMsg in WAFHitMsgs):
-            query_status = QueryStatus.WAF
-
+            recorded_timeout = getattr(future, "recorded_timeout", None)
+            if latency is not None and error_text == "Timeout Error" and recorded_timeout is not None:
+                latency.record_timeout(social_network, recorded_timeout)
         else:
-            if any(errtype not in ["message", "status_code", "response_url"] for errtype in error_type):
-                error_context = f"Unknown error type '{error_type}' for {social_network}"
-                query_status = QueryStatus.UNKNOWN
-            else:
-                if "message" in error_type:
-                    # error_flag True denotes no error found in the HTML
-                    # error_flag False denotes error found in the HTML
-                    error_flag = True
-                    errors = net_info.get("errorMsg")
-                    # errors will hold the error message
-                    # it can be string or list
-                    # by isinstance method we can detect that
-                    # and handle the case for strings as normal procedure
-                    # and if its list we can iterate the errors
-                    if isinstance(errors, str):
-                        # Checks if the error message is in the HTML
-                        # if error is present we will set flag to False
-                        if errors in r.text:
-                            error_flag = False
-                    else:
-                        # If it's list, it will iterate all the error message
-                        for error in errors:
-                            if error in r.text:
-                                error_flag = False
-                                break
-                    if error_flag:
-                        query_status = QueryStatus.CLAIMED
-                    else:
-                        query_status = QueryStatus.AVAILABLE
-
-                if "status_code" in error_type and query_status is not QueryStatus.AVAILABLE:
-                    error_codes = net_info.get("errorCode")
-                    query_status = QueryStatus.CLAIMED
-
-                    # Type consistency, allowing for both singlets and lists in manifest
-                    if isinstance(error_codes, int):
-                        error_codes = [error_codes]
-
-                    if error_codes is not None and r.status_code in error_codes:
-                        query_status = QueryStatus.AVAILABLE
-                    elif r.status_code >= 300 or r.status_code < 200:
-                        query_status = QueryStatus.AVAILABLE
-
-                if "response_url" in error_type and query_status is not QueryStatus.AVAILABLE:
-                    # For this detection method, we have turned off the redirect.
-                    # So, there is no need to check the response URL: it will always
-                    # match the request.  Instead, we will ensure that the response
-                    # code indicates that the request was successful (i.e. no 404, or
-                    # forward to some odd redirect).
-                    if 200 <= r.status_code < 300:
-                        query_status = QueryStatus.CLAIMED
-                    else:
-                        query_status = QueryStatus.AVAILABLE
+            detect_started = thread_time()
+            query_status, error_context = detect_status(
+                social_network, net_info, r.status_code, r.scanner
+            )
+            if timer is not None:
+                timer.add("detect", thread_time() - detect_started)
+            if latency is not None:
+                latency.record(social_network, response_time)
 
         if dump_response:
-            print("+++++++++++++++++++++")
-            print(f"TARGET NAME   : {social_network}")
-            print(f"USERNAME      : {username}")
-            print(f"TARGET URL    : {url}")
-            print(f"TEST METHOD   : {error_type}")
-            try:
-                print(f"STATUS CODES  : {net_info['errorCode']}")
-            except KeyError:
-                pass
-            print("Results...")
-            try:
-                print(f"RESPONSE CODE : {r.status_code}")
-            except Exception:
-                pass
-            try:
-                print(f"ERROR TEXT    : {net_info['errorMsg']}")
-            except KeyError:
-                pass
-            print(">>>>> BEGIN RESPONSE TEXT")
-            try:
-                print(r.text)
-            except Exception:
-                pass
-            print("<<<<< END RESPONSE TEXT")
-            print("VERDICT       : " + str(query_status))
-            print("+++++++++++++++++++++")
-
-        # Notify caller about results of query.
+            dump_response_text(
+                social_network,
+                net_info,
+                username,
+                url,
+                None if r is None else r.status_code,
+                None if r is None else r.text,
+                query_status,
+            )
+
         result: QueryResult = QueryResult(
             username=username,
             site_name=social_network,
@@ -489,22 +747,439 @@ def sherlock(
             status=query_status,
             query_time=response_time,
             context=error_context,
+            http_status=http_status,
+            timings=None if timer is None else timer.timings(),
         )
-        query_notify.update(result)
 
         # Save status of request
         results_site["status"] = result
+        if cache is not None:
+            cache.store(net_info, result)
 
         # Save results from request
         results_site["http_status"] = http_status
         results_site["response_text"] = response_text
 
-        # Add this site's results into final dictionary with all of the other results.
-        results_total[social_network] = results_site
+        if metrics is not None:
+            metrics.observe(result, None if r is None else r.scanner.size)
+        yield result
+
+    # Out of time:  the probes which are still running are given up on.
+    for future, social_network in sites.items():
+        results_site = results_total[social_network]
+        if "status" in results_site:
+            continue
+        future.cancel()
+        result = deadline_exceeded(username, social_network, results_site["url_user"])
+        if getattr(future, "timer", None) is not None:
+            # What the probe got through before it was given up on.
+            result.timings = future.timer.timings()
+        results_site["status"] = result
+        results_site["http_status"] = "?"
+        results_site["response_text"] = None
+        if metrics is not None:
+            metrics.observe(result)
+        yield result
+
+
+def iter_batch(
+    usernames,
+    site_data,
+    dump_response=False,
+    keep_bodies=False,
+    cache=None,
+    proxy=None,
+    timeout=60,
+    max_in_flight=None,
+    max_per_host=None,
+    window=2,
+    session=None,
+    latency=None,
+    deadline=None,
+    metrics=None,
+):
+    """Iterate Batch.
+
+    Runs the probes for many usernames through one session on the threads
+    engine.  The probes of the next usernames are submitted before the
+    results of the current one are iterated.
+
+    Keyword Arguments:
+    session                -- ProbeScheduler() to send the probes with, which
+                              may be shared with other batches running at
+                              the same time, and is left open.  Default of
+                              None creates one for the batch, within
+                              max_in_flight and max_per_host.
+
+    The other arguments are the same as for sherlock_batch().
+
+    Return Value:
+    Generator of (username, stream, results_total) tuples, where stream is
+    the generator returned by iter_results() for the username, and
+    results_total the dictionary which it completes.  Each stream must be
+    exhausted before moving on to the next username.
+    """
+
+    # Work out everything which does not depend on the username just once.
+    site_data = compile_site_data(site_data)
+    retention = body_retention(keep_bodies)
+    expires = None if deadline is None else monotonic() + deadline
+
+    own_session = session is None
+    if own_session:
+        session = ProbeScheduler(
+            create_session(site_data, max_workers=max_in_flight or DEFAULT_MAX_WORKERS),
+            max_per_host=max_per_host,
+        )
+        if metrics is not None:
+            metrics.pool_size = session.session.max_workers
+
+    # Usernames whose probes have been submitted, oldest first.
+    pending = deque()
+    usernames = iter(usernames)
+    try:
+        while True:
+            while len(pending) < max(window, 1):
+                username = next(usernames, None)
+                if username is None:
+                    break
+                results_total, futures = submit_probes(
+                    session,
+                    username,
+                    site_data,
+                    proxy=proxy,
+                    timeout=timeout,
+                    keep_body=dump_response or retention is not None,
+                    cached=None if cache is None else cache.lookup(username, site_data),
+                    latency=latency,
+                    expires=expires,
+                    metrics=metrics,
+                )
+                pending.append((username, results_total, futures))
+
+            if not pending:
+                break
+
+            username, results_total, futures = pending[0]
+            yield username, iter_results(
+                username,
+                site_data,
+                results_total,
+                futures,
+                dump_response=dump_response,
+                retention=retention,
+                cache=cache,
+                latency=latency,
+                expires=expires,
+                metrics=metrics,
+            ), results_total
+            pending.popleft()
+            if cache is not None:
+                cache.commit()
+            if latency is not None:
+                latency.commit()
+    finally:
+        for _, _, futures in pending:
+            for future in futures.values():
+                future.cancel()
+        if own_session:
+            session.close()
+        if cache is not None:
+            cache.commit()
+        if latency is not None:
+            latency.commit()
+
+
+def iterate_async(generator):
+    """Iterate Asynchronous Generator.
+
+    Runs an asynchronous generator on a private event loop, so that it can
+    be consumed by synchronous code.
+
+    Keyword Arguments:
+    generator              -- Asynchronous generator to iterate.
+
+    Return Value:
+    Generator of the items produced by the asynchronous generator.
+    """
+
+    # Imported here, as only the asyncio engine needs it.
+    import asyncio
+
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(generator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        try:
+            loop.run_until_complete(generator.aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
+def sherlock(
+    username: str,
+    site_data: dict[str, dict[str, str]],
+    query_notify: QueryNotify,
+    dump_response: bool = False,
+    proxy: Optional[str] = None,
+    timeout: int = 60,
+    engine: str = "threads",
+    max_in_flight: Optional[int] = None,
+    max_per_host: Optional[int] = None,
+    keep_bodies: bool | BodyRetention = False,
+    cache: Optional[ResultCache] = None,
+    latency: Optional[LatencyStats] = None,
+    deadline: Optional[float] = None,
+    metrics: Optional[ScanMetrics] = None,
+) -> dict[str, dict[str, str | QueryResult]]:
+    """Run Sherlock Analysis.
+
+    Checks for existence of username on various social media sites.
+
+    Keyword Arguments:
+    username               -- String indicating username that report
+                              should be created against.
+    site_data              -- Dictionary containing all of the site data.
+                              Values may be the raw information about each
+                              site, or the SiteCheck() objects compiled from
+                              it by SitesInformation(), which saves
+                              compiling them again for every username.
+                              It is never modified, so scans running at
+                              the same time, on any threads, may share it.
+    query_notify           -- Object with base type of QueryNotify().
+                              This will be used to notify the caller about
+                              query results, in the order they arrive.
+    proxy                  -- String indicating the proxy URL
+    timeout                -- Time in seconds to wait before timing out request.
+                              Default is 60 seconds.
+    engine                 -- String indicating which probe engine to use.
+                              "threads" runs the requests in a thread pool,
+                              "asyncio" runs them all on one event loop (this
+                              requires the optional aiohttp dependency).
+                              Default is "threads".
+    max_in_flight          -- Maximum number of requests in flight across
+                              all sites.  None for the engine's default.
+    max_per_host           -- Maximum number of requests in flight to any
+                              single host.  None for no limit.
+    keep_bodies            -- Boolean indicating if response bodies should be
+                              kept in the results, within the default limit
+                              of a BodyRetention(), or a BodyRetention() to
+                              keep them within and report on.
+                              Default is False.
+    cache                  -- ResultCache() to take results from instead of
+                              probing, and to store new results in.  Cached
+                              results are marked as such.  Default is None.
+    latency                -- LatencyStats() to derive the timeout of each
+                              site from, within timeout, and to record the
+                              response times in.  Default is None.
+    deadline               -- Time in seconds after which probes of the scan
+                              which have not finished are given up, with an
+                              unknown result.  Default is None.
+    metrics                -- ScanMetrics() to count the results, the bytes
+                              read and the probes in flight in.
+                              Default is None.
+
+    Return Value:
+    Dictionary containing results from report. Key of dictionary is the name
+    of the social network site, and the value is another dictionary with
+    the following keys:
+        url_main:      URL of main site.
+        url_user:      URL of user on site (if account exists).
+        status:        QueryResult() object indicating results of test for
+                       account existence.
+        http_status:   HTTP status code of query which checked for existence on
+                       site.
+        response_text: Bytes of the body that came back from request, as
+                       far as it was read.  None unless bodies are kept,
+                       if there was an HTTP error when checking for
+                       existence, or if the body was over the limit.
+    """
+
+    batch = sherlock_batch(
+        [username],
+        site_data,
+        query_notify,
+        dump_response=dump_response,
+        proxy=proxy,
+        timeout=timeout,
+        engine=engine,
+        max_in_flight=max_in_flight,
+        max_per_host=max_per_host,
+        keep_bodies=keep_bodies,
+        cache=cache,
+        latency=latency,
+        deadline=deadline,
+        metrics=metrics,
+    )
+    try:
+        _, results_total = next(batch)
+    finally:
+        batch.close()
 
     return results_total
 
 
+def sherlock_stream(
+    username: str,
+    site_data: dict[str, dict[str, str]],
+    dump_response: bool = False,
+    proxy: Optional[str] = None,
+    timeout: int = 60,
+    engine: str = "threads",
+    max_in_flight: Optional[int] = None,
+    max_per_host: Optional[int] = None,
+    latency: Optional[LatencyStats] = None,
+    deadline: Optional[float] = None,
+    metrics: Optional[ScanMetrics] = None,
+) -> Iterator[QueryResult]:
+    """Stream Sherlock Analysis.
+
+    Checks for existence of username on various social media sites, and
+    produces each result as soon as the response for its site arrives, so
+    that one slow site does not hold up the others.
+
+    Keyword Arguments:
+    See sherlock().
+
+    Return Value:
+    Generator of QueryResult() objects, in the order they complete.
+    Results for sites where the username is not allowed come first.
+    """
+
+    if engine == "asyncio":
+        # Imported here so that aiohttp remains an optional dependency.
+        from sherlock_project.aio import sherlock_stream_async
+
+        yield from iterate_async(
+            sherlock_stream_async(
+                username,
+                site_data,
+                dump_response=dump_response,
+                proxy=proxy,
+                timeout=timeout,
+                max_in_flight=max_in_flight,
+                max_per_host=max_per_host,
+                latency=latency,
+                deadline=deadline,
+                metrics=metrics,
+            )
+        )
+        return
+    elif engine != "threads":
+        raise ValueError(f"Unknown engine '{engine}'. Expected one of {', '.join(ENGINES)}.")
+
+    for _, stream, _ in iter_batch(
+        [username],
+        site_data,
+        dump_response=dump_response,
+        proxy=proxy,
+        timeout=timeout,
+        max_in_flight=max_in_flight,
+        max_per_host=max_per_host,
+        latency=latency,
+        deadline=deadline,
+        metrics=metrics,
+    ):
+        yield from stream
+
+
+def sherlock_batch(
+    usernames: list[str],
+    site_data: dict[str, dict[str, str]],
+    query_notify: QueryNotify,
+    dump_response: bool = False,
+    proxy: Optional[str] = None,
+    timeout: int = 60,
+    engine: str = "threads",
+    max_in_flight: Optional[int] = None,
+    max_per_host: Optional[int] = None,
+    window: int = 2,
+    keep_bodies: bool | BodyRetention = False,
+    cache: Optional[ResultCache] = None,
+    latency: Optional[LatencyStats] = None,
+    deadline: Optional[float] = None,
+    metrics: Optional[ScanMetrics] = None,
+) -> Iterator[tuple[str, dict[str, dict[str, str | QueryResult]]]]:
+    """Run Sherlock Analysis For Many Usernames.
+
+    Checks for existence of each username on various social media sites.
+    All usernames share one long-lived connection pool, so keep-alive
+    connections to a site are reused from one username to the next, and
+    the probes of the next usernames are already in flight while the
+    results of the current one are being collected.
+
+    Keyword Arguments:
+    usernames              -- List of strings indicating usernames that
+                              reports should be created against.
+    window                 -- Number of usernames whose probes may be in
+                              flight at the same time.  Default is 2.
+
+    The other arguments are the same as for sherlock().  The limit on the
+    size of kept bodies applies to the batch as a whole, as does the
+    deadline.
+
+    Return Value:
+    Generator of (username, results) tuples, in the order of usernames.
+    The results are the same as returned by sherlock().  The caller is
+    notified about the results of one username at a time, as they arrive.
+    """
+
+    if engine == "asyncio":
+        # Imported here so that aiohttp remains an optional dependency.
+        from sherlock_project.aio import sherlock_batch_async
+
+        yield from iterate_async(
+            sherlock_batch_async(
+                usernames,
+                site_data,
+                query_notify,
+                dump_response=dump_response,
+                proxy=proxy,
+                timeout=timeout,
+                max_in_flight=max_in_flight,
+                max_per_host=max_per_host,
+                window=window,
+                keep_bodies=keep_bodies,
+                cache=cache,
+                latency=latency,
+                deadline=deadline,
+                metrics=metrics,
+            )
+        )
+        return
+    elif engine != "threads":
+        raise ValueError(f"Unknown engine '{engine}'. Expected one of {', '.join(ENGINES)}.")
+
+    for username, stream, results_total in iter_batch(
+        usernames,
+        site_data,
+        dump_response=dump_response,
+        keep_bodies=keep_bodies,
+        cache=cache,
+        proxy=proxy,
+        timeout=timeout,
+        max_in_flight=max_in_flight,
+        max_per_host=max_per_host,
+        window=window,
+        latency=latency,
+        deadline=deadline,
+        metrics=metrics,
+    ):
+        # Notify caller that we are starting the query.
+        query_notify.start(username)
+
+        for result in stream:
+            # Notify caller about results of query.
+            query_notify.update(result)
+
+        yield username, results_total
+
+
 def timeout_check(value):
     """Check Timeout Argument.
 
@@ -530,6 +1205,86 @@ def timeout_check(value):
     return float_value
 
 
+def positive_int_check(value):
+    """Check Positive Integer Argument.
+
+    Keyword Arguments:
+    value                  -- String containing a count.
+
+    Return Value:
+    Integer value of the argument.
+
+    NOTE:  Will raise an exception if the value is not a positive integer.
+    """
+
+    try:
+        int_value = int(value)
+    except ValueError:
+        int_value = 0
+
+    if int_value <= 0:
+        raise ArgumentTypeError(
+            f"Invalid value: {value}. Must be a positive integer."
+        )
+
+    return int_value
+
+
+def non_negative_int_check(value):
+    """Check Non-Negative Integer Argument.
+
+    Keyword Arguments:
+    value                  -- String containing a count, which may be zero.
+
+    Return Value:
+    Integer value of the argument.
+
+    NOTE:  Will raise an exception if the value is not a non-negative integer.
+    """
+
+    try:
+        int_value = int(value)
+    except ValueError:
+        int_value = -1
+
+    if int_value < 0:
+        raise ArgumentTypeError(
+            f"Invalid value: {value}. Must be a non-negative integer."
+        )
+
+    return int_value
+
+
+def cache_ttl_check(value):
+    """Check Cache TTL Argument.
+
+    Keyword Arguments:
+    value                  -- String of the form STATUS=SECONDS, where
+                              STATUS names a QueryStatus() other than
+                              ILLEGAL.
+
+    Return Value:
+    Tuple of the QueryStatus() and the integer number of seconds.
+
+    NOTE:  Will raise an exception if the value is not valid.
+    """
+
+    status, _, seconds = value.partition("=")
+    try:
+        status = QueryStatus[status.strip().upper()]
+        seconds = int(seconds)
+    except (KeyError, ValueError):
+        status = seconds = None
+
+    if status in (None, QueryStatus.ILLEGAL) or seconds < 0:
+        raise ArgumentTypeError(
+            f"Invalid cache TTL: {value}. Expected STATUS=SECONDS, "
+            "where STATUS is one of claimed, available, unknown or waf."
+        )
+
+    return status, seconds
+
+
 def handler(signal_received, frame):
     """Exit gracefully without throwing errors
 
@@ -539,6 +1294,9 @@ def handler(signal_received, frame):
 
 
 def main():
+    # Worked out here rather than on import, as doing so is comparatively slow.
+    from sherlock_project.__init__ import __version__
+
     parser = ArgumentParser(
         formatter_class=RawDescriptionHelpFormatter,
         description=f"{__longname__} (Version {__version__})",
@@ -585,6 +1343,68 @@ def main():
         default=False,
         help="Create the standard file for the modern Microsoft Excel spreadsheet (xlsx).",
     )
+    parser.add_argument(
+        "--ndjson",
+        action="store",
+        metavar="PATH",
+        dest="ndjson",
+        nargs="?",
+        const="-",
+        default=None,
+        help="Write every result as a line of JSON as soon as it arrives, to PATH or to the "
+        "standard output if PATH is - or not given. Results are then not printed.",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store",
+        metavar="JSON_FILE",
+        dest="timings",
+        nargs="?",
+        const="",
+        default=None,
+        help="Time each phase of every probe (queued, connect, tls, first_byte, body, and "
+        "detect, which is CPU time), add them to the CSV and XLSX files, and print a summary "
+        "of the scan. The summary is also written to JSON_FILE if given.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        action="store",
+        metavar="PORT",
+        dest="metrics_port",
+        type=positive_int_check,
+        default=None,
+        help="Serve metrics of the scan at /metrics on this port while it runs, in the "
+        "OpenMetrics or Prometheus text format.",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        action="store",
+        metavar="HOST",
+        dest="metrics_host",
+        default=DEFAULT_METRICS_HOST,
+        help=f"Address to serve metrics on (Default: {DEFAULT_METRICS_HOST}).",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        action="store",
+        metavar="PATH",
+        dest="metrics_textfile",
+        default=None,
+        help="Write metrics of the scan to PATH as it runs, for the textfile collector of "
+        "the Prometheus node exporter.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store",
+        metavar="DIR",
+        dest="profile",
+        nargs="?",
+        const="sherlock-profile",
+        default=None,
+        help="Profile the scan with cProfile, wall-clock samples of every thread and "
+        "tracemalloc, and write the reports to DIR (Default: sherlock-profile). "
+        "Processes started by --processes are not profiled.",
+    )
     parser.add_argument(
         "--site",
         action="append",
@@ -615,7 +1435,18 @@ def main():
         metavar="JSON_FILE",
         dest="json_file",
         default=None,
-        help="Load data from a JSON file or an online, valid, JSON file. Upstream PR numbers also accepted.",
+        help="Load data from a JSON file or an online, valid, JSON file. A manifest compiled by `python -m sherlock_project.manifest` may be given instead. Upstream PR numbers also accepted.",
+    )
+    parser.add_argument(
+        "--manifest-max-age",
+        action="store",
+        metavar="SECONDS",
+        dest="manifest_max_age",
+        type=float,
+        default=DEFAULT_MAX_AGE,
+        help="Use cached copies of the online data file and exclusions for this long "
+        f"before checking them for updates (Default: {DEFAULT_MAX_AGE}). "
+        "Cached copies are also used when offline.",
     )
     parser.add_argument(
         "--timeout",
@@ -626,6 +1457,109 @@ def main():
         default=60,
         help="Time (in seconds) to wait for response to requests (Default: 60)",
     )
+    parser.add_argument(
+        "--adaptive-timeouts",
+        action="store",
+        metavar="PATH",
+        dest="latency",
+        nargs="?",
+        const="",
+        default=None,
+        help="Wait for each site in proportion to its past response times, within --timeout, "
+        "and record new response times. PATH defaults to latency.sqlite3 in the "
+        "user's cache directory.",
+    )
+    parser.add_argument(
+        "--deadline",
+        action="store",
+        metavar="SECONDS",
+        dest="deadline",
+        type=timeout_check,
+        default=None,
+        help="Give up on the probes which have not finished this many seconds after the scan "
+        "started, with an unknown result.",
+    )
+    parser.add_argument(
+        "--engine",
+        action="store",
+        dest="engine",
+        choices=ENGINES,
+        default="threads",
+        help="Probe engine to use. The asyncio engine requires the optional aiohttp dependency. (Default: threads)",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        action="store",
+        metavar="COUNT",
+        dest="max_in_flight",
+        type=positive_int_check,
+        default=None,
+        help=f"Maximum number of requests in flight across all sites (Default: {DEFAULT_MAX_WORKERS} for threads, {DEFAULT_MAX_CONNECTIONS} for asyncio)",
+    )
+    parser.add_argument(
+        "--max-per-host",
+        action="store",
+        metavar="COUNT",
+        dest="max_per_host",
+        type=positive_int_check,
+        default=None,
+        help="Maximum number of requests in flight to any single host (Default: no limit)",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store",
+        metavar="COUNT",
+        dest="processes",
+        type=positive_int_check,
+        default=1,
+        help="Split the scan between this many processes, each with its own connections (Default: 1)",
+    )
+    parser.add_argument(
+        "--shard-by",
+        action="store",
+        dest="shard_by",
+        choices=["site", "username"],
+        default="site",
+        help="Split the scan between processes by site or by username (Default: site)",
+    )
+    parser.add_argument(
+        "--journal",
+        action="store",
+        metavar="JOURNAL_FILE",
+        dest="journal",
+        default=None,
+        help="Append every result to this file as it arrives, so that an interrupted scan can be resumed. "
+        "The file must not exist yet, unless --resume is given.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        default=False,
+        help="Skip the sites for which the journal already has a result. Requires --journal.",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store",
+        metavar="PATH",
+        dest="cache",
+        nargs="?",
+        const="",
+        default=None,
+        help="Reuse recent results from a local cache instead of probing again, "
+        "and add new results to it. PATH defaults to results.sqlite3 in the "
+        "user's cache directory.",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        action="append",
+        metavar="STATUS=SECONDS",
+        dest="cache_ttls",
+        type=cache_ttl_check,
+        default=[],
+        help="How long cached results with the given status are reused, "
+        "e.g. claimed=604800 or waf=0. May be given more than once.",
+    )
     parser.add_argument(
         "--print-all",
         action="store_true",
@@ -693,30 +1627,42 @@ def main():
         default=False,
         help="Ignore upstream exclusions (may return more false positives)",
     )
+    parser.add_argument(
+        "--no-update-check",
+        action="store_false",
+        dest="update_check",
+        default=True,
+        help="Do not check whether a newer version of Sherlock is available",
+    )
+    parser.add_argument(
+        "--update-check-interval",
+        action="store",
+        metavar="SECONDS",
+        dest="update_check_interval",
+        type=float,
+        default=DEFAULT_UPDATE_INTERVAL,
+        help="How long the latest release is remembered before checking again "
+        f"(Default: {DEFAULT_UPDATE_INTERVAL})",
+    )
 
     args = parser.parse_args()
 
     # If the user presses CTRL-C, exit gracefully without throwing errors
     signal.signal(signal.SIGINT, handler)
 
-    # Check for newer version of Sherlock. If it exists, let the user know about it
-    try:
-        latest_release_raw = requests.get(forge_api_latest_release, timeout=10).text
-        latest_release_json = json_loads(latest_release_raw)
-        latest_remote_tag = latest_release_json["tag_name"]
-
-        if latest_remote_tag[1:] != __version__:
-            print(
-                f"Update available! {__version__} --> {latest_remote_tag[1:]}"
-                f"\n{latest_release_json['html_url']}"
-            )
+    # Check for newer version of Sherlock in the background.  If it exists,
+    # the user is told about it once the search is over.
+    update_check = None
+    if args.update_check:
+        update_check = UpdateCheck(interval=args.update_check_interval).start()
 
-    except Exception as error:
-        print(f"A problem occurred while checking for an update: {error}")
+    # Results written to the standard output as JSON are not mixed with
+    # anything else, which goes to the standard error instead.
+    report = sys.stderr if args.ndjson == "-" else sys.stdout
 
     # Make prompts
     if args.proxy is not None:
-        print("Using the proxy: " + args.proxy)
+        print("Using the proxy: " + args.proxy, file=report)
 
     if args.no_color:
         # Disable color output.
@@ -725,16 +1671,39 @@ def main():
         # Enable color output.
         init(autoreset=True)
 
+    if args.resume and args.journal is None:
+        parser.error("You can only use --resume with --journal")
+
+    # Dumped responses are free text, which would break the stream.
+    if args.dump_response and args.ndjson == "-":
+        parser.error("You can only use --dump-response with --ndjson if the results go to a file")
+
+    # A journal may hold hours of work, so it is never overwritten.
+    if args.journal is not None and not args.resume and os.path.exists(args.journal):
+        parser.error(
+            f"The journal {args.journal} already exists.  Add --resume to resume its scan, "
+            "or delete it to start a new one."
+        )
+
     # Check if both output methods are entered as input.
     if args.output is not None and args.folderoutput is not None:
-        print("You can only use one of the output methods.")
+        print("You can only use one of the output methods.", file=report)
         sys.exit(1)
 
     # Check validity for single username output.
     if args.output is not None and len(args.username) != 1:
-        print("You can only use --output with a single username")
+        print("You can only use --output with a single username", file=report)
         sys.exit(1)
 
+    # Make sure that the optional dependencies of the engine are available
+    # before spending any time on loading the site data.
+    if args.engine == "asyncio":
+        try:
+            import sherlock_project.aio  # noqa: F401
+        except ImportError as error:
+            print(f"ERROR:  {error}", file=report)
+            sys.exit(1)
+
     # Create object with all information about sites we are aware of.
     try:
         if args.local:
@@ -754,7 +1723,7 @@ def main():
 
                     # Check if it's a valid pull request
                     if "message" in pull_request_json:
-                        print(f"ERROR: Pull request #{pull_number} not found.")
+                        print(f"ERROR: Pull request #{pull_number} not found.", file=report)
                         sys.exit(1)
 
                     head_commit_sha = pull_request_json["head"]["sha"]
@@ -764,46 +1733,82 @@ def main():
                 data_file_path=json_file_location,
                 honor_exclusions=not args.ignore_exclusions,
                 do_not_exclude=args.site_list,
+                max_age=args.manifest_max_age,
             )
     except Exception as error:
-        print(f"ERROR:  {error}")
+        print(f"ERROR:  {error}", file=report)
         sys.exit(1)
 
     if not args.nsfw:
         sites.remove_nsfw_sites(do_not_remove=args.site_list)
 
-    # Create original dictionary from SitesInformation() object.
-    # Eventually, the rest of the code will be updated to use the new object
-    # directly, but this will glue the two pieces together.
-    site_data_all = {site.name: site.information for site in sites}
+    # Create dictionary of the check plans of the sites to query.  The sites
+    # are only compiled when they are first used, so a sub-set of the site
+    # list is selected by name alone.
     if args.site_list == []:
         # Not desired to look at a sub-set of sites
-        site_data = site_data_all
+        site_data = {site.name: site.check for site in sites}
     else:
         # User desires to selectively run queries on a sub-set of the site list.
         # Make sure that the sites are supported & build up pruned site database.
-        site_data = {}
-        site_missing = []
-        for site in args.site_list:
-            counter = 0
-            for existing_site in site_data_all:
-                if site.lower() == existing_site.lower():
-                    site_data[existing_site] = site_data_all[existing_site]
-                    counter += 1
-            if counter == 0:
-                # Build up list of sites not supported for future error message.
-                site_missing.append(f"'{site}'")
+        selected = sites.select(names=args.site_list)
+        site_data = {site_name: site.check for site_name, site in selected.items()}
+        found = {site_name.casefold() for site_name in selected}
+        # Build up list of sites not supported for future error message.
+        site_missing = [f"'{site}'" for site in args.site_list if site.casefold() not in found]
 
         if site_missing:
-            print(f"Error: Desired sites not found: {', '.join(site_missing)}.")
+            print(f"Error: Desired sites not found: {', '.join(site_missing)}.", file=report)
 
         if not site_data:
             sys.exit(1)
 
-    # Create notify object for query results.
-    query_notify = QueryNotifyPrint(
-        result=None, verbose=args.verbose, print_all=args.print_all, browse=args.browse
-    )
+    # Create notify object for query results.  The report files are
+    # written as the results arrive, alongside the printed output.
+    notifiers = []
+    if args.ndjson != "-":
+        notifiers.append(
+            QueryNotifyPrint(
+                result=None, verbose=args.verbose, print_all=args.print_all, browse=args.browse
+            )
+        )
+    if args.ndjson is not None:
+        notifiers.append(QueryNotifyNDJSON(output=args.ndjson))
+    if args.output_txt:
+        notifiers.append(
+            QueryNotifyTXT(output=args.output, folderoutput=args.folderoutput)
+        )
+    if args.csv:
+        notifiers.append(
+            QueryNotifyCSV(
+                site_data,
+                folderoutput=args.folderoutput,
+                print_all=args.print_all,
+                print_found=args.print_found,
+                timings=args.timings is not None,
+            )
+        )
+    if args.xlsx:
+        notifiers.append(
+            QueryNotifyXLSX(
+                site_data,
+                print_all=args.print_all,
+                print_found=args.print_found,
+                timings=args.timings is not None,
+            )
+        )
+    timings = None
+    if args.timings is not None:
+        timings = QueryNotifyTimings(output=args.timings or None)
+        notifiers.append(timings)
+    journal = None
+    if args.journal is not None:
+        # Imported here, as only journaled scans need it.
+        from sherlock_project.journal import QueryNotifyJournal, ScanJournal, resume_batch
+
+        journal = ScanJournal(args.journal)
+        notifiers.append(QueryNotifyJournal(journal))
+    query_notify = QueryNotifyMultiple(notifiers)
 
     # Run report on all specified users.
     all_usernames = []
@@ -813,122 +1818,110 @@ def main():
                 all_usernames.append(name)
         else:
             all_usernames.append(username)
-    for username in all_usernames:
-        results = sherlock(
-            username,
+
+    # Response bodies are only kept in the results when they are dumped.
+    retention = BodyRetention() if args.dump_response else None
+
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(args.cache or None, ttls=dict(args.cache_ttls))
+
+    latency = None
+    if args.latency is not None:
+        latency = LatencyStats(args.latency or None)
+
+    metrics = None
+    metrics_server = None
+    metrics_writer = None
+    if args.metrics_port is not None or args.metrics_textfile is not None:
+        # Imported here, as only scans which export metrics need them.
+        from sherlock_project.metrics import MetricsServer, TextfileWriter
+
+        metrics = ScanMetrics()
+        if args.metrics_port is not None:
+            try:
+                metrics_server = MetricsServer(
+                    (args.metrics_host, args.metrics_port), metrics
+                ).start()
+            except OSError as error:
+                print(f"ERROR:  Cannot serve metrics on port {args.metrics_port}: {error}", file=report)
+                sys.exit(1)
+        if args.metrics_textfile is not None:
+            metrics_writer = TextfileWriter(metrics, args.metrics_textfile).start()
+
+    run_batch = sherlock_batch
+    options = {}
+    if args.processes > 1:
+        # Imported here, as only scans split between processes need it.
+        from sherlock_project.sharding import sherlock_sharded
+
+        run_batch = sherlock_sharded
+        options = {"processes": args.processes, "shard_by": args.shard_by}
+    if journal is not None:
+        options.update(journal=journal, run_batch=run_batch)
+        run_batch = resume_batch
+
+    profiler = None
+    if args.profile is not None:
+        # Imported here, as only profiled scans need it.
+        from sherlock_project.profiling import ScanProfiler
+
+        profiler = ScanProfiler(args.profile).start()
+
+    try:
+        for username, results in run_batch(
+            all_usernames,
             site_data,
             query_notify,
             dump_response=args.dump_response,
             proxy=args.proxy,
             timeout=args.timeout,
-        )
-
-        if args.output:
-            result_file = args.output
-        elif args.folderoutput:
-            # The usernames results should be stored in a targeted folder.
-            # If the folder doesn't exist, create it first
-            os.makedirs(args.folderoutput, exist_ok=True)
-            result_file = os.path.join(args.folderoutput, f"{username}.txt")
-        else:
-            result_file = f"{username}.txt"
-
-        if args.output_txt:
-            with open(result_file, "w", encoding="utf-8") as file:
-                exists_counter = 0
-                for website_name in results:
-                    dictionary = results[website_name]
-                    if dictionary.get("status").status == QueryStatus.CLAIMED:
-                        exists_counter += 1
-                        file.write(dictionary["url_user"] + "\n")
-                file.write(f"Total Websites Username Detected On : {exists_counter}\n")
-
-        if args.csv:
-            result_file = f"{username}.csv"
-            if args.folderoutput:
-                # The usernames results should be stored in a targeted folder.
-                # If the folder doesn't exist, create it first
-                os.makedirs(args.folderoutput, exist_ok=True)
-                result_file = os.path.join(args.folderoutput, result_file)
-
-            with open(result_file, "w", newline="", encoding="utf-8") as csv_report:
-                writer = csv.writer(csv_report)
-                writer.writerow(
-                    [
-                        "username",
-                        "name",
-                        "url_main",
-                        "url_user",
-                        "exists",
-                        "http_status",
-                        "response_time_s",
-                    ]
-                )
-                for site in results:
-                    if (
-                        args.print_found
-                        and not args.print_all
-                        and results[site]["status"].status != QueryStatus.CLAIMED
-                    ):
-                        continue
-
-                    response_time_s = results[site]["status"].query_time
-                    if response_time_s is None:
-                        response_time_s = ""
-                    writer.writerow(
-                        [
-                            username,
-                            site,
-                            results[site]["url_main"],
-                            results[site]["url_user"],
-                            str(results[site]["status"].status),
-                            results[site]["http_status"],
-                            response_time_s,
-                        ]
-                    )
-        if args.xlsx:
-            usernames = []
-            names = []
-            url_main = []
-            url_user = []
-            exists = []
-            http_status = []
-            response_time_s = []
-
-            for site in results:
-                if (
-                    args.print_found
-                    and not args.print_all
-                    and results[site]["status"].status != QueryStatus.CLAIMED
-                ):
-                    continue
-
-                if response_time_s is None:
-                    response_time_s.append("")
-                else:
-                    response_time_s.append(results[site]["status"].query_time)
-                usernames.append(username)
-                names.append(site)
-                url_main.append(results[site]["url_main"])
-                url_user.append(results[site]["url_user"])
-                exists.append(str(results[site]["status"].status))
-                http_status.append(results[site]["http_status"])
-
-            DataFrame = pd.DataFrame(
-                {
-                    "username": usernames,
-                    "name": names,
-                    "url_main": [f'=HYPERLINK(\"{u}\")' for u in url_main],
-                    "url_user": [f'=HYPERLINK(\"{u}\")' for u in url_user],
-                    "exists": exists,
-                    "http_status": http_status,
-                    "response_time_s": response_time_s,
-                }
-            )
-            DataFrame.to_excel(f"{username}.xlsx", sheet_name="sheet1", index=False)
-
-        print()
-    query_notify.finish()
+            engine=args.engine,
+            max_in_flight=args.max_in_flight,
+            max_per_host=args.max_per_host,
+            keep_bodies=retention or False,
+            cache=cache,
+            latency=latency,
+            deadline=args.deadline,
+            metrics=metrics,
+            **options,
+        ):
+            print(file=report)
+    except SystemExit:
+        # Ctrl-C:  the reports and the journal are closed below with every
+        # result which arrived so far.
+        if journal is not None:
+            print(f"\nInterrupted.  Resume the scan with --journal {args.journal} --resume",
+                  file=report)
+        raise
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        query_notify.finish()
+        if journal is not None:
+            journal.close()
+        if cache is not None:
+            cache.close()
+        if latency is not None:
+            latency.close()
+        if metrics_writer is not None:
+            metrics_writer.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+
+    # Never wait for the update check:  if it has not finished yet, the
+    # answer will be in its cache next time.
+    if update_check is not None and update_check.message() is not None:
+        print(update_check.message(), file=report)
+
+    if retention is not None:
+        print(retention, file=report)
+
+    if timings is not None:
+        print(timings, file=report)
+
+    if profiler is not None:
+        print(profiler, file=report)
 
 
 if __name__ == "__main__":
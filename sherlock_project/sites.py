@@ -3,17 +3,40 @@
 This module supports storing information about websites.
 This is the raw data that will be used to search for usernames.
 """
-import json
+import os
 import requests
 import secrets
+import sys
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sherlock_project.cache import cache_dir
+from sherlock_project.checks import SiteCheck
+from sherlock_project.fetch import DEFAULT_MAX_AGE
+from sherlock_project.fetch import fetch_cached
+from sherlock_project.manifest import CompiledManifest
+from sherlock_project.manifest import FLAG_EXCLUDED
+from sherlock_project.manifest import FLAG_NSFW
+from sherlock_project.manifest import MAGIC
+from sherlock_project.manifest import is_compiled
+from sherlock_project.manifest import load_manifest
 
 
 MANIFEST_URL = "https://data.sherlockproject.xyz"
 EXCLUSIONS_URL = "https://raw.githubusercontent.com/sherlock-project/sherlock/refs/heads/exclusions/false_positive_exclusions.txt"
 
+def warn_if_stale(response, description):
+    """Warn that a cached copy is in use because the server could not be reached."""
+    if response.source == "stale":
+        fetched_at = datetime.fromtimestamp(response.fetched_at).strftime("%Y-%m-%d %H:%M")
+        print(f"Warning: Could not refresh the {description} ({response.error}), "
+              f"using the copy cached at {fetched_at}.", file=sys.stderr)
+
+
 class SiteInformation:
     def __init__(self, name, url_home, url_username_format, username_claimed,
-                information, is_nsfw, username_unclaimed=secrets.token_urlsafe(10)):
+                information, is_nsfw, username_unclaimed=None):
         """Create Site Information Object.
 
         Contains information about a specific website.
@@ -36,6 +59,8 @@ class SiteInformation:
                                   to be claimed on website.
         username_unclaimed     -- String containing username which is known
                                   to be unclaimed on website.
+                                  Default of None makes up a random one
+                                  when it is first used.
         information            -- Dictionary containing all known information
                                   about website.
                                   NOTE:  Custom information about how to
@@ -49,6 +74,10 @@ class SiteInformation:
 
         Return Value:
         Nothing.
+
+        NOTE:  The information is compiled into a SiteCheck() object, which
+               is available as the check attribute.  This raises a KeyError
+               or ValueError if the information is not usable.
         """
 
         self.name = name
@@ -56,12 +85,24 @@ class SiteInformation:
         self.url_username_format = url_username_format
 
         self.username_claimed = username_claimed
-        self.username_unclaimed = secrets.token_urlsafe(32)
+        self._username_unclaimed = username_unclaimed
         self.information = information
         self.is_nsfw  = is_nsfw
+        self.check = SiteCheck(name, information)
 
         return
 
+    @property
+    def username_unclaimed(self):
+        """Username which is known to be unclaimed on website."""
+        if self._username_unclaimed is None:
+            self._username_unclaimed = secrets.token_urlsafe(32)
+        return self._username_unclaimed
+
+    @username_unclaimed.setter
+    def username_unclaimed(self, username):
+        self._username_unclaimed = username
+
     def __str__(self):
         """Convert Object To String.
 
@@ -75,12 +116,159 @@ class SiteInformation:
         return f"{self.name} ({self.url_home})"
 
 
+class SiteMap(Mapping):
+    """Site Map Object.
+
+    Mapping of site names to SiteInformation() objects, in the order of the
+    manifest.  The object of a site is only created the first time it is
+    looked up, and is shared with the other maps made by subset().
+    """
+    def __init__(self, manifest, names, built=None):
+        """Create Site Map Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        manifest               -- CompiledManifest() object to take the
+                                  sites from.
+        names                  -- List of the names of the sites in the map.
+        built                  -- Dictionary of the SiteInformation() objects
+                                  created so far, keyed by site name.
+                                  Default of None starts a new one.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.manifest = manifest
+        self.names = dict.fromkeys(names)
+        self.built = {} if built is None else built
+        self._sorted_names = None
+
+        return
+
+    def __getitem__(self, site_name):
+        if site_name not in self.names:
+            raise KeyError(site_name)
+        site = self.built.get(site_name)
+        if site is None:
+            information = self.manifest.information(site_name)
+            site = SiteInformation(site_name,
+                                   information["urlMain"],
+                                   information["url"],
+                                   information["username_claimed"],
+                                   information,
+                                   information.get("isNSFW", False)
+                                   )
+            # Threads which look up the same site at the same time all get
+            # the object which was stored first.
+            site = self.built.setdefault(site_name, site)
+        return site
+
+    def __contains__(self, site_name):
+        return site_name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_nsfw(self, site_name):
+        """Return True if the site is Not Safe For Work, without creating it."""
+        return bool(self.manifest.flags(site_name) & FLAG_NSFW)
+
+    def subset(self, names):
+        """Return a SiteMap() of the given sites, sharing this one's objects."""
+        return SiteMap(self.manifest, names, self.built)
+
+    def sorted_names(self):
+        """List of the names of the sites, sorted case-insensitively."""
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.names, key=str.lower)
+        return self._sorted_names
+
+    def select(self, names=None, nsfw=None, error_type=None, host=None, tags=None):
+        """Select Sites.
+
+        Selects sites from this map by the indexes of the manifest, without
+        creating the objects of any sites.  Each argument which is given
+        narrows the selection further.
+
+        Keyword Arguments:
+        self                   -- This object.
+        names                  -- Site name, or iterable of site names,
+                                  matched case-insensitively.
+                                  Default of None selects any name.
+        nsfw                   -- Boolean selecting only sites which are
+                                  (True) or are not (False) Not Safe For
+                                  Work.  Default of None selects either.
+        error_type             -- Error type, or iterable of error types, of
+                                  which the sites must use at least one.
+                                  Default of None selects any error type.
+        host                   -- Host name, or iterable of host names, of
+                                  the home page of the sites, matched
+                                  case-insensitively.
+                                  Default of None selects any host.
+        tags                   -- Tag, or iterable of tags, of which the
+                                  sites must have at least one, matched
+                                  case-insensitively.
+                                  Default of None selects any tags.
+
+        Return Value:
+        SiteMap() object of the selected sites, sharing this one's objects.
+        The sites are in the order of names if given, otherwise in the order
+        of the manifest.
+        """
+
+        indexes = self.manifest.indexes
+        selections = []
+        for key, values, fold in (("error_type", error_type, False),
+                                  ("host", host, True),
+                                  ("tag", tags, True)):
+            if values is None:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            index = indexes[key]
+            selection = set()
+            for value in values:
+                selection.update(index.get(value.casefold() if fold else value, ()))
+            selections.append(selection)
+        selections.sort(key=len)
+
+        if names is not None:
+            if isinstance(names, str):
+                names = [names]
+            candidates = []
+            for name in names:
+                candidates.extend(indexes["name"].get(name.casefold(), ()))
+            candidates = dict.fromkeys(candidates)
+        elif selections:
+            candidates = sorted(selections.pop(0), key=self.manifest.positions.__getitem__)
+        else:
+            candidates = self.names
+
+        selected = []
+        for site_name in candidates:
+            if site_name not in self.names:
+                continue
+            if nsfw is not None and self.is_nsfw(site_name) != nsfw:
+                continue
+            if not all(site_name in selection for selection in selections):
+                continue
+            selected.append(site_name)
+
+        return self.subset(selected)
+
+
 class SitesInformation:
     def __init__(
             self,
             data_file_path: str|None = None,
             honor_exclusions: bool = True,
             do_not_exclude: list[str] = [],
+            max_age: float = DEFAULT_MAX_AGE,
+            cache_directory: str|None = None,
         ):
         """Create Sites Information Object.
 
@@ -89,7 +277,10 @@ class SitesInformation:
         Keyword Arguments:
         self                   -- This object.
         data_file_path         -- String which indicates path to data file.
-                                  The file name must end in ".json".
+                                  The file may be the JSON manifest, or a
+                                  manifest compiled ahead of time by
+                                  "python -m sherlock_project.manifest",
+                                  which already includes the exclusions.
 
                                   There are 3 possible formats:
                                    * Absolute File Format
@@ -110,6 +301,19 @@ class SitesInformation:
 
                                   If this option is not specified, then a
                                   default site list will be used.
+        honor_exclusions       -- Boolean indicating if the list of sites
+                                  known to give false positives should be
+                                  downloaded, and those sites left out.
+        do_not_exclude         -- List of site names to keep even if they
+                                  are in the list of exclusions.
+        max_age                -- Number of seconds for which cached copies
+                                  of the data file (if at a URL) and of the
+                                  exclusions are used without revalidating
+                                  them with the server.  Cached copies are
+                                  also used when the server cannot be
+                                  reached.  Default is DEFAULT_MAX_AGE.
+        cache_directory        -- String containing directory to keep cached
+                                  copies in, or None for the default.
 
         Return Value:
         Nothing.
@@ -121,87 +325,72 @@ class SitesInformation:
             # users from creating issue about false positives which has already been fixed or having outdated data
             data_file_path = MANIFEST_URL
 
-        if data_file_path.lower().startswith("http"):
-            # Reference is to a URL.
-            try:
-                response = requests.get(url=data_file_path, timeout=30)
-            except Exception as error:
-                raise FileNotFoundError(
-                    f"Problem while attempting to access data file URL '{data_file_path}':  {error}"
-                )
-
-            if response.status_code != 200:
-                raise FileNotFoundError(f"Bad response while accessing "
-                                        f"data file URL '{data_file_path}'."
-                                        )
-            try:
-                site_data = response.json()
-            except Exception as error:
-                raise ValueError(
-                    f"Problem parsing json contents at '{data_file_path}':  {error}."
-                )
-
+        if cache_directory is None:
+            manifests_directory = os.path.join(cache_dir(), "manifests")
         else:
+            manifests_directory = os.path.join(cache_directory, "manifests")
+
+        manifest = None
+        if not data_file_path.lower().startswith("http"):
             # Reference is to a file.
             try:
-                with open(data_file_path, "r", encoding="utf-8") as file:
-                    try:
-                        site_data = json.load(file)
-                    except Exception as error:
-                        raise ValueError(
-                            f"Problem parsing json contents at '{data_file_path}':  {error}."
-                        )
-
+                with open(data_file_path, "rb") as file:
+                    content = file.read(len(MAGIC))
+                    if not is_compiled(content):
+                        content += file.read()
             except FileNotFoundError:
                 raise FileNotFoundError(f"Problem while attempting to access "
                                         f"data file '{data_file_path}'."
                                         )
+            if is_compiled(content):
+                # A manifest which was compiled ahead of time, together with
+                # its exclusions.
+                manifest = CompiledManifest.open(data_file_path)
+
+        # The exclusions are fetched while the data file is being loaded.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            exclusions_future = None
+            if honor_exclusions and manifest is None:
+                exclusions_future = executor.submit(
+                    fetch_cached, EXCLUSIONS_URL, 10, max_age, cache_directory
+                )
 
-        site_data.pop('$schema', None)
-
-        if honor_exclusions:
-            try:
-                response = requests.get(url=EXCLUSIONS_URL, timeout=10)
-                if response.status_code == 200:
+            if data_file_path.lower().startswith("http"):
+                # Reference is to a URL.
+                try:
+                    response = fetch_cached(data_file_path, 30, max_age, cache_directory)
+                except requests.HTTPError:
+                    raise FileNotFoundError(f"Bad response while accessing "
+                                            f"data file URL '{data_file_path}'."
+                                            )
+                except Exception as error:
+                    raise FileNotFoundError(
+                        f"Problem while attempting to access data file URL '{data_file_path}':  {error}"
+                    )
+                warn_if_stale(response, "data file")
+                content = response.content
+
+            exclusions = []
+            if exclusions_future is not None:
+                try:
+                    response = exclusions_future.result()
+                    warn_if_stale(response, "exclusions")
                     exclusions = response.text.splitlines()
                     exclusions = [exclusion.strip() for exclusion in exclusions]
 
-                    for site in do_not_exclude:
-                        if site in exclusions:
-                            exclusions.remove(site)
+                except Exception:
+                    # If there was any problem loading the exclusions, just continue without them
+                    print("Warning: Could not load exclusions, continuing without them.", file=sys.stderr)
 
-                    for exclusion in exclusions:
-                        try:
-                            site_data.pop(exclusion, None)
-                        except KeyError:
-                            pass
+        if manifest is None:
+            manifest = load_manifest(content, exclusions, data_file_path, manifests_directory)
 
-            except Exception:
-                # If there was any problem loading the exclusions, just continue without them
-                print("Warning: Could not load exclusions, continuing without them.")
-                honor_exclusions = False
-
-        self.sites = {}
-
-        # Add all site information from the json file to internal site list.
-        for site_name in site_data:
-            try:
-
-                self.sites[site_name] = \
-                    SiteInformation(site_name,
-                                    site_data[site_name]["urlMain"],
-                                    site_data[site_name]["url"],
-                                    site_data[site_name]["username_claimed"],
-                                    site_data[site_name],
-                                    site_data[site_name].get("isNSFW",False)
-
-                                    )
-            except KeyError as error:
-                raise ValueError(
-                    f"Problem parsing json contents at '{data_file_path}':  Missing attribute {error}."
-                )
-            except TypeError:
-                print(f"Encountered TypeError parsing json contents for target '{site_name}' at {data_file_path}\nSkipping target.\n")
+        do_not_exclude = set(do_not_exclude)
+        self.sites = SiteMap(manifest, [
+            site_name for site_name in manifest.names()
+            if not (honor_exclusions and manifest.flags(site_name) & FLAG_EXCLUDED)
+            or site_name in do_not_exclude
+        ])
 
         return
 
@@ -215,13 +404,29 @@ class SitesInformation:
         Return Value:
         None
         """
-        sites = {}
-        do_not_remove = [site.casefold() for site in do_not_remove]
-        for site in self.sites:
-            if self.sites[site].is_nsfw and site.casefold() not in do_not_remove:
-                continue
-            sites[site] = self.sites[site]
-        self.sites =  sites
+        do_not_remove = {site.casefold() for site in do_not_remove}
+        self.sites = self.sites.subset([
+            site for site in self.sites
+            if not self.sites.is_nsfw(site) or site.casefold() in do_not_remove
+        ])
+
+    def select(self, names=None, nsfw=None, error_type=None, host=None, tags=None):
+        """Select Sites.
+
+        Keyword Arguments:
+        self                   -- This object.
+        names, nsfw, error_type, host, tags
+                               -- Criteria of the selection, as taken by
+                                  SiteMap.select().
+
+        Return Value:
+        SiteMap() object of the selected sites, which is a view of this
+        object's sites.  The information of the sites is not copied, and
+        the objects of the sites are only created when they are looked up.
+        """
+
+        return self.sites.select(names=names, nsfw=nsfw, error_type=error_type,
+                                 host=host, tags=tags)
 
     def site_name_list(self):
         """Get Site Name List.
@@ -233,7 +438,7 @@ class SitesInformation:
         List of strings containing names of sites.
         """
 
-        return sorted([site.name for site in self], key=str.lower)
+        return list(self.sites.sorted_names())
 
     def __iter__(self):
         """Iterator For Object.
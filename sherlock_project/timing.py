@@ -0,0 +1,181 @@
+"""Sherlock Timing Module
+
+This module breaks the time taken by each probe down into the phases that
+it goes through, so that a slow scan can be traced to where its time went:
+waiting for a slot, connecting, the TLS handshake, waiting for the first
+byte of the response, reading the body, and working out the status.
+"""
+import threading
+from time import monotonic
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# Phases of a probe, in the order that they happen.  All are wall-clock
+# seconds, except for "detect", which is CPU seconds.
+PHASES = ("queued", "connect", "tls", "first_byte", "body", "detect")
+
+# Timer of the probe which the current worker thread is sending.
+_running = threading.local()
+
+
+def current_timer():
+    """Return the ProbeTimer() of the probe running in this thread, or None."""
+    return getattr(_running, "timer", None)
+
+
+def add_time(phase, seconds):
+    """Add seconds to a phase of the probe running in this thread, if any."""
+    timer = current_timer()
+    if timer is not None:
+        timer.add(phase, seconds)
+
+
+class ProbeTimer:
+    def __init__(self):
+        """Create Probe Timer Object.
+
+        Created when a probe is submitted, and filled in as the probe goes
+        through its phases.  A phase which the probe never went through,
+        or which could not be measured, is left as None:  there is no TLS
+        phase for plain HTTP, nor for the asyncio engine, where it is part
+        of connecting.  Connecting takes no time when a connection was
+        reused, and a probe which failed keeps the phases it got through.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.submitted = monotonic()
+        self.started = None
+        self.seconds = dict.fromkeys(PHASES)
+
+        return
+
+    def start(self):
+        """Record that the probe has left the queue, and is being sent."""
+        self.started = monotonic()
+        self.seconds["queued"] = self.started - self.submitted
+
+    def add(self, phase, seconds):
+        """Add seconds to a phase, which counts as measured from then on."""
+        self.seconds[phase] = (self.seconds[phase] or 0.0) + seconds
+
+    def responded(self):
+        """Record that the headers of a response have arrived.
+
+        The wait for the first byte is what is left of the time since the
+        probe started, once connecting and reading the bodies of earlier
+        responses (of redirects) are taken out.
+        """
+        if self.started is None:
+            return
+        waited = monotonic() - self.started
+        for phase in ("connect", "tls", "body"):
+            waited -= self.seconds[phase] or 0.0
+        self.seconds["first_byte"] = max(waited, 0.0)
+
+    def timings(self):
+        """Return a dictionary of the seconds spent in each phase."""
+        return dict(self.seconds)
+
+
+class TimedSession(requests.Session):
+    """Timed Session Object.
+
+    Session which accepts a ProbeTimer() for each request, and makes it the
+    timer of the worker thread for as long as the request runs, so that
+    the connection pool and the response hooks can fill it in.
+    """
+
+    def request(self, method, url, *args, timer=None, **kwargs):
+        if timer is None:
+            return super().request(method, url, *args, **kwargs)
+
+        timer.start()
+        _running.timer = timer
+        try:
+            return super().request(method, url, *args, **kwargs)
+        finally:
+            _running.timer = None
+
+
+class TimedConnectionMixin:
+    """Time the opening of new connections (name lookup and TCP handshake)."""
+
+    def _new_conn(self):
+        started = monotonic()
+        try:
+            sock = super()._new_conn()
+        finally:
+            add_time("connect", monotonic() - started)
+        self.connected_at = monotonic()
+        return sock
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        # Whatever connecting takes once there is a socket is the handshake.
+        self.connected_at = None
+        try:
+            super().connect()
+        finally:
+            if self.connected_at is not None:
+                add_time("tls", monotonic() - self.connected_at)
+
+
+class TimedPoolMixin:
+    """Count the phases of connecting as taking no time when a connection is reused."""
+
+    # Phases which a new connection of the pool goes through.
+    connect_phases = ("connect",)
+
+    def _get_conn(self, *args, **kwargs):
+        conn = super()._get_conn(*args, **kwargs)
+        if getattr(conn, "sock", None) is not None:
+            for phase in self.connect_phases:
+                add_time(phase, 0.0)
+        return conn
+
+
+class TimedHTTPConnectionPool(TimedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(TimedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+    connect_phases = ("connect", "tls")
+
+
+TIMED_POOL_CLASSES = {
+    "http": TimedHTTPConnectionPool,
+    "https": TimedHTTPSConnectionPool,
+}
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Timed HTTP Adapter Object.
+
+    Adapter whose connection pools time connecting and the TLS handshake.
+    Connections through SOCKS proxies are not timed.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if not proxy.lower().startswith("socks"):
+            manager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+        return manager
@@ -0,0 +1,87 @@
+"""Sherlock Update Module
+
+This module checks in the background whether a newer release of Sherlock
+is available, so that the check never holds up a scan.
+"""
+import threading
+
+import sherlock_project
+from sherlock_project.__init__ import forge_api_latest_release
+from sherlock_project.fetch import fetch_cached
+
+
+# Default number of seconds for which the latest release is remembered
+# before asking the forge again.
+DEFAULT_UPDATE_INTERVAL = 24 * 60 * 60
+
+
+class UpdateCheck:
+    def __init__(self, interval=DEFAULT_UPDATE_INTERVAL, cache_directory=None):
+        """Create Update Check Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        interval               -- Number of seconds for which the answer of
+                                  the forge is cached on disk before asking
+                                  again.  Default is DEFAULT_UPDATE_INTERVAL.
+        cache_directory        -- String containing directory to cache the
+                                  answer in, or None for the default.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.interval = interval
+        self.cache_directory = cache_directory
+        self.latest_version = None
+        self.url = None
+        self.error = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sherlock-update-check", daemon=True)
+
+        return
+
+    def start(self):
+        """Start the check on a background thread, and return this object."""
+        self.thread.start()
+        return self
+
+    def run(self):
+        """Run the check.  Any problem is recorded rather than raised."""
+        try:
+            response = fetch_cached(
+                forge_api_latest_release,
+                10,
+                max_age=self.interval,
+                cache_directory=self.cache_directory,
+                headers={"Accept": "application/vnd.github+json"},
+            )
+            latest_release = response.json()
+            self.latest_version = latest_release["tag_name"].removeprefix("v")
+            self.url = latest_release["html_url"]
+        except Exception as error:
+            self.error = error
+        finally:
+            self.done.set()
+
+    def message(self):
+        """Message.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        String to show the user about the outcome of the check, or None if
+        there is nothing to say, or the check has not finished yet.  This
+        never waits for the check.
+        """
+
+        if not self.done.is_set():
+            return None
+        if self.error is not None:
+            return f"A problem occurred while checking for an update: {self.error}"
+        version = sherlock_project.__version__
+        if self.latest_version != version:
+            return f"Update available! {version} --> {self.latest_version}\n{self.url}"
+
+        return None
@@ -49,3 +49,23 @@ def pytest_generate_tests(metafunc):
         params = [{name: data} for name, data in sites_info.items()]
         ids = list(sites_info.keys())
         metafunc.parametrize("chunked_sites", params, ids=ids)
+
+@pytest.fixture(params=['threads', 'asyncio'])
+def engine(request):
+    if request.param == 'asyncio':
+        pytest.importorskip('aiohttp')
+    return request.param
+
+@pytest.fixture()
+def stub_server():
+    from sherlock_stub_server import StubServer
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture()
+def slow_stub_server():
+    from sherlock_stub_server import StubServer
+    server = StubServer(delay=0.2).start()
+    yield server
+    server.stop()
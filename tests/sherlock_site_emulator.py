@@ -0,0 +1,207 @@
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from sherlock_project.checks import SiteCheck
+from sherlock_project.result import QueryStatus
+
+# Fingerprint taken from the list of WAF hits known to Sherlock
+WAF_FINGERPRINT: str = '<span id="challenge-error-text">'
+
+# Text repeated to pad pages up to their size
+PADDING: str = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>\n"
+
+
+class EmulatorRequestHandler(BaseHTTPRequestHandler):
+    """Answer probes the way the emulated site would, going by its manifest entry"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        emulator = self.server.emulator
+        parts = self.path.lstrip("/").split("/", 1)
+        try:
+            site_name = emulator.names[int(parts[0])]
+        except (ValueError, IndexError):
+            self._respond(404, "<title>Unknown site</title>")
+            return
+        username = unquote(parts[1].split("?", 1)[0]) if len(parts) > 1 else ""
+
+        outcome, delay = emulator.outcome(site_name, username)
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(delay)
+
+        if outcome == "error":
+            # Hang up without answering, as an overloaded site would.
+            self.close_connection = True
+            return
+        if outcome == "waf":
+            self._respond(403, emulator.page(site_name, WAF_FINGERPRINT))
+            return
+        if outcome == "claimed":
+            self._respond(200, emulator.page(site_name, f"<title>Profile of {username}</title>"))
+            return
+
+        net_info = emulator.site_data[site_name]
+        error_type = net_info["errorType"]
+        error_type = [error_type] if isinstance(error_type, str) else error_type
+        status = 200
+        headers = {}
+        message = "<title>Not Found</title>"
+        if "message" in error_type:
+            error_msg = net_info["errorMsg"]
+            message = error_msg if isinstance(error_msg, str) else error_msg[0]
+        if "status_code" in error_type:
+            error_code = net_info.get("errorCode", 404)
+            status = error_code if isinstance(error_code, int) else error_code[0]
+        if "response_url" in error_type:
+            status = 302
+            headers["Location"] = net_info.get("errorUrl") or "/"
+        self._respond(status, emulator.page(site_name, message), headers)
+
+    def _respond(self, status: int, body: str, headers: dict | None = None):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        try:
+            self.wfile.write(payload)
+        except OSError:
+            # The client hung up early, as it may once it has seen enough
+            self.close_connection = True
+
+    do_GET = _handle
+    do_HEAD = _handle
+    do_POST = _handle
+    do_PUT = _handle
+
+
+class EmulatorHTTPServer(ThreadingHTTPServer):
+    # Accept bursts of connections without the kernel dropping any
+    request_queue_size = 512
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early is expected, anything else is not
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class SiteEmulator:
+    """Local HTTP server standing in for every site of a manifest
+
+    Every answer is decided from the seed, the site and the username alone,
+    so that a run can be repeated exactly:  which usernames are claimed,
+    which probes fail or meet a WAF, and how long each answer takes.
+    """
+    def __init__(self, site_data: dict[str, dict], latency: float = 0.0, jitter: float = 0.0,
+                 body_size: int = 2048, error_rate: float = 0.0, waf_rate: float = 0.0,
+                 claimed_rate: float = 0.0, seed: int = 0):
+        self.site_data = site_data
+        self.names = list(site_data)
+        self.latency = latency
+        self.jitter = jitter
+        self.body_size = body_size
+        self.error_rate = error_rate
+        self.waf_rate = waf_rate
+        self.claimed_rate = claimed_rate
+        self.seed = seed
+        self.base_url = None
+        self.httpd = None
+        # Some sites are slower than others:  the typical latency of each
+        # is spread around the given one, with a long tail.
+        self.site_latency = {
+            site_name: latency * random.Random(f"{seed}\0{site_name}").lognormvariate(0, 0.5)
+            for site_name in self.names
+        }
+        self.pages = {}
+
+    def outcome(self, site_name: str, username: str) -> tuple[str, float]:
+        """How the site answers for the username, and after how many seconds"""
+        rng = random.Random(f"{self.seed}\0{site_name}\0{username}")
+        draw = rng.random()
+        if draw < self.error_rate:
+            outcome = "error"
+        elif draw < self.error_rate + self.waf_rate:
+            outcome = "waf"
+        elif username == self.site_data[site_name]["username_claimed"] or rng.random() < self.claimed_rate:
+            outcome = "claimed"
+        else:
+            outcome = "available"
+        delay = max(0.0, self.site_latency[site_name] + rng.uniform(-self.jitter, self.jitter))
+        return outcome, delay
+
+    def expected(self, site_name: str, username: str) -> QueryStatus:
+        """Status which Sherlock should report for the username on the site"""
+        check = SiteCheck(site_name, self.site_data[site_name])
+        if check.regex_check and check.regex_check.search(username) is None:
+            return QueryStatus.ILLEGAL
+        outcome = self.outcome(site_name, username)[0]
+        if outcome == "waf" and check.method == "HEAD":
+            # The page is not sent, so only the status code of the WAF is seen.
+            return QueryStatus.AVAILABLE
+        return {
+            "error": QueryStatus.UNKNOWN,
+            "waf": QueryStatus.WAF,
+            "claimed": QueryStatus.CLAIMED,
+            "available": QueryStatus.AVAILABLE,
+        }[outcome]
+
+    def page(self, site_name: str, content: str) -> str:
+        """Page of about body_size characters, with the content in the middle"""
+        size = self.pages.get(site_name)
+        if size is None:
+            # Pages vary in size from site to site, but not between probes.
+            size = int(self.body_size * random.Random(f"{self.seed}\0{site_name}\0size").uniform(0.5, 1.5))
+            self.pages[site_name] = size
+        half = PADDING * (size // 2 // len(PADDING) + 1)
+        half = half[:size // 2]
+        # No <html> or <body> tags, as some sites take those for an error.
+        return f"<main>{half}{content}{half}</main>"
+
+    def manifest(self) -> dict[str, dict]:
+        """Site data of the emulated sites, pointed at this server"""
+        site_data = {}
+        for index, site_name in enumerate(self.names):
+            net_info = dict(self.site_data[site_name])
+            net_info["url"] = f"{self.base_url}/{index}/{{}}"
+            net_info["urlMain"] = f"{self.base_url}/"
+            if "urlProbe" in net_info:
+                net_info["urlProbe"] = f"{self.base_url}/{index}/{{}}"
+            if "errorUrl" in net_info:
+                net_info["errorUrl"] = f"{self.base_url}/"
+            site_data[site_name] = net_info
+        return site_data
+
+    @property
+    def requests(self) -> int:
+        return self.httpd.requests
+
+    def start(self, port: int = 0) -> "SiteEmulator":
+        self.httpd = EmulatorHTTPServer(("127.0.0.1", port), EmulatorRequestHandler)
+        self.httpd.emulator = self
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        host, port = self.httpd.server_address[:2]
+        self.base_url = f"http://{host}:{port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
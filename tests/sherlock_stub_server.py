@@ -0,0 +1,280 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Usernames starting with this prefix are reported as existing by the stub
+CLAIMED_PREFIX: str = "claimed"
+
+# Fingerprint taken from the list of WAF hits known to Sherlock
+WAF_BODY: str = '<html><span id="challenge-error-text">Checking your browser</span></html>'
+
+# Size of the padding which follows the title of heavy pages
+HEAVY_PADDING: int = 4 * 1024 * 1024
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Answer probes the way the various kinds of target sites would"""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status: int, body: str = "", headers: dict | None = None):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def _respond_heavy(self, title: str):
+        """Send a small title followed by a large amount of padding"""
+        head = f"<html><head><title>{title}</title></head><body>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(head) + HEAVY_PADDING))
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        padding = b" " * 65536
+        try:
+            self.wfile.write(head)
+            for _ in range(HEAVY_PADDING // len(padding)):
+                self.wfile.write(padding)
+        except OSError:
+            # The client hung up early, as it is meant to
+            self.close_connection = True
+
+    def _respond_file(self, name: str):
+        """Serve one of the server's files, honouring conditional requests"""
+        if name not in self.server.files:
+            self._respond(404, "Not Found")
+            return
+        content, etag = self.server.files[name]
+        headers = {"ETag": etag, "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            for header, value in headers.items():
+                self.send_header(header, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._respond(200, content, headers)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request_body = self.rfile.read(length) if length else b""
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path))
+            self.server.in_flight += 1
+            self.server.peak_in_flight = max(self.server.peak_in_flight, self.server.in_flight)
+        try:
+            self._answer(request_body)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _answer(self, request_body: bytes):
+
+        parts = self.path.strip("/").split("/")
+        kind = parts[0]
+        username = parts[1] if len(parts) > 1 else ""
+        if kind == "api":
+            username = json.loads(request_body or b"{}").get("name", "")
+        claimed = username.startswith(CLAIMED_PREFIX)
+
+        if kind == "slow":
+            time.sleep(self.server.delay)
+            kind = "status"
+
+        if kind == "status":
+            self._respond(200 if claimed else 404, f"<title>{username}</title>")
+        elif kind in ("message", "api"):
+            if claimed:
+                self._respond(200, f"<title>Profile of {username}</title>")
+            else:
+                self._respond(200, "<title>User Not Found</title>")
+        elif kind == "redirect":
+            if claimed:
+                self._respond(200, f"<title>Profile of {username}</title>")
+            else:
+                self._respond(302, "", {"Location": "/"})
+        elif kind == "waf":
+            self._respond(403, WAF_BODY)
+        elif kind == "late-waf":
+            # An error message, and a few chunks further on a WAF challenge
+            self._respond(200, "<title>User Not Found</title>" + " " * 40 * 1024 + WAF_BODY)
+        elif kind == "heavy":
+            self._respond_heavy("Profile" if claimed else "User Not Found")
+        elif kind == "files":
+            self._respond_file(username)
+        else:
+            self._respond(200, "<title>Home</title>")
+
+    do_GET = _handle
+    do_HEAD = _handle
+    do_POST = _handle
+    do_PUT = _handle
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    # Accept bursts of connections without the kernel dropping any
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early is expected, anything else is not
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """Local HTTP server standing in for the targets of a manifest"""
+    def __init__(self, delay: float = 0.0):
+        self.httpd = StubHTTPServer(("127.0.0.1", 0), StubRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = []
+        self.httpd.connections = 0
+        self.httpd.in_flight = 0
+        self.httpd.peak_in_flight = 0
+        self.httpd.delay = delay
+        self.httpd.files = {}
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> list[tuple[str, str]]:
+        return self.httpd.requests
+
+    @property
+    def connections(self) -> int:
+        return self.httpd.connections
+
+    @property
+    def peak_in_flight(self) -> int:
+        return self.httpd.peak_in_flight
+
+    def serve_file(self, name: str, content: str, etag: str) -> str:
+        """Serve content at /files/name with the given ETag, and return its URL"""
+        self.httpd.files[name] = (content, etag)
+        return f"{self.base_url}/files/{name}"
+
+    def start(self) -> "StubServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def slow_manifest(self, count: int) -> dict[str, dict]:
+        """Site data for count sites which all answer after the server's delay"""
+        base = self.base_url
+        return {
+            f"StubSlow{index}": {
+                "url": f"{base}/slow/{{}}",
+                "urlMain": base,
+                "errorType": "status_code",
+                "username_claimed": "claimed",
+            }
+            for index in range(count)
+        }
+
+    def heavy_manifest(self) -> dict[str, dict]:
+        """Site data for sites whose pages are much larger than they need to be"""
+        base = self.base_url
+        return {
+            "StubHeavy": {
+                "url": f"{base}/heavy/{{}}",
+                "urlMain": base,
+                "errorType": "message",
+                "errorMsg": "User Not Found",
+                "username_claimed": "claimed",
+            },
+            "StubHeavyCapped": {
+                "url": f"{base}/heavy/{{}}",
+                "urlMain": base,
+                "errorType": "message",
+                "errorMsg": "User Not Found",
+                "maxBodySize": 65536,
+                "username_claimed": "claimed",
+            },
+        }
+
+    def manifest(self) -> dict[str, dict]:
+        """Site data covering each detection method, pointed at this server"""
+        base = self.base_url
+        return {
+            "StubStatus": {
+                "url": f"{base}/status/{{}}",
+                "urlMain": base,
+                "errorType": "status_code",
+                "username_claimed": "claimed",
+            },
+            "StubMessage": {
+                "url": f"{base}/message/{{}}",
+                "urlMain": base,
+                "errorType": "message",
+                "errorMsg": "User Not Found",
+                "username_claimed": "claimed",
+            },
+            "StubMessageList": {
+                "url": f"{base}/message/{{}}",
+                "urlMain": base,
+                "errorType": "message",
+                "errorMsg": ["Account Suspended", "User Not Found"],
+                "username_claimed": "claimed",
+            },
+            "StubRedirect": {
+                "url": f"{base}/redirect/{{}}",
+                "urlMain": base,
+                "errorType": "response_url",
+                "errorUrl": f"{base}/",
+                "username_claimed": "claimed",
+            },
+            "StubProbe": {
+                "url": f"{base}/users/{{}}",
+                "urlProbe": f"{base}/status/{{}}",
+                "urlMain": base,
+                "errorType": "status_code",
+                "username_claimed": "claimed",
+            },
+            "StubPost": {
+                "url": f"{base}/users/{{}}",
+                "urlProbe": f"{base}/api",
+                "urlMain": base,
+                "request_method": "POST",
+                "request_payload": {"name": "{}"},
+                "errorType": "message",
+                "errorMsg": "User Not Found",
+                "username_claimed": "claimed",
+            },
+            "StubWAF": {
+                "url": f"{base}/waf/{{}}",
+                "urlMain": base,
+                "request_method": "GET",
+                "errorType": "status_code",
+                "username_claimed": "claimed",
+            },
+            "StubRegex": {
+                "url": f"{base}/status/{{}}",
+                "urlMain": base,
+                "regexCheck": "^[a-z]+$",
+                "errorType": "status_code",
+                "username_claimed": "claimed",
+            },
+        }
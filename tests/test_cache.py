@@ -0,0 +1,73 @@
+import pytest
+from sherlock_project import cache as cache_module
+from sherlock_project.cache import ResultCache
+from sherlock_project.checks import compile_site_data
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import QueryResult, QueryStatus
+from sherlock_project.sherlock import sherlock
+
+
+def statuses(results: dict) -> dict[str, QueryStatus]:
+    return {site: result['status'].status for site, result in results.items()}
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_repeat_scan_is_answered_from_cache(stub_server, tmp_path, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    site_data = stub_server.manifest()
+    cache = ResultCache(str(tmp_path / 'results.sqlite3'))
+
+    first = sherlock('claimed', site_data, QueryNotify(), engine=engine, cache=cache)
+    probes = len(stub_server.requests)
+    assert not any(result['status'].cached for result in first.values())
+
+    second = sherlock('claimed', site_data, QueryNotify(), engine=engine, cache=cache)
+    assert len(stub_server.requests) == probes
+    assert statuses(second) == statuses(first)
+    assert all(result['status'].cached for site, result in second.items() if site != 'StubRegex')
+    assert second['StubStatus']['status'].http_status == 200
+    assert second['StubStatus']['url_user'] == first['StubStatus']['url_user']
+
+
+def test_cache_persists_between_instances(stub_server, tmp_path):
+    path = str(tmp_path / 'results.sqlite3')
+    site_data = stub_server.manifest()
+    cache = ResultCache(path)
+    sherlock('nobody', site_data, QueryNotify(), cache=cache)
+    cache.close()
+
+    probes = len(stub_server.requests)
+    results = sherlock('nobody', site_data, QueryNotify(), cache=ResultCache(path))
+    assert len(stub_server.requests) == probes
+    assert results['StubMessage']['status'].status is QueryStatus.AVAILABLE
+
+
+def test_changed_manifest_entry_invalidates_its_results(stub_server, tmp_path):
+    site_data = stub_server.manifest()
+    cache = ResultCache(str(tmp_path / 'results.sqlite3'))
+    sherlock('claimed', site_data, QueryNotify(), cache=cache)
+
+    site_data['StubMessage']['errorMsg'] = 'Profile of'
+    probes = len(stub_server.requests)
+    results = sherlock('claimed', site_data, QueryNotify(), cache=cache)
+    assert stub_server.requests[probes:] == [('GET', '/message/claimed')]
+    assert results['StubMessage']['status'].status is QueryStatus.AVAILABLE
+    assert not results['StubMessage']['status'].cached
+
+
+def test_cache_ttls_per_status(monkeypatch):
+    site_data = compile_site_data({
+        'Example': {'url': 'https://example.com/{}', 'errorType': 'status_code'},
+    })
+    cache = ResultCache(':memory:', ttls={QueryStatus.CLAIMED: 60, QueryStatus.WAF: 0})
+    now = 1000.0
+    monkeypatch.setattr(cache_module, 'time', lambda: now)
+
+    cache.store(site_data['Example'], QueryResult('blocked', 'Example', 'https://example.com/blocked', QueryStatus.WAF))
+    cache.store(site_data['Example'], QueryResult('blue', 'Example', 'https://example.com/blue', QueryStatus.CLAIMED))
+    assert cache.lookup('blocked', site_data) == {}
+    assert cache.lookup('blue', site_data)['Example'].cached
+
+    now += 61
+    assert cache.lookup('blue', site_data) == {}
@@ -0,0 +1,122 @@
+import pytest
+from sherlock_project.checks import DEFAULT_MAX_BODY_SIZE, DEFAULT_USER_AGENT, WAF_HIT_MSGS, WAF_LOOKAHEAD, BodyMatcher, SiteCheck
+from sherlock_project.result import QueryStatus
+
+
+def test_check_normalises_site_information():
+    check = SiteCheck('Example', {
+        'url': 'https://example.com/{}',
+        'urlMain': 'https://example.com/',
+        'urlProbe': 'https://api.example.com/users/{}',
+        'errorType': 'status_code',
+        'errorCode': 404,
+        'regexCheck': '^[a-z]+$',
+        'headers': {'Accept': 'application/json'},
+        'username_claimed': 'blue',
+    })
+    assert check.method == 'HEAD'
+    assert check.allow_redirects is True
+    assert check.error_type == ('status_code',)
+    assert check.error_codes == frozenset([404])
+    assert dict(check.headers) == {'User-Agent': DEFAULT_USER_AGENT, 'Accept': 'application/json'}
+    assert check.allows('blue') and not check.allows('Blue!')
+    assert check.url_user('john doe') == 'https://example.com/john%20doe'
+    assert check.request_url('john') == 'https://api.example.com/users/john'
+    # The check reads like the information it was compiled from
+    assert check['urlMain'] == 'https://example.com/'
+    assert check.get('isNSFW', False) is False
+
+
+def test_check_is_immutable():
+    check = SiteCheck('Example', {'url': 'https://example.com/{}', 'errorType': 'message', 'errorMsg': 'Nope'})
+    assert check.error_msgs == ('Nope',)
+    assert check.method == 'GET'
+    with pytest.raises(AttributeError):
+        check.method = 'POST'
+    with pytest.raises(TypeError):
+        check['url'] = 'https://elsewhere.example/{}'
+    with pytest.raises(TypeError):
+        check.headers['User-Agent'] = 'curl'
+
+
+def test_check_rejects_unusable_information():
+    with pytest.raises(KeyError):
+        SiteCheck('Example', {'url': 'https://example.com/{}'})
+    with pytest.raises(ValueError):
+        SiteCheck('Example', {'url': 'https://example.com/{}', 'errorType': 'status_code', 'request_method': 'TRACE'})
+    with pytest.raises(ValueError):
+        SiteCheck('Example', {'url': 'https://example.com/{}', 'errorType': 'status_code', 'regexCheck': '(['})
+
+
+def test_manifest_compiles(sites_obj):
+    for site in sites_obj:
+        assert site.check.name == site.name
+        assert site.check.information == site.information
+
+
+def test_matcher_prefers_waf_over_error_message():
+    matcher = BodyMatcher(['Not Found'])
+    assert matcher.scan(b'<title>Not Found</title>', 'utf-8') is QueryStatus.AVAILABLE
+    assert matcher.scan(b'<title>Profile</title>', 'utf-8') is None
+    body = f'<title>Not Found</title>{WAF_HIT_MSGS[1]}'
+    assert matcher.scan(body.encode(), 'utf-8') is QueryStatus.WAF
+    # Text which has already been decoded is matched the same way
+    assert matcher.scan(body) is QueryStatus.WAF
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'windows-1251', 'koi8-r', 'utf-16', None])
+def test_matcher_finds_non_ascii_messages(encoding):
+    matcher = BodyMatcher(['Пользователь не найден'])
+    body = '<p>Пользователь не найден</p>'.encode(encoding or 'utf-8')
+    assert matcher.scan(body, encoding) is QueryStatus.AVAILABLE
+    assert matcher.scan('<p>Профиль</p>'.encode(encoding or 'utf-8'), encoding) is None
+
+
+def test_matcher_ignores_messages_the_charset_cannot_hold():
+    matcher = BodyMatcher(['Пользователь не найден'])
+    body = 'Пользователь не найден'.encode('utf-8')
+    # Decoded as Latin-1 the body is mojibake, so the message is not there
+    assert matcher.scan(body, 'ISO-8859-1') is None
+    assert matcher.scan(body, 'no-such-charset') is QueryStatus.AVAILABLE
+
+
+def test_scanner_finds_messages_split_between_chunks():
+    body = ('x' * 100 + 'Пользователь не найден' + 'x' * 100).encode('utf-8')
+    for encoding in ('utf-8', 'utf-16-le'):
+        data = body.decode('utf-8').encode(encoding)
+        for size in (1, 7, 64):
+            scanner = BodyMatcher(['Пользователь не найден']).scanner(encoding)
+            statuses = [scanner.feed(data[i:i + size]) for i in range(0, len(data), size)]
+            assert statuses[-1] is QueryStatus.AVAILABLE
+            assert statuses[0] is None
+
+
+def test_scanner_finds_waf_after_error_message():
+    scanner = BodyMatcher(['User Not Found']).scanner('utf-8')
+    assert scanner.feed(b'<title>User Not Found</title>') is QueryStatus.AVAILABLE
+    # An error message is not final, as a WAF fingerprint may follow it.
+    assert not scanner.final
+    assert scanner.feed(b' ' * 4096) is QueryStatus.AVAILABLE
+    assert scanner.feed(b'<span id="challenge-') is QueryStatus.AVAILABLE
+    assert scanner.feed(b'error-text">') is QueryStatus.WAF
+    assert scanner.final
+    assert scanner.feed(b'User Not Found') is QueryStatus.WAF
+
+
+def test_scanner_error_message_is_final_after_lookahead():
+    scanner = BodyMatcher(['User Not Found']).scanner('utf-8')
+    scanner.feed(b'<title>User Not Found</title>')
+    scanner.feed(b' ' * (WAF_LOOKAHEAD - 1))
+    assert not scanner.final
+    assert scanner.feed(b' ' * 16) is QueryStatus.AVAILABLE
+    assert scanner.final
+    # A WAF fingerprint further on is no longer looked for.
+    assert scanner.feed(b'<span id="challenge-error-text">') is QueryStatus.AVAILABLE
+
+
+def test_check_max_body_size():
+    info = {'url': 'https://example.com/{}', 'errorType': 'message', 'errorMsg': 'Nope'}
+    assert SiteCheck('Example', info).max_body_size == DEFAULT_MAX_BODY_SIZE
+    assert SiteCheck('Example', {**info, 'maxBodySize': 4096}).max_body_size == 4096
+    with pytest.raises(ValueError):
+        SiteCheck('Example', {**info, 'maxBodySize': 0})
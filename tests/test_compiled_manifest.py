@@ -0,0 +1,108 @@
+import json
+import os
+import pytest
+from sherlock_project import manifest as manifest_module
+from sherlock_project.manifest import HEADER, CompiledManifest, build_manifest
+from sherlock_project.sites import SitesInformation
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), '../sherlock_project/resources/data.json')
+
+
+@pytest.fixture()
+def compiled_path(tmp_path):
+    path = str(tmp_path / 'data.sherlock')
+    manifest_module.main([DATA_FILE, '-o', path])
+    return path
+
+
+def test_compiled_manifest_round_trip(compiled_path):
+    with open(DATA_FILE, encoding='utf-8') as file:
+        site_data = json.load(file)
+    site_data.pop('$schema')
+
+    sites = SitesInformation(compiled_path)
+    assert list(sites.sites) == list(site_data)
+    assert sites.sites['GitHub'].information == site_data['GitHub']
+    assert sites.sites['GitHub'].check.url == site_data['GitHub']['url']
+
+
+def test_sites_are_built_only_when_used(compiled_path):
+    sites = SitesInformation(compiled_path)
+    sites.remove_nsfw_sites(do_not_remove=['Pornhub'])
+    assert sites.sites.built == {}
+    assert 'Pornhub' in sites.sites
+
+    site = sites.sites['GitHub']
+    assert list(sites.sites.built) == ['GitHub']
+    assert site._username_unclaimed is None
+    assert site.username_unclaimed == site.username_unclaimed
+
+
+def test_compiled_manifest_rejects_other_versions(compiled_path):
+    with open(compiled_path, 'rb') as file:
+        data = bytearray(file.read())
+    HEADER.pack_into(data, 0, manifest_module.MAGIC, manifest_module.FORMAT_VERSION + 1, HEADER.unpack_from(data)[2])
+    with pytest.raises(ValueError, match='format version'):
+        CompiledManifest(bytes(data))
+
+
+def test_compiled_exclusions_can_be_overridden(tmp_path):
+    path = str(tmp_path / 'stub.sherlock')
+    site_data = {
+        name: {'url': 'https://example.com/{}', 'urlMain': 'https://example.com/',
+               'username_claimed': 'blue', 'errorType': 'status_code'}
+        for name in ('Kept', 'Excluded')
+    }
+    manifest_module.write_manifest(path, build_manifest(site_data, exclusions=['Excluded']))
+
+    assert list(SitesInformation(path).sites) == ['Kept']
+    assert list(SitesInformation(path, honor_exclusions=False).sites) == ['Kept', 'Excluded']
+    assert list(SitesInformation(path, do_not_exclude=['Excluded']).sites) == ['Kept', 'Excluded']
+
+
+def test_json_manifest_is_compiled_once(tmp_path, monkeypatch):
+    first = SitesInformation(DATA_FILE, honor_exclusions=False, cache_directory=str(tmp_path))
+    assert len(os.listdir(tmp_path / 'manifests')) == 1
+
+    def build_manifest(*args, **kwargs):
+        raise AssertionError('manifest compiled again')
+    monkeypatch.setattr(manifest_module, 'build_manifest', build_manifest)
+    second = SitesInformation(DATA_FILE, honor_exclusions=False, cache_directory=str(tmp_path))
+    assert list(second.sites) == list(first.sites)
+
+
+def test_manifest_in_use_is_not_pruned(tmp_path):
+    content = json.dumps({'Site': {'url': 'https://example.com/{}', 'urlMain': 'https://example.com/',
+                                   'errorType': 'status_code', 'username_claimed': 'blue'}}).encode()
+    manifest_module.load_manifest(content, [], 'test', str(tmp_path))
+    [used] = os.listdir(tmp_path)
+    manifest_module.load_manifest(content, ['Other'], 'test', str(tmp_path))
+    for name in os.listdir(tmp_path):
+        os.utime(tmp_path / name, (0, 0) if name == used else (1, 1))
+
+    # Using a compiled manifest again makes it the most recently used.
+    manifest_module.load_manifest(content, [], 'test', str(tmp_path))
+    manifest_module.prune_manifests(str(tmp_path), keep=1)
+    assert os.listdir(tmp_path) == [used]
+
+
+def test_manifest_removed_while_pruning_is_skipped(tmp_path, monkeypatch):
+    for age in range(4):
+        path = tmp_path / f'{age}.sherlock'
+        path.write_bytes(b'')
+        os.utime(path, (age, age))
+    getmtime = os.path.getmtime
+
+    def removed_by_another_process(path):
+        if path.endswith('3.sherlock'):
+            raise FileNotFoundError(path)
+        return getmtime(path)
+
+    monkeypatch.setattr(os.path, 'getmtime', removed_by_another_process)
+    manifest_module.prune_manifests(str(tmp_path), keep=1)
+    assert sorted(os.listdir(tmp_path)) == ['2.sherlock', '3.sherlock']
+
+
+def test_invalid_entries_are_reported():
+    with pytest.raises(ValueError, match="Missing attribute 'url'"):
+        build_manifest({'Broken': {'urlMain': 'https://example.com/', 'username_claimed': 'blue'}})
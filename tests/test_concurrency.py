@@ -0,0 +1,60 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sherlock_project.checks import compile_site_data
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import QueryStatus
+from sherlock_project.sherlock import sherlock
+
+SCANS = 24
+
+
+def snapshot(site_data: dict) -> str:
+    return json.dumps({site: dict(information) for site, information in site_data.items()}, sort_keys=True)
+
+
+class CollectingNotify(QueryNotify):
+    def __init__(self):
+        super().__init__()
+        self.usernames = set()
+
+    def update(self, result):
+        self.usernames.add(result.username)
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+@pytest.mark.parametrize('compiled', [True, False], ids=['compiled', 'raw'])
+def test_concurrent_scans_share_site_data(stub_server, engine, compiled):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    site_data = stub_server.manifest()
+    if compiled:
+        site_data = compile_site_data(site_data)
+    before = snapshot(site_data)
+
+    # Letters only, so that StubRegex allows the claimed usernames
+    usernames = [f"claimed{chr(ord('a') + n)}" if n % 2 else f'nobody-{n}' for n in range(SCANS)]
+
+    def scan(username):
+        notify = CollectingNotify()
+        return username, notify, sherlock(username, site_data, notify, engine=engine, max_in_flight=4)
+
+    with ThreadPoolExecutor(max_workers=SCANS) as executor:
+        scans = list(executor.map(scan, usernames))
+
+    for username, notify, results in scans:
+        assert notify.usernames == {username}
+        assert set(results) == set(site_data)
+        expected = QueryStatus.CLAIMED if username.startswith('claimed') else QueryStatus.AVAILABLE
+        for site, result in results.items():
+            assert result['status'].username == username
+            if site == 'StubWAF':
+                assert result['status'].status is QueryStatus.WAF
+            elif site == 'StubRegex' and expected is QueryStatus.AVAILABLE:
+                assert result['status'].status is QueryStatus.ILLEGAL
+            else:
+                assert result['status'].status is expected, site
+                assert username in result['url_user']
+
+    assert snapshot(site_data) == before
@@ -0,0 +1,157 @@
+import threading
+
+import pytest
+from sherlock_project.distributed import MAX_CACHED_JOBS, Worker, WorkQueueSQLite, collect, main, submit_job
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import QueryStatus
+from test_engines import EXPECTED_AVAILABLE, EXPECTED_CLAIMED, RecordingNotify, statuses
+
+
+CLOSED_SITE = {
+    'Closed': {
+        'url': 'http://127.0.0.1:9/{}',
+        'urlMain': 'http://127.0.0.1:9/',
+        'errorType': 'status_code',
+        'username_claimed': 'claimed',
+    }
+}
+
+
+@pytest.fixture()
+def queue(tmp_path):
+    queue = WorkQueueSQLite(str(tmp_path / 'work.db'))
+    yield queue
+    queue.close()
+
+
+def test_workers_complete_the_job(stub_server, queue):
+    site_data = stub_server.manifest()
+    job = submit_job(queue, ['claimed', 'nobody-1'], site_data)
+    assert Worker(queue, timeout=10, poll_interval=0.01).run(idle_timeout=0) == 2 * len(site_data)
+
+    notify = RecordingNotify()
+    reported = list(collect(queue, job, notify))
+    assert [username for username, _ in reported] == ['claimed', 'nobody-1']
+    assert statuses(reported[0][1]) == EXPECTED_CLAIMED
+    assert statuses(reported[1][1]) == EXPECTED_AVAILABLE
+    assert list(reported[0][1]) == list(site_data)
+    assert reported[0][1]['StubStatus']['url_user'] == f'{stub_server.base_url}/status/claimed'
+    assert notify.events == (
+        [('start', 'claimed')] + [('update', 'claimed')] * len(site_data)
+        + [('start', 'nobody-1')] + [('update', 'nobody-1')] * len(site_data)
+    )
+
+
+def test_workers_keep_only_recent_jobs(stub_server, queue):
+    site_data = {'StubStatus': stub_server.manifest()['StubStatus']}
+    jobs = [submit_job(queue, ['claimed'], site_data) for _ in range(MAX_CACHED_JOBS + 1)]
+    worker = Worker(queue, timeout=10)
+    sessions = [worker.job(job)[1] for job in jobs]
+    assert list(worker.jobs) == jobs[1:]
+    # The session of the least recently worked on job was closed.
+    assert sessions[0].session.executor._shutdown
+    assert not sessions[1].session.executor._shutdown
+
+    # Working on a job again makes it the most recently worked on.
+    assert worker.job(jobs[1])[1] is sessions[1]
+    assert list(worker.jobs) == jobs[2:] + jobs[1:2]
+    assert worker.run(idle_timeout=0) == len(jobs)
+    assert worker.jobs == {}
+
+
+def test_resubmitting_adds_no_duplicates(stub_server, queue):
+    site_data = stub_server.manifest()
+    job = submit_job(queue, ['claimed'], site_data)
+    assert submit_job(queue, ['claimed', 'nobody-1'], site_data, job=job) == job
+    assert [(username, units) for username, units, _ in queue.progress(job)] == [
+        ('claimed', len(site_data)), ('nobody-1', len(site_data)),
+    ]
+
+
+def test_first_reported_result_is_kept(stub_server, queue):
+    job = submit_job(queue, ['claimed'], stub_server.manifest())
+    unit = queue.lease('first', count=1)[0]
+    record = {'url_user': None, 'result': {
+        'username': 'claimed', 'site': unit.site, 'url': None, 'status': 'Claimed',
+    }}
+    queue.complete('first', [(job, 'claimed', unit.site, record, False)])
+    queue.complete('second', [(job, 'claimed', unit.site, dict(record, url_user='late'), False)])
+    assert queue.results(job, 'claimed')[unit.site]['url_user'] is None
+
+
+def test_units_of_dead_workers_are_taken_over(stub_server, queue):
+    site_data = stub_server.manifest()
+    job = submit_job(queue, ['claimed'], site_data)
+    # A worker leases everything, then dies without reporting.
+    assert len(queue.lease('dead', lease_seconds=-1)) == len(site_data)
+
+    assert Worker(queue, timeout=10).run(idle_timeout=0) == len(site_data)
+    (_, results), = collect(queue, job, QueryNotify())
+    assert statuses(results) == EXPECTED_CLAIMED
+
+
+def test_units_are_given_up_on_after_too_many_attempts(stub_server, tmp_path):
+    queue = WorkQueueSQLite(str(tmp_path / 'work.db'), max_attempts=2)
+    job = submit_job(queue, ['claimed'], {'StubStatus': stub_server.manifest()['StubStatus']})
+    for _ in range(2):
+        assert len(queue.lease('dead', lease_seconds=-1)) == 1
+    assert queue.lease('alive') == []
+
+    (_, results), = collect(queue, job, QueryNotify())
+    assert results['StubStatus']['status'].status is QueryStatus.UNKNOWN
+    queue.close()
+
+
+def test_failed_probes_are_retried(tmp_path):
+    queue = WorkQueueSQLite(str(tmp_path / 'work.db'), max_attempts=3)
+    job = submit_job(queue, ['claimed'], CLOSED_SITE)
+    attempts = []
+
+    class CountingWorker(Worker):
+        def work(self, units):
+            attempts.extend(unit.attempts for unit in units)
+            super().work(units)
+
+    CountingWorker(queue, timeout=5).run(idle_timeout=0)
+    assert attempts == [1, 2, 3]
+    (_, results), = collect(queue, job, QueryNotify())
+    assert results['Closed']['status'].context == 'Error Connecting'
+    queue.close()
+
+
+def test_concurrent_workers_probe_each_unit_once(stub_server, tmp_path):
+    site_data = stub_server.slow_manifest(40)
+    path = str(tmp_path / 'work.db')
+    coordinator = WorkQueueSQLite(path)
+    usernames = [f'user{index}' for index in range(3)]
+    job = submit_job(coordinator, usernames, site_data)
+
+    worked = []
+
+    def work():
+        queue = WorkQueueSQLite(path)
+        worked.append(Worker(queue, lease_size=7, timeout=10).run(idle_timeout=0))
+        queue.close()
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+
+    assert sum(worked) == len(usernames) * len(site_data)
+    assert len(stub_server.requests) == len(usernames) * len(site_data)
+    assert [username for username, _ in collect(coordinator, job, QueryNotify())] == usernames
+    coordinator.close()
+
+
+def test_queue_can_be_shared_over_network_file_systems(queue):
+    # The write-ahead log needs memory shared between the processes.
+    assert queue.connection.execute('PRAGMA journal_mode').fetchone() == ('delete',)
+
+
+@pytest.mark.parametrize('option', ['--lease-size', '--max-in-flight', '--max-per-host'])
+def test_worker_counts_must_be_positive(tmp_path, option, capsys):
+    with pytest.raises(SystemExit):
+        main(['--queue', str(tmp_path / 'work.db'), 'work', option, '0'])
+    assert 'Must be a positive integer' in capsys.readouterr().err
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import QueryStatus
+from sherlock_project.sherlock import sherlock_batch
+from sherlock_project.sites import SitesInformation
+from sherlock_site_emulator import SiteEmulator
+
+
+@pytest.fixture(scope='module')
+def site_data():
+    sites = SitesInformation(
+        os.path.join(os.path.dirname(__file__), '..', 'sherlock_project', 'resources', 'data.json'),
+        honor_exclusions=False,
+    )
+    return {site.name: dict(site.information) for site in sites}
+
+
+def test_outcomes_repeat_with_the_seed(site_data):
+    first = SiteEmulator(site_data, latency=0.1, jitter=0.05, claimed_rate=0.5, error_rate=0.1, seed=7)
+    again = SiteEmulator(site_data, latency=0.1, jitter=0.05, claimed_rate=0.5, error_rate=0.1, seed=7)
+    other = SiteEmulator(site_data, latency=0.1, jitter=0.05, claimed_rate=0.5, error_rate=0.1, seed=8)
+    outcomes = [first.outcome(site_name, 'benchuser1') for site_name in site_data]
+    assert outcomes == [again.outcome(site_name, 'benchuser1') for site_name in site_data]
+    assert outcomes != [other.outcome(site_name, 'benchuser1') for site_name in site_data]
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_whole_manifest_is_detected(site_data, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    emulator = SiteEmulator(site_data, claimed_rate=0.5, error_rate=0.05, waf_rate=0.05, seed=1).start()
+    try:
+        statuses = set()
+        for username, results in sherlock_batch(
+            ['benchuser1', 'benchuser2'], emulator.manifest(), QueryNotify(), timeout=10, engine=engine
+        ):
+            for site_name, results_site in results.items():
+                status = results_site['status'].status
+                assert status is emulator.expected(site_name, username), site_name
+                statuses.add(status)
+    finally:
+        emulator.stop()
+    assert statuses == set(QueryStatus)
@@ -0,0 +1,229 @@
+import gc
+import logging
+import socket
+import warnings
+
+import pytest
+from sherlock_project.checks import WAF_LOOKAHEAD
+from sherlock_project.sherlock import BODY_CHUNK_SIZE, sherlock, sherlock_batch, sherlock_stream
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import BodyRetention, QueryStatus
+
+
+EXPECTED_CLAIMED: dict[str, QueryStatus] = {
+    'StubStatus': QueryStatus.CLAIMED,
+    'StubMessage': QueryStatus.CLAIMED,
+    'StubMessageList': QueryStatus.CLAIMED,
+    'StubRedirect': QueryStatus.CLAIMED,
+    'StubProbe': QueryStatus.CLAIMED,
+    'StubPost': QueryStatus.CLAIMED,
+    'StubWAF': QueryStatus.WAF,
+    'StubRegex': QueryStatus.CLAIMED,
+}
+
+EXPECTED_AVAILABLE: dict[str, QueryStatus] = {
+    'StubStatus': QueryStatus.AVAILABLE,
+    'StubMessage': QueryStatus.AVAILABLE,
+    'StubMessageList': QueryStatus.AVAILABLE,
+    'StubRedirect': QueryStatus.AVAILABLE,
+    'StubProbe': QueryStatus.AVAILABLE,
+    'StubPost': QueryStatus.AVAILABLE,
+    'StubWAF': QueryStatus.WAF,
+    'StubRegex': QueryStatus.ILLEGAL,
+}
+
+
+def statuses(results: dict) -> dict[str, QueryStatus]:
+    return {site: result['status'].status for site, result in results.items()}
+
+
+class RecordingNotify(QueryNotify):
+    """Records the usernames which are started and the results which are updated"""
+
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def start(self, message=None):
+        self.events.append(('start', message))
+
+    def update(self, result):
+        self.events.append(('update', result.username))
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+@pytest.mark.parametrize('username,expected', [
+    ('claimed', EXPECTED_CLAIMED),
+    ('nobody-1', EXPECTED_AVAILABLE),
+])
+def test_engine_outcomes(stub_server, engine, username, expected):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    results = sherlock(username, stub_server.manifest(), QueryNotify(), engine=engine)
+    assert statuses(results) == expected
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_engine_stops_reading_heavy_pages(stub_server, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    site_data = stub_server.heavy_manifest()
+
+    results = sherlock('nobody', site_data, QueryNotify(), engine=engine, keep_bodies=True)
+    assert statuses(results) == {'StubHeavy': QueryStatus.AVAILABLE, 'StubHeavyCapped': QueryStatus.AVAILABLE}
+    # The error message is in the head, so only the padding which may still
+    # hold a WAF fingerprint is read
+    assert all(len(result['response_text']) <= WAF_LOOKAHEAD + 2 * BODY_CHUNK_SIZE
+               for result in results.values())
+
+    results = sherlock('claimed', site_data, QueryNotify(), engine=engine, keep_bodies=True)
+    assert statuses(results) == {'StubHeavy': QueryStatus.CLAIMED, 'StubHeavyCapped': QueryStatus.CLAIMED}
+    # Without an error message, reading stops at the size limit of the site
+    assert len(results['StubHeavy']['response_text']) == 2 * 1024 * 1024
+    assert len(results['StubHeavyCapped']['response_text']) == 65536
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_engine_finds_waf_after_error_message(stub_server, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    site_data = {
+        'StubLateWAF': {
+            'url': f'{stub_server.base_url}/late-waf/{{}}',
+            'urlMain': stub_server.base_url,
+            'errorType': 'message',
+            'errorMsg': 'User Not Found',
+        }
+    }
+    results = sherlock('nobody', site_data, QueryNotify(), engine=engine)
+    assert statuses(results) == {'StubLateWAF': QueryStatus.WAF}
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_engine_keeps_bodies_only_on_request(stub_server, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    site_data = stub_server.manifest()
+
+    results = sherlock('nobody-1', site_data, QueryNotify(), engine=engine)
+    assert all(not result['response_text'] for result in results.values())
+
+    retention = BodyRetention(max_bytes=60)
+    results = sherlock('nobody-1', site_data, QueryNotify(), engine=engine, keep_bodies=retention)
+    assert results['StubWAF']['status'].status is QueryStatus.WAF
+    bodies = [result['response_text'] for site, result in results.items() if site != 'StubRegex']
+    kept = [body for body in bodies if body is not None]
+    # Bodies are kept as the bytes received, until the limit is reached
+    assert all(isinstance(body, bytes) for body in kept)
+    assert retention.kept == len(kept) and retention.dropped == len(bodies) - len(kept)
+    assert retention.kept_bytes == sum(map(len, kept)) <= 60
+    assert retention.dropped > 0 and 'dropped' in str(retention)
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_engine_connection_error(engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    site_data = {
+        'Closed': {
+            'url': 'http://127.0.0.1:9/{}',
+            'urlMain': 'http://127.0.0.1:9/',
+            'errorType': 'status_code',
+            'username_claimed': 'claimed',
+        }
+    }
+    result = sherlock('claimed', site_data, QueryNotify(), engine=engine)['Closed']
+    assert result['status'].status is QueryStatus.UNKNOWN
+    assert result['status'].context == 'Error Connecting'
+    assert result['http_status'] == '?'
+
+
+def test_async_engine_closes_its_session(stub_server, caplog):
+    pytest.importorskip('aiohttp')
+    # A server which accepts connections, but never answers.
+    with socket.socket() as hung:
+        hung.bind(('127.0.0.1', 0))
+        hung.listen()
+        port = hung.getsockname()[1]
+        site_data = dict(stub_server.manifest(), Hung={
+            'url': f'http://127.0.0.1:{port}/{{}}',
+            'urlMain': f'http://127.0.0.1:{port}/',
+            'errorType': 'status_code',
+        })
+
+        with warnings.catch_warnings(record=True) as caught, caplog.at_level(logging.ERROR, logger='asyncio'):
+            warnings.simplefilter('always', ResourceWarning)
+            results = sherlock('claimed', site_data, QueryNotify(), engine='asyncio', deadline=0.5)
+            next(sherlock_stream('claimed', site_data, engine='asyncio'))
+            gc.collect()
+
+    assert results['Hung']['status'].context == 'Deadline Exceeded'
+    assert [str(warning.message) for warning in caught if warning.category is ResourceWarning] == []
+    assert caplog.records == []
+
+
+def test_unknown_engine_rejected(stub_server):
+    with pytest.raises(ValueError, match='Unknown engine'):
+        sherlock('claimed', stub_server.manifest(), QueryNotify(), engine='carrier-pigeon')
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_batch_reports_each_username(stub_server, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    usernames = ['claimed', 'nobody-1', 'claimedtoo', 'nobody-2']
+    reported = [
+        (username, statuses(results))
+        for username, results in sherlock_batch(usernames, stub_server.manifest(), QueryNotify(), engine=engine)
+    ]
+    assert [username for username, _ in reported] == usernames
+    assert reported[0][1] == EXPECTED_CLAIMED
+    assert reported[1][1] == EXPECTED_AVAILABLE
+    assert reported[2][1] == EXPECTED_CLAIMED
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_batch_reuses_connections(stub_server, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    usernames = [f'claimed{suffix}' for suffix in 'abcdefghij']
+    for _ in sherlock_batch(usernames, stub_server.manifest(), QueryNotify(), engine=engine):
+        pass
+    # Every probe of every username goes through the same small pool
+    assert len(stub_server.requests) == 10 * 8
+    assert stub_server.connections <= 20
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_stream_yields_in_completion_order(slow_stub_server, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    site_data = slow_stub_server.slow_manifest(1)
+    site_data.update(slow_stub_server.manifest())
+    order = [result.site_name for result in sherlock_stream('nobody-1', site_data, engine=engine)]
+    # The username is not allowed on StubRegex, so it needs no request at all
+    assert order[0] == 'StubRegex'
+    assert order[-1] == 'StubSlow0'
+    assert sorted(order) == sorted(site_data)
+
+
+def test_notify_follows_stream(slow_stub_server):
+    class Recorder(QueryNotify):
+        def __init__(self):
+            super().__init__()
+            self.events = []
+
+        def start(self, message=None):
+            self.events.append(('start', message))
+
+        def update(self, result):
+            self.events.append(('update', result.site_name))
+
+    site_data = slow_stub_server.slow_manifest(1)
+    site_data.update(slow_stub_server.manifest())
+    recorder = Recorder()
+    results = sherlock('claimed', site_data, recorder)
+    assert recorder.events[0] == ('start', 'claimed')
+    assert recorder.events[-1] == ('update', 'StubSlow0')
+    # The returned dictionary keeps the order of the site data
+    assert list(results) == list(site_data)
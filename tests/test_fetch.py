@@ -0,0 +1,61 @@
+import json
+import pytest
+import requests
+from sherlock_project import sites as sites_module
+from sherlock_project.fetch import fetch_cached
+from sherlock_project.sites import SitesInformation
+
+
+def test_fetch_uses_and_revalidates_cached_copy(stub_server, tmp_path):
+    url = stub_server.serve_file('manifest.json', '{"a": 1}', '"v1"')
+    cache_directory = str(tmp_path)
+
+    first = fetch_cached(url, 5, cache_directory=cache_directory)
+    assert first.source == 'network' and first.json() == {'a': 1}
+
+    # Young enough to use without asking the server
+    probes = len(stub_server.requests)
+    assert fetch_cached(url, 5, cache_directory=cache_directory).source == 'cache'
+    assert len(stub_server.requests) == probes
+
+    # Too old, but the server says it has not changed
+    revalidated = fetch_cached(url, 5, max_age=0, cache_directory=cache_directory)
+    assert revalidated.source == 'revalidated' and revalidated.json() == {'a': 1}
+    assert len(stub_server.requests) == probes + 1
+
+    stub_server.serve_file('manifest.json', '{"a": 2}', '"v2"')
+    changed = fetch_cached(url, 5, max_age=0, cache_directory=cache_directory)
+    assert changed.source == 'network' and changed.json() == {'a': 2}
+
+
+def test_fetch_falls_back_to_cached_copy_when_offline(stub_server, tmp_path):
+    url = stub_server.serve_file('exclusions.txt', 'Example\n', '"v1"')
+    cache_directory = str(tmp_path)
+    fetch_cached(url, 5, cache_directory=cache_directory)
+
+    # The server fails, then goes away altogether
+    del stub_server.httpd.files['exclusions.txt']
+    stale = fetch_cached(url, 5, max_age=0, cache_directory=cache_directory)
+    assert stale.source == 'stale' and stale.text == 'Example\n'
+    stub_server.stop()
+    stale = fetch_cached(url, 5, max_age=0, cache_directory=cache_directory)
+    assert stale.source == 'stale' and stale.error
+
+    with pytest.raises(requests.RequestException):
+        fetch_cached(url + '-other', 5, max_age=0, cache_directory=cache_directory)
+
+
+def test_sites_information_works_offline_from_cache(stub_server, tmp_path, monkeypatch, capsys):
+    manifest = stub_server.manifest()
+    url = stub_server.serve_file('data.json', json.dumps(manifest), '"v1"')
+    exclusions = stub_server.serve_file('exclusions.txt', 'StubWAF\nStubPost\n', '"v1"')
+    monkeypatch.setattr(sites_module, 'EXCLUSIONS_URL', exclusions)
+    expected = sorted(set(manifest) - {'StubWAF'})
+
+    online = SitesInformation(url, do_not_exclude=['StubPost'], cache_directory=str(tmp_path))
+    assert sorted(online.sites) == expected
+
+    stub_server.stop()
+    offline = SitesInformation(url, do_not_exclude=['StubPost'], max_age=0, cache_directory=str(tmp_path))
+    assert sorted(offline.sites) == expected
+    assert 'using the copy cached at' in capsys.readouterr().err
@@ -0,0 +1,100 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from sherlock_project.journal import QueryNotifyJournal, ScanJournal, resume_batch
+from sherlock_project.result import QueryResult, QueryStatus
+from sherlock_project.sherlock import sherlock_batch
+from test_engines import EXPECTED_AVAILABLE, EXPECTED_CLAIMED, RecordingNotify, statuses
+
+
+def result(username, site, status=QueryStatus.CLAIMED):
+    return QueryResult(username, site, f'https://{site.lower()}.example/{username}', status, http_status=200)
+
+
+def test_journal_survives_reopening(tmp_path):
+    path = str(tmp_path / 'scan.journal')
+    journal = ScanJournal(path)
+    journal.write(result('blue', 'Alpha'))
+    journal.write(result('blue', 'Alpha'))
+    journal.write(result('blue', 'Beta', QueryStatus.UNKNOWN))
+    journal.close()
+    # A crash in the middle of a line.
+    with open(path, 'a') as file:
+        file.write('{"username": "blue", "si')
+
+    journal = ScanJournal(path)
+    assert journal.skipped == 1
+    assert journal.done('blue', 'Alpha')
+    # Errors are probed again.
+    assert not journal.done('blue', 'Beta')
+    journal.write(result('blue', 'Beta'))
+    journal.close()
+
+    with open(path) as file:
+        lines = file.read().splitlines()
+    assert [json.loads(line)['site'] for line in lines if line.endswith('}')] == ['Alpha', 'Beta', 'Beta']
+    assert ScanJournal(path).results['blue']['Beta'].status is QueryStatus.CLAIMED
+
+
+def test_resume_skips_journaled_results(stub_server, tmp_path):
+    site_data = stub_server.manifest()
+    usernames = ['claimed', 'nobody-1', 'claimed']
+    journal = ScanJournal(str(tmp_path / 'scan.journal'))
+    # The scan is interrupted once the first username is done.
+    for username, _ in sherlock_batch(usernames, site_data, QueryNotifyJournal(journal)):
+        break
+    probed = len(stub_server.requests)
+    assert probed >= len(site_data)
+
+    notify = RecordingNotify()
+    reported = list(resume_batch(usernames, site_data, notify, journal, sherlock_batch))
+    journal.close()
+
+    assert [username for username, _ in reported] == usernames
+    assert [statuses(results) for _, results in reported] == [
+        EXPECTED_CLAIMED, EXPECTED_AVAILABLE, EXPECTED_CLAIMED,
+    ]
+    assert [list(results) for _, results in reported] == [list(site_data)] * 3
+    # The first username was not probed again.
+    assert all(not path.startswith('/status/claimed') for _, path in stub_server.requests[probed:])
+    assert [event[0] for event in notify.events].count('start') == 3
+    assert len(notify.events) == 3 + 3 * len(site_data)
+
+
+def test_interrupted_cli_scan_resumes(slow_stub_server, tmp_path):
+    data_file = tmp_path / 'data.json'
+    data_file.write_text(json.dumps(slow_stub_server.slow_manifest(4)))
+    journal = tmp_path / 'scan.journal'
+    command = [
+        sys.executable, '-m', 'sherlock_project', '--json', str(data_file), '--no-update-check',
+        '--folderoutput', str(tmp_path), '--txt', '--print-all', '--journal', str(journal), '--max-in-flight', '1',
+        'first', 'second',
+    ]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=tmp_path)
+    while not journal.exists() or journal.read_text().count('\n') < 2:
+        assert process.poll() is None
+        time.sleep(0.05)
+    process.send_signal(signal.SIGINT)
+    output = process.communicate(timeout=30)[0].decode()
+    assert '--resume' in output
+    journaled = journal.read_text().count('\n')
+    assert 2 <= journaled < 8
+    # The report of the username in progress was closed with what arrived.
+    assert (tmp_path / 'first.txt').read_text().endswith('Total Websites Username Detected On : 0\n')
+
+    subprocess.run(command + ['--resume'], check=True, capture_output=True, cwd=tmp_path, timeout=60)
+    records = [json.loads(line) for line in journal.read_text().splitlines()]
+    assert len(records) == 8
+    assert len({(record['username'], record['site']) for record in records}) == 8
+    assert os.path.exists(tmp_path / 'second.txt')
+
+    # Without --resume, the journal is left alone.
+    rerun = subprocess.run(command, capture_output=True, cwd=tmp_path, timeout=60)
+    assert rerun.returncode != 0
+    assert b'already exists' in rerun.stderr
+    assert journal.read_text().count('\n') == 8
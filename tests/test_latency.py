@@ -0,0 +1,118 @@
+import time
+
+import pytest
+from sherlock_project import latency as latency_module
+from sherlock_project.latency import LatencyStats, percentile
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import QueryStatus
+from sherlock_project.sherlock import sherlock
+
+
+def test_percentile_uses_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 99) == 99
+    assert percentile(samples, 50) == 50
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_timeouts_derived_within_floor_and_ceiling(tmp_path):
+    stats = LatencyStats(str(tmp_path / 'latency.sqlite3'), multiplier=3, floor=1)
+    for _ in range(latency_module.MIN_SAMPLES - 1):
+        stats.record('Fast', 0.1)
+        stats.record('Slow', 8.0)
+    # Too few response times to go by.
+    assert stats.timeout('Fast', 60) == 60
+
+    stats.record('Fast', 0.2)
+    stats.record('Slow', 9.0)
+    assert stats.timeout('Fast', 60) == 1
+    assert stats.timeout('Slow', 60) == 27
+    assert stats.timeout('Slow', 10) == 10
+    stats.close()
+
+    # Response times are kept across runs.
+    stats = LatencyStats(str(tmp_path / 'latency.sqlite3'), multiplier=3, floor=1, ceiling=20)
+    assert stats.timeout('Slow', 60) == 20
+    assert stats.timeout('Unknown', 60) == 60
+    stats.close()
+
+
+def test_only_recent_response_times_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(latency_module, 'MAX_SAMPLES', latency_module.MIN_SAMPLES)
+    path = str(tmp_path / 'latency.sqlite3')
+    stats = LatencyStats(path, multiplier=1, floor=0)
+    for seconds in [5.0] * latency_module.MIN_SAMPLES + [0.5] * latency_module.MIN_SAMPLES:
+        stats.record('Site', seconds)
+    assert stats.timeout('Site', 60) == 0.5
+    stats.close()
+
+    stats = LatencyStats(path, multiplier=1, floor=0)
+    assert list(stats.samples['Site']) == [0.5] * latency_module.MIN_SAMPLES
+    stats.close()
+
+
+def test_scans_record_response_times(stub_server, engine):
+    stats = LatencyStats(':memory:')
+    sherlock('claimed', stub_server.manifest(), QueryNotify(), engine=engine, latency=stats)
+    assert set(stats.samples) == set(stub_server.manifest())
+    assert all(0 <= seconds < 10 for samples in stats.samples.values() for seconds in samples)
+    stats.close()
+
+
+def test_slow_sites_are_given_up_on_sooner(slow_stub_server, engine):
+    stats = LatencyStats(':memory:', multiplier=1, floor=0.05)
+    for _ in range(latency_module.MIN_SAMPLES):
+        stats.record('StubSlow0', 0.01)
+    results = sherlock('claimed', slow_stub_server.slow_manifest(2), QueryNotify(), engine=engine,
+                       latency=stats, timeout=10)
+    assert results['StubSlow0']['status'].status is QueryStatus.UNKNOWN
+    assert results['StubSlow1']['status'].status is QueryStatus.CLAIMED
+    stats.close()
+
+
+def test_timeouts_grow_back_after_a_slowdown(slow_stub_server, engine):
+    stats = LatencyStats(':memory:', multiplier=3, floor=0.05)
+    for _ in range(latency_module.MIN_SAMPLES):
+        stats.record('StubSlow0', 0.01)
+    site_data = slow_stub_server.slow_manifest(1)
+
+    # The site now takes 0.2s.  Each timeout is recorded, and triples the
+    # next timeout:  0.05s, 0.15s, and then 0.45s, which is long enough.
+    statuses = [
+        sherlock('claimed', site_data, QueryNotify(), engine=engine, latency=stats, timeout=10)
+        ['StubSlow0']['status'] for _ in range(3)
+    ]
+    assert [result.context for result in statuses[:2]] == ['Timeout Error'] * 2
+    assert statuses[2].status is QueryStatus.CLAIMED
+    assert list(stats.samples['StubSlow0'])[-3:-1] == pytest.approx([0.05, 0.15])
+    stats.close()
+
+
+def test_deadline_gives_up_on_unfinished_probes(slow_stub_server, engine):
+    started = time.monotonic()
+    results = sherlock('claimed', slow_stub_server.slow_manifest(3), QueryNotify(), engine=engine,
+                       deadline=0.05)
+    assert time.monotonic() - started < 2
+    assert {result['status'].context for result in results.values()} == {'Deadline Exceeded'}
+    assert {result['http_status'] for result in results.values()} == {'?'}
+
+
+def test_no_probes_once_past_the_deadline(stub_server, engine):
+    results = sherlock('claimed', stub_server.manifest(), QueryNotify(), engine=engine, deadline=0)
+    assert stub_server.requests == []
+    assert {
+        result['status'].context for site, result in results.items() if site != 'StubRegex'
+    } == {'Deadline Exceeded'}
+
+
+def test_sharded_scans_share_the_latency_database(stub_server, tmp_path):
+    from sherlock_project.sharding import sherlock_sharded
+
+    path = str(tmp_path / 'latency.sqlite3')
+    stats = LatencyStats(path)
+    list(sherlock_sharded(['claimed'], stub_server.manifest(), QueryNotify(), processes=2,
+                          shard_by='username', latency=stats))
+    stats.close()
+    stats = LatencyStats(path)
+    assert set(stats.samples) == set(stub_server.manifest())
+    stats.close()
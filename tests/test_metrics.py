@@ -0,0 +1,97 @@
+import threading
+import time
+
+from sherlock_project.metrics import ScanMetrics, TextfileWriter
+from sherlock_project.notify import QueryNotify, QueryNotifyMetrics
+from sherlock_project.result import QueryResult, QueryStatus
+from sherlock_project.sherlock import sherlock
+
+
+def samples(metrics: ScanMetrics) -> dict:
+    return {
+        (name, labels): value
+        for _, _, _, family in metrics.samples()
+        for name, labels, value in family
+    }
+
+
+def test_scans_are_counted(stub_server, engine):
+    metrics = ScanMetrics()
+    results = sherlock('claimed', stub_server.manifest(), QueryNotify(), engine=engine, metrics=metrics)
+    values = samples(metrics)
+
+    counted = {labels: value for (name, labels), value in values.items() if name == 'sherlock_probes_total'}
+    assert sum(counted.values()) == len(results)
+    assert counted[(('site', 'StubWAF'), ('status', 'WAF'))] == 1
+    assert values[('sherlock_response_body_bytes_total', (('site', 'StubMessage'),))] > 0
+    timed = sum(1 for results_site in results.values() if results_site['status'].query_time is not None)
+    assert values[('sherlock_probe_duration_seconds_count', ())] == timed
+    assert values[('sherlock_probe_phase_seconds_count', (('phase', 'first_byte'),))] == timed
+    assert values[('sherlock_probes_in_flight', ())] == 0
+    assert values[('sherlock_probes_waiting', ())] == 0
+    assert values[('sherlock_pool_size', ())] > 0
+
+
+def test_probes_in_flight_and_waiting(slow_stub_server, engine):
+    metrics = ScanMetrics()
+    scan = threading.Thread(target=sherlock, args=('claimed', slow_stub_server.slow_manifest(3), QueryNotify()),
+                            kwargs={'engine': engine, 'metrics': metrics, 'max_in_flight': 1})
+    scan.start()
+    try:
+        # One probe is sent at a time, while the others wait for it.
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            values = samples(metrics)
+            if values[('sherlock_probes_waiting', ())] == 2:
+                break
+            time.sleep(0.01)
+        assert values[('sherlock_probes_in_flight', ())] == 1
+        assert values[('sherlock_probes_waiting', ())] == 2
+        assert values[('sherlock_pool_saturation', ())] == 1.0
+    finally:
+        scan.join()
+    assert samples(metrics)[('sherlock_probes_in_flight', ())] == 0
+
+
+def test_errors_and_cached_results_are_counted_apart():
+    metrics = ScanMetrics()
+    notify = QueryNotifyMetrics(metrics)
+    notify.update(QueryResult('user', 'Site', '', QueryStatus.UNKNOWN, context='Timeout Error', query_time=5.0))
+    notify.update(QueryResult('user', 'Site', '', QueryStatus.CLAIMED, query_time=0.1, cached=True))
+    values = samples(metrics)
+    assert values[('sherlock_probes_total', (('site', 'Site'), ('status', 'Unknown')))] == 1
+    assert values[('sherlock_probe_errors_total', (('site', 'Site'), ('error', 'Timeout Error')))] == 1
+    assert values[('sherlock_cached_results_total', (('site', 'Site'),))] == 1
+    assert values[('sherlock_probe_duration_seconds_count', ())] == 1
+    assert values[('sherlock_probe_duration_seconds_bucket', (('le', '5.0'),))] == 1
+    assert values[('sherlock_probe_duration_seconds_bucket', (('le', '2.5'),))] == 0
+
+
+def test_text_formats():
+    metrics = ScanMetrics()
+    metrics.observe(QueryResult('user', 'Say "hi"\\', '', QueryStatus.CLAIMED, query_time=0.2))
+
+    openmetrics = metrics.render()
+    assert openmetrics.endswith('# EOF\n')
+    assert '# TYPE sherlock_probes counter\n' in openmetrics
+    assert 'sherlock_probes_total{site="Say \\"hi\\"\\\\",status="Claimed"} 1\n' in openmetrics
+    assert 'sherlock_probe_duration_seconds_bucket{le="+Inf"} 1\n' in openmetrics
+
+    prometheus = metrics.render(openmetrics=False)
+    assert '# TYPE sherlock_probes_total counter\n' in prometheus
+    assert '# EOF' not in prometheus
+
+
+def test_textfile_written_until_stopped(tmp_path):
+    metrics = ScanMetrics()
+    path = tmp_path / 'sherlock.prom'
+    writer = TextfileWriter(metrics, str(path), interval=0.01).start()
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 'sherlock_probes_total{' not in path.read_text()
+
+    metrics.observe(QueryResult('user', 'Site', '', QueryStatus.AVAILABLE))
+    writer.stop()
+    assert 'sherlock_probes_total{site="Site",status="Available"} 1' in path.read_text()
+    assert [file.name for file in tmp_path.iterdir()] == ['sherlock.prom']
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+from sherlock_project.notify import (QueryNotifyCSV, QueryNotifyMultiple, QueryNotifyNDJSON, QueryNotifyTXT,
+                                     QueryNotifyXLSX)
+from sherlock_project.result import QueryResult, QueryStatus
+
+
+SITE_DATA: dict[str, dict[str, str]] = {
+    'Alpha': {'urlMain': 'https://alpha.example/'},
+    'Beta': {'urlMain': 'https://beta.example/'},
+}
+
+
+def claimed(username: str, site: str) -> QueryResult:
+    return QueryResult(username, site, f'https://{site.lower()}.example/{username}', QueryStatus.CLAIMED,
+                       query_time=0.25, http_status=200)
+
+
+def available(username: str, site: str) -> QueryResult:
+    return QueryResult(username, site, f'https://{site.lower()}.example/{username}', QueryStatus.AVAILABLE,
+                       query_time=0.5, http_status=404)
+
+
+def test_reports_written_as_results_arrive(tmp_path):
+    txt = QueryNotifyTXT(folderoutput=str(tmp_path))
+    notify = QueryNotifyMultiple([
+        txt,
+        QueryNotifyCSV(SITE_DATA, folderoutput=str(tmp_path), print_all=True),
+    ])
+
+    notify.start('first')
+    notify.update(claimed('first', 'Beta'))
+    # Rows are flushed straight away, before the username is done
+    assert (tmp_path / 'first.txt').read_text() == 'https://beta.example/first\n'
+    notify.update(available('first', 'Alpha'))
+    notify.start('second')
+    notify.update(available('second', 'Alpha'))
+    notify.finish()
+
+    assert (tmp_path / 'first.txt').read_text() == (
+        'https://beta.example/first\nTotal Websites Username Detected On : 1\n'
+    )
+    assert (tmp_path / 'second.txt').read_text() == 'Total Websites Username Detected On : 0\n'
+    with open(tmp_path / 'first.csv', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows == [
+        ['username', 'name', 'url_main', 'url_user', 'exists', 'http_status', 'response_time_s'],
+        ['first', 'Beta', 'https://beta.example/', 'https://beta.example/first', 'Claimed', '200', '0.25'],
+        ['first', 'Alpha', 'https://alpha.example/', 'https://alpha.example/first', 'Available', '404', '0.5'],
+    ]
+
+
+def test_csv_found_only(tmp_path):
+    notify = QueryNotifyCSV(SITE_DATA, folderoutput=str(tmp_path))
+    notify.start('user')
+    notify.update(available('user', 'Alpha'))
+    notify.update(claimed('user', 'Beta'))
+    notify.finish()
+    with open(tmp_path / 'user.csv', newline='') as f:
+        rows = list(csv.reader(f))
+    assert [row[1] for row in rows[1:]] == ['Beta']
+
+
+def test_ndjson_records_written_as_results_arrive(tmp_path):
+    path = tmp_path / 'results.ndjson'
+    notify = QueryNotifyNDJSON(output=str(path))
+    notify.start('first')
+    notify.update(claimed('first', 'Beta'))
+    assert json.loads(path.read_text()) == {
+        'username': 'first', 'site': 'Beta', 'url': 'https://beta.example/first', 'status': 'Claimed',
+        'http_status': 200, 'query_time': 0.25, 'context': None, 'cached': False, 'timings': None,
+    }
+    notify.start('second')
+    notify.update(available('second', 'Alpha'))
+    notify.finish()
+    assert [json.loads(line)['username'] for line in path.read_text().splitlines()] == ['first', 'second']
+
+
+def test_ndjson_to_stream(capsys):
+    stream = io.StringIO()
+    notify = QueryNotifyNDJSON(output=stream)
+    notify.update(available('user', 'Alpha'))
+    notify.finish()
+    assert json.loads(stream.getvalue())['status'] == 'Available'
+    assert not stream.closed
+
+    QueryNotifyNDJSON().update(claimed('user', 'Beta'))
+    assert json.loads(capsys.readouterr().out)['site'] == 'Beta'
+
+
+def test_xlsx(tmp_path, monkeypatch):
+    openpyxl = pytest.importorskip('openpyxl')
+    monkeypatch.chdir(tmp_path)
+    notify = QueryNotifyXLSX(SITE_DATA, print_all=True)
+    notify.start('user')
+    notify.update(claimed('user', 'Beta'))
+    notify.update(available('user', 'Alpha'))
+    notify.finish()
+
+    rows = list(openpyxl.load_workbook(tmp_path / 'user.xlsx')['sheet1'].values)
+    assert rows[0] == ('username', 'name', 'url_main', 'url_user', 'exists', 'http_status', 'response_time_s')
+    assert rows[1] == ('user', 'Beta', '=HYPERLINK("https://beta.example/")',
+                       '=HYPERLINK("https://beta.example/user")', 'Claimed', 200, 0.25)
+    assert [row[1] for row in rows[1:]] == ['Beta', 'Alpha']
+
+
+def test_ndjson_on_stdout_is_not_mixed_with_dumped_responses():
+    command = [sys.executable, '-m', 'sherlock_project', '--no-update-check', '--ndjson', '--dump-response', 'user']
+    process = subprocess.run(command, capture_output=True, timeout=60)
+    assert process.returncode == 2
+    assert process.stdout == b''
+    assert b'--dump-response' in process.stderr
+
+
+def test_ndjson_on_stdout_carries_only_records():
+    command = [sys.executable, '-m', 'sherlock_project', '--no-update-check', '--local', '--ndjson',
+               '--site', 'NoSuchSite', 'user']
+    process = subprocess.run(command, capture_output=True, timeout=60)
+    assert process.returncode == 1
+    assert process.stdout == b''
+    assert b'Desired sites not found' in process.stderr
+
+
+def test_failed_probe_has_no_http_status_in_records():
+    result = QueryResult('user', 'Alpha', 'https://alpha.example/user', QueryStatus.UNKNOWN,
+                         context='Connection Error', http_status='?')
+    record = json.loads(json.dumps(result.to_dict()))
+    assert record['http_status'] is None
+    # The text outputs still show "?".
+    assert QueryResult.from_dict(record).http_status == '?'
+    illegal = QueryResult('user', 'Alpha', None, QueryStatus.ILLEGAL)
+    assert QueryResult.from_dict(illegal.to_dict()).http_status is None
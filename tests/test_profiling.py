@@ -0,0 +1,81 @@
+import json
+import pstats
+import time
+
+from sherlock_project.notify import QueryNotify
+from sherlock_project import profiling
+from sherlock_project.profiling import ScanProfiler, phase_of
+from sherlock_project.sherlock import sherlock
+
+
+def test_scan_is_profiled(slow_stub_server, engine, tmp_path):
+    with ScanProfiler(str(tmp_path), sample_interval=0.001) as profiler:
+        sherlock('claimed', slow_stub_server.slow_manifest(3), QueryNotify(), engine=engine)
+
+    names = {name for _, _, name in pstats.Stats(str(tmp_path / 'profile.pstats')).stats}
+    assert 'detect_status' in names
+    assert 'Ordered by: cumulative time' in (tmp_path / 'profile.txt').read_text()
+    assert (tmp_path / 'wallclock.txt').read_text().startswith(f'{profiler.samples} samples')
+    assert (tmp_path / 'memory.txt').read_text().startswith('Traced memory:')
+
+    folded = (tmp_path / 'wallclock.folded').read_text().splitlines()
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in folded) > 0
+    assert all(';' in line for line in folded)
+
+    phases = json.loads((tmp_path / 'phases.json').read_text())
+    assert phases['seconds'] >= 0.2
+    # The server waits before it answers, which the scan thread waits for.
+    assert phases['profiled']['wait'] >= 0.15
+    assert phases['profiled']['build'] > 0
+    assert phases['sampled']['MainThread']['wait'] > 0.5
+    assert sum(phases['profiled'].values()) <= phases['seconds']
+    assert 'Scan thread:' in str(profiler)
+
+
+def test_parts_can_be_left_out(stub_server, tmp_path):
+    with ScanProfiler(str(tmp_path), sample_interval=None, memory=False) as profiler:
+        sherlock('claimed', stub_server.manifest(), QueryNotify())
+    assert sorted(file.name for file in tmp_path.iterdir()) == ['phases.json', 'profile.pstats', 'profile.txt']
+    assert profiler.phases['sampled'] is None
+
+
+def select():
+    time.sleep(0.1)
+
+
+def get_response():
+    select()
+
+
+def completed_by():
+    get_response()
+    get_response()
+
+
+def test_nested_phase_functions_are_counted_once(tmp_path, monkeypatch):
+    monkeypatch.setitem(profiling.PROFILED_PHASES, 'wait', (
+        ('test_profiling.py', 'completed_by'), ('test_profiling.py', 'get_response'), ('test_profiling.py', 'select'),
+    ))
+    with ScanProfiler(str(tmp_path), sample_interval=None, memory=False) as profiler:
+        completed_by()
+        select()
+    wait = profiler.phases['profiled']['wait']
+    assert 0.3 <= wait <= profiler.seconds
+
+
+def test_phase_functions_are_matched_by_module(tmp_path):
+    # Functions of other modules with the same names are not in a phase.
+    with ScanProfiler(str(tmp_path), sample_interval=None, memory=False) as profiler:
+        completed_by()
+    assert profiler.phases['profiled']['wait'] == 0
+    assert phase_of([('sherlock.py', 'submit_probes'), ('sites.py', 'select')]) == 'build'
+
+
+def test_innermost_phase_function_wins():
+    assert phase_of([('__main__.py', 'main'), ('sherlock.py', 'submit_probes'),
+                     ('sherlock.py', 'prepare_request')]) == 'build'
+    assert phase_of([('thread.py', '_worker'), ('sessions.py', 'request'),
+                     ('sherlock.py', 'read_body'), ('checks.py', 'feed')]) == 'detect'
+    assert phase_of([('thread.py', '_worker'), ('sessions.py', 'request'),
+                     ('connectionpool.py', 'urlopen'), ('connection.py', '_new_conn')]) == 'connect'
+    assert phase_of([('__main__.py', 'main'), ('builtins', 'print')]) == 'other'
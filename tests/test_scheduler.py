@@ -0,0 +1,62 @@
+from concurrent.futures import Future
+import pytest
+from sherlock_project.sherlock import sherlock
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import QueryStatus
+from sherlock_project.scheduler import ProbeScheduler, host_of
+
+
+class ManualSession:
+    """Session whose requests only complete when the test says so"""
+    def __init__(self):
+        self.started: list[tuple[str, Future]] = []
+
+    def request(self, method, url, **kwargs):
+        future = Future()
+        self.started.append((url, future))
+        return future
+
+
+def test_host_of():
+    assert host_of('https://Example.com:8443/users/{}') == 'example.com:8443'
+    assert host_of('https://example.com/users/{}') == 'example.com'
+
+
+def test_scheduler_holds_requests_over_host_limit():
+    session = ManualSession()
+    scheduler = ProbeScheduler(session, max_per_host=2)
+    futures = [scheduler.request('GET', f'https://a.example/{i}') for i in range(4)]
+    other = scheduler.request('GET', 'https://b.example/0')
+    assert [url for url, _ in session.started] == ['https://a.example/0', 'https://a.example/1', 'https://b.example/0']
+
+    session.started[0][1].set_result('first')
+    assert futures[0].result() == 'first'
+    assert session.started[-1][0] == 'https://a.example/2'
+
+    # A request cancelled while waiting is skipped, and its slot passed on
+    assert futures[3].cancel()
+    session.started[1][1].set_result('second')
+    session.started[2][1].set_result('other')
+    session.started[3][1].set_exception(ConnectionError('refused'))
+    assert other.result() == 'other'
+    with pytest.raises(ConnectionError):
+        futures[2].result()
+    assert len(session.started) == 4
+    assert scheduler.active == {'a.example': 0, 'b.example': 0}
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_max_per_host_limits_concurrency(slow_stub_server, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    results = sherlock('claimed', slow_stub_server.slow_manifest(6), QueryNotify(), engine=engine, max_per_host=2)
+    assert all(result['status'].status is QueryStatus.CLAIMED for result in results.values())
+    assert slow_stub_server.peak_in_flight == 2
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_max_in_flight_limits_concurrency(slow_stub_server, engine):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+    sherlock('claimed', slow_stub_server.slow_manifest(6), QueryNotify(), engine=engine, max_in_flight=3)
+    assert slow_stub_server.peak_in_flight == 3
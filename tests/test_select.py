@@ -0,0 +1,59 @@
+import pytest
+from sherlock_project import manifest as manifest_module
+from sherlock_project.manifest import build_manifest
+from sherlock_project.sites import SitesInformation
+
+
+def entry(url_main, error_type='status_code', **information):
+    return {'url': url_main + '{}', 'urlMain': url_main, 'username_claimed': 'blue',
+            'errorType': error_type, **information}
+
+
+@pytest.fixture()
+def sites(tmp_path):
+    path = str(tmp_path / 'select.sherlock')
+    manifest_module.write_manifest(path, build_manifest({
+        'Alpha': entry('https://alpha.example/', tags=['social', 'Video']),
+        'beta': entry('https://WWW.beta.example/', 'message', errorMsg='Not found', isNSFW=True),
+        'Gamma': entry('https://gamma.example/', ['message', 'status_code'], errorMsg='Gone', tags='social'),
+        'Delta': entry('https://alpha.example/', 'response_url', errorUrl='https://alpha.example/'),
+        'Hidden': entry('https://hidden.example/'),
+    }, exclusions=['Hidden']))
+    return SitesInformation(path)
+
+
+def test_select_by_name_is_case_insensitive_and_ordered(sites):
+    assert list(sites.select(names=['gamma', 'BETA', 'nosuch', 'Gamma'])) == ['Gamma', 'beta']
+    assert list(sites.select(names='alpha')) == ['Alpha']
+    # Excluded sites are not selectable
+    assert list(sites.select(names='Hidden')) == []
+
+
+def test_select_by_indexes(sites):
+    assert list(sites.select(nsfw=True)) == ['beta']
+    assert list(sites.select(nsfw=False)) == ['Alpha', 'Gamma', 'Delta']
+    assert list(sites.select(error_type='message')) == ['beta', 'Gamma']
+    assert list(sites.select(error_type=['response_url', 'message'], nsfw=False)) == ['Gamma', 'Delta']
+    assert list(sites.select(host='ALPHA.example')) == ['Alpha', 'Delta']
+    assert list(sites.select(host='www.beta.example')) == ['beta']
+    assert list(sites.select(tags='SOCIAL', error_type='status_code')) == ['Alpha', 'Gamma']
+    assert list(sites.select(tags='video', names=['gamma', 'alpha'])) == ['Alpha']
+
+
+def test_selections_are_views(sites):
+    social = sites.select(tags='social')
+    assert sites.sites.built == {}
+    assert list(social.select(error_type='message')) == ['Gamma']
+
+    # Objects are created once, and shared by all views
+    assert social['Alpha'] is sites.sites['Alpha']
+    assert social['Alpha'].information is sites.select(names='alpha')['Alpha'].information
+    with pytest.raises(KeyError):
+        social['Delta']
+
+
+def test_site_name_list_after_nsfw_removal(sites):
+    assert sites.site_name_list() == ['Alpha', 'beta', 'Delta', 'Gamma']
+    sites.remove_nsfw_sites()
+    assert sites.site_name_list() == ['Alpha', 'Delta', 'Gamma']
+    assert sites.sites.built == {}
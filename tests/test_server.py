@@ -0,0 +1,131 @@
+import http.client
+import json
+import threading
+
+import pytest
+import requests
+from sherlock_project.result import QueryStatus
+from sherlock_project.server import ScanServer, ScanService, main
+from sherlock_project.sites import SitesInformation
+
+
+@pytest.fixture()
+def service(stub_server, tmp_path):
+    data_file = tmp_path / 'data.json'
+    data_file.write_text(json.dumps(stub_server.manifest()))
+    sites = SitesInformation(str(data_file), honor_exclusions=False, cache_directory=str(tmp_path))
+    service = ScanService(sites, max_scans=1, max_queued=0, timeout=10)
+    server = ScanServer(('127.0.0.1', 0), service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    service.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield service
+    service.close(grace=1)
+    server.shutdown()
+    server.server_close()
+
+
+def test_scan_streams_ndjson(service):
+    response = requests.post(f'{service.url}/scan', json={'username': 'claimed'}, stream=True, timeout=10)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.iter_lines() if line]
+    statuses = {record['site']: record['status'] for record in records}
+    assert len(records) == len(service.site_data)
+    assert statuses['StubStatus'] == str(QueryStatus.CLAIMED)
+    assert statuses['StubWAF'] == str(QueryStatus.WAF)
+    assert all(record['username'] == 'claimed' for record in records)
+
+
+def test_scan_streams_server_sent_events(service):
+    response = requests.post(
+        f'{service.url}/scan',
+        json={'usernames': ['nobody', 'claimed'], 'sites': ['stubstatus']},
+        headers={'Accept': 'text/event-stream'},
+        timeout=10,
+    )
+    assert response.headers['Content-Type'] == 'text/event-stream'
+    events = [event.split('\n') for event in response.text.strip().split('\n\n')]
+    assert [lines[0] for lines in events] == ['event: result', 'event: result', 'event: done']
+    results = [json.loads(lines[1].removeprefix('data: ')) for lines in events[:2]]
+    assert [(result['username'], result['status']) for result in results] == [
+        ('nobody', str(QueryStatus.AVAILABLE)), ('claimed', str(QueryStatus.CLAIMED)),
+    ]
+    assert json.loads(events[2][1].removeprefix('data: ')) == {'results': 2}
+
+
+@pytest.mark.parametrize('job,message', [
+    ({}, 'username'),
+    ({'username': 'blue', 'sites': ['NoSuchSite']}, "'NoSuchSite'"),
+    ({'username': 'blue', 'timeout': -1}, 'Timeout'),
+])
+def test_invalid_scans_are_refused(service, job, message):
+    response = requests.post(f'{service.url}/scan', json=job, timeout=10)
+    assert response.status_code == 400
+    assert message in response.json()['error']
+
+
+@pytest.mark.parametrize('length', ['many', '-1'])
+def test_invalid_content_length_is_refused(service, length):
+    connection = http.client.HTTPConnection(service.url.removeprefix('http://'), timeout=10)
+    connection.putrequest('POST', '/scan')
+    connection.putheader('Content-Length', length)
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == 400
+    connection.close()
+
+
+def test_invalid_options_are_refused(capsys, tmp_path):
+    with pytest.raises(SystemExit) as exit:
+        main(['--max-queued', '-1'])
+    assert exit.value.code == 2
+    assert 'Must be a non-negative integer' in capsys.readouterr().err
+
+    with pytest.raises(SystemExit) as exit:
+        main(['--json', str(tmp_path / 'missing.json')])
+    assert exit.value.code == 1
+    assert capsys.readouterr().out.startswith('ERROR:')
+
+
+def test_scans_over_the_limits_are_refused(service):
+    with service.slot():
+        assert requests.get(f'{service.url}/health', timeout=10).json()['running'] == 1
+        response = requests.post(f'{service.url}/scan', json={'username': 'blue'}, timeout=10)
+        assert response.status_code == 503
+        assert response.headers['Retry-After']
+
+
+def test_queued_scans_wait_for_a_slot(service):
+    service.max_queued = 1
+    slot = service.slot()
+    slot.__enter__()
+    responses = []
+    thread = threading.Thread(target=lambda: responses.append(
+        requests.post(f'{service.url}/scan', json={'username': 'claimed', 'sites': ['StubStatus']}, timeout=10)
+    ))
+    thread.start()
+    while service.status()['queued'] == 0:
+        thread.join(0.01)
+    slot.__exit__(None, None, None)
+    thread.join(10)
+    assert responses[0].status_code == 200
+    assert json.loads(responses[0].text)['status'] == str(QueryStatus.CLAIMED)
+
+
+def test_shutdown_refuses_new_scans(service):
+    service.close(grace=1)
+    assert requests.get(f'{service.url}/health', timeout=10).json()['status'] == 'closing'
+    response = requests.post(f'{service.url}/scan', json={'username': 'blue'}, timeout=10)
+    assert response.status_code == 503
+
+
+def test_metrics_of_scans_are_served(service):
+    requests.post(f'{service.url}/scan', json={'username': 'claimed'}, timeout=10).raise_for_status()
+    response = requests.get(f'{service.url}/metrics', timeout=10)
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert 'sherlock_probes_total{site="StubWAF",status="WAF"} 1\n' in response.text
+    response = requests.get(f'{service.url}/metrics', headers={'Accept': 'application/openmetrics-text'},
+                            timeout=10)
+    assert response.headers['Content-Type'].startswith('application/openmetrics-text')
+    assert response.text.endswith('# EOF\n')
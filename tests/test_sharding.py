@@ -0,0 +1,56 @@
+import pytest
+from sherlock_project.notify import QueryNotify
+from sherlock_project.result import QueryStatus
+from sherlock_project.sharding import plan_shards, sherlock_sharded
+from test_engines import EXPECTED_AVAILABLE, EXPECTED_CLAIMED, RecordingNotify, statuses
+
+
+def site(url):
+    return {'url': url + '{}', 'urlMain': url, 'errorType': 'status_code', 'username_claimed': 'claimed'}
+
+
+def test_plan_keeps_hosts_together():
+    site_data = {
+        'A1': site('https://a.example/'), 'A2': site('https://a.example/x/'), 'A3': site('https://A.example/y/'),
+        'B1': site('https://b.example/'), 'C1': site('https://c.example/'), 'D1': site('https://d.example/'),
+    }
+    plan = plan_shards(['blue', 'red'], site_data, 3)
+    assert [sites for _, sites in plan] == [['A1', 'A2', 'A3'], ['B1', 'D1'], ['C1']]
+    assert all(indexes == [0, 1] for indexes, _ in plan)
+
+    plan = plan_shards(['blue', 'red', 'green'], site_data, 2, shard_by='username')
+    assert [indexes for indexes, _ in plan] == [[0, 2], [1]]
+    assert plan_shards(['blue'], site_data, 4, shard_by='username') == [([0], list(site_data))]
+
+
+@pytest.mark.parametrize('shard_by', ['site', 'username'])
+def test_sharded_scan_merges_results(stub_server, shard_by):
+    site_data = stub_server.manifest()
+    # A host of their own for some of the sites, so that there is more than one shard by site
+    for name in ('StubRedirect', 'StubPost', 'StubWAF'):
+        site_data[name] = {key: value.replace('127.0.0.1', 'localhost') if isinstance(value, str) else value
+                           for key, value in site_data[name].items()}
+    notify = RecordingNotify()
+    usernames = ['claimed', 'nobody-1', 'claimedx']
+
+    batch = list(sherlock_sharded(usernames, site_data, notify, processes=2, shard_by=shard_by))
+
+    assert [username for username, _ in batch] == usernames
+    assert statuses(batch[0][1]) == EXPECTED_CLAIMED
+    assert statuses(batch[1][1]) == EXPECTED_AVAILABLE
+    assert list(batch[2][1]) == list(site_data)
+    assert batch[2][1]['StubStatus']['status'].status is QueryStatus.CLAIMED
+
+    # Each username is started once, and only gets its own results
+    current = None
+    for event, username in notify.events:
+        if event == 'start':
+            current = username
+        assert username == current
+    assert [username for event, username in notify.events if event == 'start'] == usernames
+    assert len(notify.events) == len(usernames) * (len(site_data) + 1)
+
+
+def test_sharded_scan_reports_failed_workers(stub_server):
+    with pytest.raises(RuntimeError, match='Shard 0 failed'):
+        list(sherlock_sharded(['blue'], stub_server.manifest(), QueryNotify(), processes=1, engine='nosuch'))
@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+# Modules only needed by optional features, which must not be imported otherwise
+LAZY_MODULES: list[str] = ['pandas', 'numpy', 'openpyxl', 'asyncio', 'aiohttp', 'sqlite3', 'webbrowser', 'tomli']
+
+
+def cli_imports(args: list[str], env: dict[str, str] | None = None) -> set[str]:
+    """Run the CLI under -X importtime, returning the names of the modules it imports"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'sherlock_project', *args],
+        capture_output=True, text=True, env=env, timeout=60,
+    )
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    return {
+        line.split('|')[2].strip()
+        for line in proc.stderr.splitlines()
+        if line.startswith('import time:') and 'cumulative' not in line
+    }
+
+
+def check_startup(imports: set[str]) -> None:
+    loaded = [module for module in LAZY_MODULES if module in imports]
+    assert loaded == [], f'Imported on startup: {loaded}'
+
+
+def test_version_startup():
+    check_startup(cli_imports(['--version']))
+
+
+def test_single_site_startup(stub_server, tmp_path):
+    manifest = tmp_path / 'data.json'
+    manifest.write_text(json.dumps(stub_server.manifest()))
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path))
+    imports = cli_imports(
+        ['--json', str(manifest), '--site', 'StubStatus', '--ignore-exclusions', '--no-update-check', 'claimed'],
+        env=env,
+    )
+    check_startup(imports)
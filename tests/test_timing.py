@@ -0,0 +1,85 @@
+import csv
+import json
+
+import pytest
+from sherlock_project.notify import QueryNotify, QueryNotifyCSV, QueryNotifyTimings
+from sherlock_project.result import QueryResult, QueryStatus
+from sherlock_project.sherlock import sherlock, sherlock_batch
+from sherlock_project.timing import PHASES
+
+
+def test_every_phase_of_a_probe_is_timed(slow_stub_server, engine):
+    results = sherlock('claimed', slow_stub_server.slow_manifest(2), QueryNotify(), engine=engine)
+    for results_site in results.values():
+        result = results_site['status']
+        assert result.status is QueryStatus.CLAIMED
+        assert set(result.timings) == set(PHASES)
+        # Plain HTTP, so there is no handshake.
+        assert result.timings['tls'] is None
+        assert all(result.timings[phase] >= 0 for phase in PHASES if phase != 'tls')
+        # The server waits before it answers.
+        assert result.timings['first_byte'] >= 0.15
+        assert result.timings['connect'] + result.timings['first_byte'] <= result.query_time + 0.01
+
+
+def test_reused_connections_take_no_time_to_connect(stub_server, engine):
+    site_data = stub_server.slow_manifest(1)
+    timings = [
+        results['StubSlow0']['status'].timings
+        for _, results in sherlock_batch(['claimed', 'other'], site_data, QueryNotify(), engine=engine,
+                                         max_in_flight=1, window=1)
+    ]
+    assert timings[0]['connect'] > 0
+    assert timings[1]['connect'] == 0
+
+
+def test_given_up_probes_keep_their_timings(slow_stub_server, engine):
+    results = sherlock('claimed', slow_stub_server.slow_manifest(2), QueryNotify(), engine=engine,
+                       deadline=0.05)
+    for results_site in results.values():
+        result = results_site['status']
+        assert result.context == 'Deadline Exceeded'
+        assert result.timings['queued'] is not None
+        assert result.timings['body'] is None
+
+
+def test_timings_survive_serialization():
+    timings = dict.fromkeys(PHASES, 0.01)
+    result = QueryResult('user', 'Site', 'https://site.example/user', QueryStatus.CLAIMED, timings=timings)
+    assert QueryResult.from_dict(json.loads(json.dumps(result.to_dict()))).timings == timings
+
+
+def test_scan_timings_are_summed_up(tmp_path):
+    notify = QueryNotifyTimings(output=str(tmp_path / 'timings.json'))
+    notify.start('user')
+    for index in range(1, 5):
+        notify.update(QueryResult('user', f'Site{index}', '', QueryStatus.AVAILABLE,
+                                  timings=dict(dict.fromkeys(PHASES, index / 10), tls=None)))
+    # Cached results are not timed.
+    notify.update(QueryResult('user', 'Cached', '', QueryStatus.CLAIMED, cached=True))
+    notify.finish()
+
+    summary = json.loads((tmp_path / 'timings.json').read_text())
+    assert summary['queries'] == 4
+    assert summary['seconds'] >= 0
+    assert summary['phases']['tls'] == {'count': 0}
+    connect = summary['phases']['connect']
+    assert connect['count'] == 4
+    assert connect['total'] == pytest.approx(1.0)
+    assert connect['p50'] == pytest.approx(0.2)
+    assert connect['max'] == pytest.approx(0.4)
+    assert 'first_byte' in str(notify)
+
+
+def test_csv_timing_columns(tmp_path):
+    notify = QueryNotifyCSV({'Alpha': {'urlMain': 'https://alpha.example/'}}, folderoutput=str(tmp_path),
+                            timings=True)
+    notify.start('user')
+    notify.update(QueryResult('user', 'Alpha', 'https://alpha.example/user', QueryStatus.CLAIMED,
+                              query_time=0.5, http_status=200, timings=dict(dict.fromkeys(PHASES, 0.1), tls=None)))
+    notify.finish()
+    with open(tmp_path / 'user.csv', newline='') as f:
+        header, row = list(csv.reader(f))
+    assert header[-len(PHASES):] == [f'{phase}_s' for phase in PHASES]
+    assert dict(zip(header, row))['connect_s'] == '0.1'
+    assert dict(zip(header, row))['tls_s'] == ''
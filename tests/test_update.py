@@ -0,0 +1,36 @@
+import json
+import sherlock_project
+from sherlock_project import update as update_module
+from sherlock_project.update import UpdateCheck
+
+
+def serve_release(stub_server, monkeypatch, tag: str) -> None:
+    release = {'tag_name': tag, 'html_url': f'https://example.com/releases/{tag}'}
+    url = stub_server.serve_file('latest', json.dumps(release), f'"{tag}"')
+    monkeypatch.setattr(update_module, 'forge_api_latest_release', url)
+
+
+def test_update_check_reports_newer_release(stub_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(sherlock_project, '__version__', '0.1.0', raising=False)
+    serve_release(stub_server, monkeypatch, 'v9.9.9')
+
+    check = UpdateCheck(cache_directory=str(tmp_path))
+    # Nothing to say before the check has run, and asking does not wait
+    assert check.message() is None
+    check.start().done.wait(10)
+    assert check.message() == 'Update available! 0.1.0 --> 9.9.9\nhttps://example.com/releases/v9.9.9'
+
+
+def test_update_check_is_cached(stub_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(sherlock_project, '__version__', '9.9.9', raising=False)
+    serve_release(stub_server, monkeypatch, 'v9.9.9')
+
+    first = UpdateCheck(cache_directory=str(tmp_path)).start()
+    first.done.wait(10)
+    assert first.message() is None
+    probes = len(stub_server.requests)
+
+    second = UpdateCheck(cache_directory=str(tmp_path)).start()
+    second.done.wait(10)
+    assert second.message() is None
+    assert len(stub_server.requests) == probes